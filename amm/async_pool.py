@@ -0,0 +1,211 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import logic
+from algosdk.future.transaction import *
+
+from cache import ProgramCache
+from client import AmmClient, SignedGroup
+from common.aio import AsyncAlgod, AsyncConfirmations, AsyncParams
+from sandbox import get_accounts
+
+# Coroutine versions of the pool operations in demo.py. Each call awaits its own
+# confirmation, so running many of them concurrently keeps that many groups in flight
+# from a single process.
+
+token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+url = "http://localhost:4001"
+
+
+async def create_asset(client: AsyncAlgod, confirmations, params, addr, sk, unitname):
+    sp = await params.get()
+    stxn = AssetCreateTxn(
+        addr, sp, 1000000, 0, False, asset_name="asset", unit_name=unitname
+    ).sign(sk)
+    await client.send_transaction(stxn)
+    result = await confirmations.wait_group([stxn], 4)
+    return result[0]["asset-index"]
+
+
+class AsyncPool:
+    """An AMM pool operated through an `AsyncAlgod`"""
+
+    def __init__(
+        self,
+        client: AsyncAlgod,
+        confirmations: AsyncConfirmations,
+        params: AsyncParams,
+        addr: str,
+        sk: str,
+        app_id: int,
+        contract,
+        asset_a: int,
+        asset_b: int,
+        pool_token: int = None,
+    ):
+        self.client = client
+        self.confirmations = confirmations
+        self.params = params
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        # Only used to build and sign groups, sending goes through `client` here
+        self.amm = AmmClient(
+            client,
+            app_id,
+            addr,
+            sk,
+            asset_a,
+            asset_b,
+            pool_token,
+            contract,
+            confirmations,
+            params,
+        )
+
+    @property
+    def pool_token(self) -> int:
+        return self.amm.pool_token
+
+    @classmethod
+    async def deploy(
+        cls, client, confirmations, params, addr, sk, asset_a, asset_b, cache=None
+    ) -> "AsyncPool":
+        """creates, funds and bootstraps a pool for the pair, the creator opts in to
+        the pool token"""
+        approval, clear, contract = (cache or ProgramCache()).build(asset_a, asset_b)
+        approval_bytes = base64.b64decode((await client.compile(approval))["result"])
+        clear_bytes = base64.b64decode((await client.compile(clear))["result"])
+
+        sp = await params.get()
+        stxn = ApplicationCreateTxn(
+            addr,
+            sp,
+            OnComplete.NoOpOC,
+            approval_bytes,
+            clear_bytes,
+            StateSchema(32, 32),
+            StateSchema(0, 0),
+        ).sign(sk)
+        await client.send_transaction(stxn)
+        result = await confirmations.wait_group([stxn], 4)
+
+        app_id = result[0]["application-index"]
+        pool = cls(
+            client, confirmations, params, addr, sk, app_id, contract, asset_a, asset_b
+        )
+
+        # Fund App address
+        stxn = PaymentTxn(addr, sp, pool.app_addr, int(1e7)).sign(sk)
+        await client.send_transaction(stxn)
+        await confirmations.wait_group([stxn], 4)
+
+        await pool.bootstrap()
+        await pool.opt_in()
+        return pool
+
+    async def send(self, group: SignedGroup, wait_rounds: int = 4) -> dict:
+        """the async equivalent of `AmmClient.send`"""
+        await self.client.send_raw_transaction(base64.b64encode(group.raw))
+        infos = await asyncio.gather(
+            *[
+                self.confirmations.watch(txid, group.first_round, wait_rounds)
+                for txid in group.txids
+            ]
+        )
+        return infos[-1]
+
+    # Notes only need to be set to keep otherwise identical groups in the same round
+    # from sharing txids
+
+    async def bootstrap(self) -> int:
+        info = await self.send(self.amm.bootstrap_group(await self.params.get()))
+        self.amm.pool_token = self.amm.return_value("bootstrap", info)
+        return self.pool_token
+
+    async def opt_in(self) -> dict:
+        return await self.send(self.amm.opt_in_group(await self.params.get()))
+
+    async def fund(self, a_amt: int, b_amt: int, note: bytes = None) -> dict:
+        sp = await self.params.get()
+        return await self.send(self.amm.fund_group(sp, a_amt, b_amt, note))
+
+    async def mint(self, a_amt: int, b_amt: int, note: bytes = None) -> dict:
+        sp = await self.params.get()
+        return await self.send(self.amm.mint_group(sp, a_amt, b_amt, note))
+
+    async def swap(
+        self, amt: int, asset_id: int, note: bytes = None, min_out: int = 0
+    ) -> dict:
+        sp = await self.params.get()
+        return await self.send(self.amm.swap_group(sp, amt, asset_id, note, min_out))
+
+    async def burn(self, amt: int, note: bytes = None) -> dict:
+        sp = await self.params.get()
+        return await self.send(self.amm.burn_group(sp, amt, note))
+
+
+async def load(swaps: int, concurrency: int):
+    addr, sk = get_accounts()[0]
+
+    async with AsyncAlgod(token, url, connections=concurrency * 2) as client:
+        confirmations = AsyncConfirmations(client)
+        params = AsyncParams(client)
+
+        # The contract wants the pair in id order, which concurrent creates don't promise
+        asset_a, asset_b = sorted(
+            await asyncio.gather(
+                create_asset(client, confirmations, params, addr, sk, "A"),
+                create_asset(client, confirmations, params, addr, sk, "B"),
+            )
+        )
+        pool = await AsyncPool.deploy(
+            client, confirmations, params, addr, sk, asset_a, asset_b
+        )
+        await pool.fund(100000, 300000)
+        print("Created App with id: {}".format(pool.app_id))
+
+        counter = itertools.count()
+        latencies = []
+
+        async def worker():
+            while (i := next(counter)) < swaps:
+                start = time.perf_counter()
+                asset_id = asset_a if i % 2 else asset_b
+                await pool.swap(5, asset_id, note=i.to_bytes(8, "big"))
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+        await confirmations.close()
+        await params.close()
+
+    latencies.sort()
+    print(
+        "{} swaps in {:.2f}s with {} in flight, {:.0f} per minute, latency p50 {:.0f}ms p99 {:.0f}ms".format(
+            swaps,
+            elapsed,
+            concurrency,
+            swaps / elapsed * 60,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--swaps", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    asyncio.run(load(args.swaps, args.concurrency))
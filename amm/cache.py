@@ -0,0 +1,235 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import types
+import weakref
+from importlib import metadata
+from typing import List, Tuple
+
+from algosdk import abi as sdk_abi
+from algosdk.future.transaction import SuggestedParams
+
+import contract as contract_module
+from contract import build_program, optimize_options, teal_version
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+default_cache_dir = os.path.join(path, ".cache")
+
+
+def _pyteal_version() -> str:
+    try:
+        return metadata.version("pyteal")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def _build_sources() -> List[str]:
+    """contract.py and every module of this repository it imports, directly or not,
+    as each shapes what `build_program` produces (common/cost.py sizes its op ups)"""
+    root = os.path.dirname(path) + os.sep
+    seen, stack = set(), [contract_module]
+    while stack:
+        module = stack.pop()
+        source = getattr(module, "__file__", None)
+        if source is None:
+            continue
+        source = os.path.abspath(source)
+        if not source.startswith(root) or "site-packages" in source or source in seen:
+            continue
+        seen.add(source)
+        for value in vars(module).values():
+            if isinstance(value, types.ModuleType):
+                stack.append(value)
+            elif getattr(value, "__module__", None) in sys.modules:
+                stack.append(sys.modules[value.__module__])
+    return sorted(seen)
+
+
+def _source_hash() -> str:
+    h = hashlib.sha256()
+    for source in _build_sources():
+        with open(source, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+class ProgramCache:
+    """On disk, content addressed cache of the artifacts produced by `build_program`
+
+    Entries are keyed by the asset pair, the hash of contract.py and the modules of
+    this repository it imports, the PyTeal version, the TEAL version, the optimize
+    options and the build flags so any change to the contract or the toolchain
+    produces a fresh entry rather than a stale hit.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = default_cache_dir,
+        max_entries: int = 256,
+        reserves: bool = False,
+        wide: bool = False,
+    ):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.reserves = reserves
+        self.wide = wide
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._networks = weakref.WeakKeyDictionary()  # client -> genesis hash
+
+        # Everything but the pair is fixed for the life of the process
+        self._salt = json.dumps(
+            {
+                "source": _source_hash(),
+                "pyteal": _pyteal_version(),
+                "teal": teal_version,
+                "reserves": reserves,
+                "wide": wide,
+                "optimize": sorted(
+                    (k, repr(v))
+                    for k, v in vars(optimize_options).items()
+                    if not k.startswith("_")
+                ),
+            },
+            sort_keys=True,
+        )
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def key(self, asset_a: int, asset_b: int) -> str:
+        h = hashlib.sha256(self._salt.encode())
+        h.update("{}:{}".format(asset_a, asset_b).encode())
+        return h.hexdigest()
+
+    def build(self, asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contract]:
+        """returns the approval and clear TEAL and the ABI contract for the pair, only running PyTeal on a miss"""
+        entry = self._load(asset_a, asset_b)
+        if entry is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            entry = self._build(asset_a, asset_b)
+            self._store(asset_a, asset_b, entry)
+
+        return (
+            entry["approval"],
+            entry["clear"],
+            sdk_abi.Contract.undictify(entry["contract"]),
+        )
+
+    def compile(
+        self, client, asset_a: int, asset_b: int, sp: SuggestedParams = None
+    ) -> Tuple[bytes, bytes, sdk_abi.Contract]:
+        """returns the approval and clear bytecode and the ABI contract for the pair, only calling PyTeal and algod's compile on a miss
+
+        Bytecode is kept per network, by genesis hash, as what comes back from
+        `/compile` depends on the node: the stand-in in common/node.py hands out
+        handles that no real algod would run. The genesis hash comes from `sp`, or
+        else is asked of `client` once."""
+        network = sp.gh if sp is not None else self._network(client)
+        entry = self._load(asset_a, asset_b)
+        if entry is not None and network in entry.get("compiled", {}):
+            self.hits += 1
+        else:
+            self.misses += 1
+            if entry is None:
+                entry = self._build(asset_a, asset_b)
+
+            entry.setdefault("compiled", {})[network] = {
+                "approval": client.compile(entry["approval"])["result"],
+                "clear": client.compile(entry["clear"])["result"],
+            }
+            self._store(asset_a, asset_b, entry)
+
+        compiled = entry["compiled"][network]
+        return (
+            base64.b64decode(compiled["approval"]),
+            base64.b64decode(compiled["clear"]),
+            sdk_abi.Contract.undictify(entry["contract"]),
+        )
+
+    def evict(self, max_entries: int = None) -> int:
+        """drops the least recently used entries until at most `max_entries` remain"""
+        if max_entries is None:
+            max_entries = self.max_entries
+
+        entries = sorted(self._entries(), key=os.path.getmtime)
+        dropped = 0
+        for entry_path in entries[: max(0, len(entries) - max_entries)]:
+            try:
+                os.remove(entry_path)
+                dropped += 1
+            except FileNotFoundError:
+                pass
+
+        self.evictions += dropped
+        return dropped
+
+    def clear(self):
+        self.evict(0)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries()),
+        }
+
+    def _entries(self):
+        return [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(".json")
+        ]
+
+    def _path(self, asset_a: int, asset_b: int) -> str:
+        return os.path.join(self.cache_dir, self.key(asset_a, asset_b) + ".json")
+
+    def _network(self, client) -> str:
+        if client not in self._networks:
+            self._networks[client] = client.suggested_params().gh
+        return self._networks[client]
+
+    def _build(self, asset_a: int, asset_b: int) -> dict:
+        approval, clear, contract = build_program(
+            asset_a, asset_b, self.reserves, self.wide
+        )
+        return {"approval": approval, "clear": clear, "contract": contract.dictify()}
+
+    def _load(self, asset_a: int, asset_b: int):
+        entry_path = self._path(asset_a, asset_b)
+        try:
+            with open(entry_path) as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        # Bump the mtime so eviction treats this as recently used
+        os.utime(entry_path)
+        return entry
+
+    def _store(self, asset_a: int, asset_b: int, entry: dict):
+        entry_path = self._path(asset_a, asset_b)
+
+        # Write to a temp file and swap it in so readers never see a partial entry
+        tmp_path = "{}.{}.tmp".format(entry_path, os.getpid())
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, entry_path)
+
+        if len(self._entries()) > self.max_entries:
+            self.evict()
+
+
+if __name__ == "__main__":
+    cache = ProgramCache()
+    if len(sys.argv) > 1 and sys.argv[1] == "clear":
+        cache.clear()
+    print(json.dumps(cache.stats(), indent=2))
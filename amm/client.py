@@ -0,0 +1,331 @@
+import base64
+import os
+import struct
+from typing import Dict, List
+
+from algosdk import abi, encoding, logic
+from algosdk.atomic_transaction_composer import ABI_RETURN_HASH
+from algosdk.future.transaction import SuggestedParams
+
+from common.confirm import Confirmations
+from common.params import Params
+from common.signing import SignedGroup, pack, sig_overhead, sign_group, signing_key
+from factory import pair_seed
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# Calls the pool methods without going through an AtomicTransactionComposer. Each
+# transaction starts from a skeleton holding everything that's fixed for the pool (the
+# sender, the app, the selector and the foreign asset arguments), so a call only fills
+# in amounts and validity before it's signed.
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+default_contract_path = os.path.join(path, "contract.json")
+default_factory_path = os.path.join(path, "factory.json")
+
+
+def load_contract(contract_path: str = default_contract_path) -> abi.Contract:
+    with open(contract_path) as f:
+        return abi.Contract.from_json(f.read())
+
+
+class AmmClient:
+    """A pool's ABI methods bound to one app id and account
+
+    The `*_group` methods only build and sign, so they can be used with any transport.
+    The rest send through `client` and wait on `confirmations`.
+    """
+
+    def __init__(
+        self,
+        client,
+        app_id: int,
+        addr: str,
+        sk: str,
+        asset_a: int,
+        asset_b: int,
+        pool_token: int = None,
+        contract: abi.Contract = None,
+        confirmations: Confirmations = None,
+        params: Params = None,
+    ):
+        self.client = client
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        self.addr = addr
+        self.asset_a = asset_a
+        self.asset_b = asset_b
+        self.pool_token = pool_token
+
+        self.contract = contract or load_contract()
+        self.methods: Dict[str, abi.Method] = {m.name: m for m in self.contract.methods}
+        self.selectors = {name: m.get_selector() for name, m in self.methods.items()}
+
+        self.confirmations = confirmations or Confirmations(client)
+        self.params = params or Params(client)
+
+        self._sender = encoding.decode_address(addr)
+        self._keys = {self._sender: signing_key(sk)}
+        self._app_receiver = encoding.decode_address(self.app_addr)
+        self._genesis = (None, None)
+        self._skeletons: Dict[tuple, dict] = {}
+
+    ###
+    # Transactions, unsigned so they can be handed to a `Signer` in batches
+    ###
+
+    def bootstrap_txns(self, sp: SuggestedParams) -> List[dict]:
+        call = self._call("bootstrap", [self.asset_a, self.asset_b])
+        return self._fill(sp, [call])
+
+    def opt_in_txns(self, sp: SuggestedParams) -> List[dict]:
+        optin = self._xfer(0, self.pool_token)
+        optin["arcv"] = self._sender
+        return self._fill(sp, [optin])
+
+    def fund_txns(
+        self, sp: SuggestedParams, a_amt: int, b_amt: int, note: bytes = None
+    ) -> List[dict]:
+        return self._liquidity_txns("fund", sp, a_amt, b_amt, note)
+
+    def mint_txns(
+        self, sp: SuggestedParams, a_amt: int, b_amt: int, note: bytes = None
+    ) -> List[dict]:
+        return self._liquidity_txns("mint", sp, a_amt, b_amt, note)
+
+    def burn_txns(
+        self, sp: SuggestedParams, amt: int, note: bytes = None
+    ) -> List[dict]:
+        call = self._call("burn", [self.pool_token, self.asset_a, self.asset_b])
+        return self._fill(sp, [self._xfer(amt, self.pool_token), call], note)
+
+    def swap_txns(
+        self,
+        sp: SuggestedParams,
+        amt: int,
+        asset_id: int,
+        note: bytes = None,
+        min_out: int = 0,
+    ) -> List[dict]:
+        """the swap fails unless it pays out at least `min_out`"""
+        call = self._call("swap", [self.asset_a, self.asset_b])
+        call["apaa"] = call["apaa"] + [min_out.to_bytes(8, "big")]
+        return self._fill(sp, [self._xfer(amt, asset_id), call], note)
+
+    def reconcile_txns(self, sp: SuggestedParams) -> List[dict]:
+        """only for pools built with `reserves=True`"""
+        call = self._call("reconcile", [self.pool_token, self.asset_a, self.asset_b])
+        return self._fill(sp, [call])
+
+    ###
+    # Groups
+    ###
+
+    def bootstrap_group(self, sp: SuggestedParams) -> SignedGroup:
+        return sign_group(self.bootstrap_txns(sp), self._keys)
+
+    def opt_in_group(self, sp: SuggestedParams) -> SignedGroup:
+        return sign_group(self.opt_in_txns(sp), self._keys)
+
+    def fund_group(
+        self, sp: SuggestedParams, a_amt: int, b_amt: int, note: bytes = None
+    ) -> SignedGroup:
+        return sign_group(self.fund_txns(sp, a_amt, b_amt, note), self._keys)
+
+    def mint_group(
+        self, sp: SuggestedParams, a_amt: int, b_amt: int, note: bytes = None
+    ) -> SignedGroup:
+        return sign_group(self.mint_txns(sp, a_amt, b_amt, note), self._keys)
+
+    def burn_group(
+        self, sp: SuggestedParams, amt: int, note: bytes = None
+    ) -> SignedGroup:
+        return sign_group(self.burn_txns(sp, amt, note), self._keys)
+
+    def swap_group(
+        self,
+        sp: SuggestedParams,
+        amt: int,
+        asset_id: int,
+        note: bytes = None,
+        min_out: int = 0,
+    ) -> SignedGroup:
+        return sign_group(self.swap_txns(sp, amt, asset_id, note, min_out), self._keys)
+
+    def reconcile_group(self, sp: SuggestedParams) -> SignedGroup:
+        return sign_group(self.reconcile_txns(sp), self._keys)
+
+    ###
+    # Calls
+    ###
+
+    def bootstrap(self) -> int:
+        info = self.send(self.bootstrap_group(self.params.get()))
+        self.pool_token = self.return_value("bootstrap", info)
+        return self.pool_token
+
+    def opt_in(self) -> dict:
+        return self.send(self.opt_in_group(self.params.get()))
+
+    def fund(self, a_amt: int, b_amt: int, note: bytes = None) -> dict:
+        return self.send(self.fund_group(self.params.get(), a_amt, b_amt, note))
+
+    def mint(self, a_amt: int, b_amt: int, note: bytes = None) -> dict:
+        return self.send(self.mint_group(self.params.get(), a_amt, b_amt, note))
+
+    def burn(self, amt: int, note: bytes = None) -> dict:
+        return self.send(self.burn_group(self.params.get(), amt, note))
+
+    def swap(
+        self, amt: int, asset_id: int, note: bytes = None, min_out: int = 0
+    ) -> dict:
+        return self.send(
+            self.swap_group(self.params.get(), amt, asset_id, note, min_out)
+        )
+
+    def reconcile(self) -> dict:
+        return self.send(self.reconcile_group(self.params.get()))
+
+    def send(self, group: SignedGroup, wait_rounds: int = 4) -> dict:
+        """submits the group and returns the confirmed info of its last transaction,
+        the app call"""
+        self.client.send_raw_transaction(base64.b64encode(group.raw))
+        futures = [
+            self.confirmations.watch(txid, group.first_round, wait_rounds)
+            for txid in group.txids
+        ]
+        return [f.result() for f in futures][-1]
+
+    def return_value(self, method: str, info: dict):
+        """decodes the value a method returned from the last log of its app call"""
+        logs = info.get("logs", [])
+        result = base64.b64decode(logs[-1]) if logs else b""
+        if result[:4] != ABI_RETURN_HASH:
+            raise ValueError("{} did not log a return value".format(method))
+        return self.methods[method].returns.type.decode(result[4:])
+
+    ###
+    # Skeletons
+    ###
+
+    def _liquidity_txns(self, method, sp, a_amt, b_amt, note) -> List[dict]:
+        call = self._call(method, [self.pool_token, self.asset_a, self.asset_b])
+        txns = [self._xfer(a_amt, self.asset_a), self._xfer(b_amt, self.asset_b), call]
+        return self._fill(sp, txns, note)
+
+    def _xfer(self, amt: int, asset_id: int) -> dict:
+        return {
+            "aamt": amt,
+            "arcv": self._app_receiver,
+            "snd": self._sender,
+            "type": "axfer",
+            "xaid": asset_id,
+        }
+
+    def _call(self, method: str, assets: List[int]) -> dict:
+        key = (method, *assets)
+        if key not in self._skeletons:
+            # Asset arguments are passed as their index in the foreign assets array
+            args = [self.selectors[method]] + [bytes([i]) for i in range(len(assets))]
+            self._skeletons[key] = {
+                "apaa": args,
+                "apas": assets,
+                "apid": self.app_id,
+                "snd": self._sender,
+                "type": "appl",
+            }
+        return dict(self._skeletons[key])
+
+    def _fill(self, sp: SuggestedParams, txns: List[dict], note: bytes = None):
+        if self._genesis[0] != sp.gh:
+            self._genesis = (sp.gh, base64.b64decode(sp.gh))
+
+        for txn in txns:
+            txn.update(fv=sp.first, lv=sp.last, gen=sp.gen, gh=self._genesis[1])
+            txn["note"] = note
+            txn["fee"] = sp.fee if sp.flat_fee else sp.min_fee
+            if not sp.flat_fee and sp.fee:
+                size = len(pack(txn)) + sig_overhead
+                txn["fee"] = max(sp.min_fee, sp.fee * size)
+        return txns
+
+
+class FactoryClient:
+    """The pairs of a factory app (factory.py), each served by an `AmmClient`
+
+    Pairs take the same calls as a pool of their own, so an `AmmClient` built with the
+    factory's contract works for any of them.
+    """
+
+    def __init__(
+        self,
+        client,
+        app_id: int,
+        addr: str,
+        sk: str,
+        contract: abi.Contract = None,
+        confirmations: Confirmations = None,
+        params: Params = None,
+    ):
+        self.client = client
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        self.addr = addr
+        self.sk = sk
+
+        self.contract = contract or load_contract(default_factory_path)
+        self.confirmations = confirmations or Confirmations(client)
+        self.params = params or Params(client)
+
+        self._pairs: Dict[tuple, AmmClient] = {}
+
+    def create_pair_txns(
+        self, sp: SuggestedParams, asset_a: int, asset_b: int
+    ) -> List[dict]:
+        """pays the pair's minimum balance and adds it, `sp` should cover the call's
+        three inner transactions"""
+        amm = self.pair(asset_a, asset_b)
+        seed = {
+            "amt": pair_seed,
+            "rcv": amm._app_receiver,
+            "snd": amm._sender,
+            "type": "pay",
+        }
+        return amm._fill(sp, [seed, amm._call("create_pair", [asset_a, asset_b])])
+
+    def create_pair(self, asset_a: int, asset_b: int) -> AmmClient:
+        amm = self.pair(asset_a, asset_b)
+        txns = self.create_pair_txns(self.params.get(covers=4), asset_a, asset_b)
+        info = amm.send(sign_group(txns, amm._keys))
+        amm.pool_token = amm.return_value("create_pair", info)
+        return amm
+
+    def pair(self, asset_a: int, asset_b: int, pool_token: int = None) -> AmmClient:
+        key = (asset_a, asset_b)
+        if key not in self._pairs:
+            self._pairs[key] = AmmClient(
+                self.client,
+                self.app_id,
+                self.addr,
+                self.sk,
+                asset_a,
+                asset_b,
+                pool_token,
+                contract=self.contract,
+                confirmations=self.confirmations,
+                params=self.params,
+            )
+        return self._pairs[key]
+
+    def pairs(self) -> Dict[tuple, tuple]:
+        """(asset a, asset b) -> (pool token, a reserve, b reserve, issued) for every
+        pair, read from global state in one request"""
+        state = self.client.application_info(self.app_id)["params"]
+        pairs = {}
+        for kv in state.get("global-state", []):
+            key = base64.b64decode(kv["key"])
+            if len(key) == 16:
+                value = base64.b64decode(kv["value"]["bytes"])
+                pairs[struct.unpack(">QQ", key)] = struct.unpack(">QQQQ", value)
+        return pairs
@@ -1,24 +1,82 @@
+import functools
 import os
-from typing import Tuple
-from algosdk import abi as sdk_abi
+import sys
+from typing import Callable, Dict, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import abi as sdk_abi, encoding
 from pyteal import *
+from pyteal.types import require_type
+
+from common.cost import analyze
 
 # WARNING: THIS IS NOT PROODUCTION LEVEL CODE
 
+teal_version = 6
+optimize_options = OptimizeOptions(scratch_slots=True)
+
 fee = Int(5)
 total_supply = Int(int(1e10))
 scale = Int(1000)
 
+# Opcode budget of each app call in a group, and of each op up inner call
+app_budget = 700
+
 gov_key = Bytes("gov")
 pool_key = Bytes("p")
 
+# Reserves mode keeps what the pool holds of A and B, and how many pool tokens it has
+# issued, in global state instead of reading its holdings on every call. Anything sent
+# to the app outside of fund/mint/burn/swap isn't counted until `reconcile`
+a_reserve_key = Bytes("ra")
+b_reserve_key = Bytes("rb")
+issued_key = Bytes("i")
+
 me = Global.current_application_address()
 pool_token = App.globalGet(pool_key)
+a_reserve = App.globalGet(a_reserve_key)
+b_reserve = App.globalGet(b_reserve_key)
+pool_issued = App.globalGet(issued_key)
 is_governor = Seq(
     gov := App.globalGetEx(Int(0), gov_key),
     Txn.sender() == If(gov.hasValue(), gov.value(), Global.creator_address()),
 )
 
+# ARC-28 events, logged by each method that moves funds so an indexer can follow
+# trades from the logs alone. A log is the event's 4 byte selector followed by its
+# ABI encoded args, the sender then five uint64s, 76 bytes for every event. Reserves
+# are as they stand after the call. `fund` logs a Mint.
+events = {
+    "Swap": ["in_asset", "in_amount", "out_amount", "a_reserve", "b_reserve"],
+    "Mint": ["a_amount", "b_amount", "minted", "a_reserve", "b_reserve"],
+    "Burn": ["burned", "a_amount", "b_amount", "a_reserve", "b_reserve"],
+}
+
+
+def event_descriptors() -> list:
+    """the events as ARC-28 describes them in a contract's json"""
+    return [
+        {
+            "name": name,
+            "args": [{"type": "address", "name": "sender"}]
+            + [{"type": "uint64", "name": arg} for arg in args],
+        }
+        for name, args in events.items()
+    ]
+
+
+def event_selector(name: str) -> bytes:
+    signature = "{}(address{})".format(name, ",uint64" * len(events[name]))
+    return encoding.checksum(signature.encode())[:4]
+
+
+def emit(name: str, *args: Expr) -> Expr:
+    return Log(
+        Concat(Bytes(event_selector(name)), Txn.sender(), *[Itob(a) for a in args])
+    )
+
+
 # Methods that compute number of tokens to return  in different cases
 @Subroutine(TealType.uint64)
 def mint_tokens(issued, asup, bsup, aamt, bamt):
@@ -36,56 +94,237 @@ def swap_tokens(inamt, insup, outsup):
     return (inamt * factor * outsup) / ((insup * scale) + (inamt * factor))
 
 
-# Methods to perform inner transactions
+# Wide math mode multiplies before it divides and keeps the product in 128 bits, so
+# reserves and amounts up to the full uint64 range only fail where the result itself
+# doesn't fit. It rounds once, at the end, where the formulas above truncate the ratio
+# first, so mint and burn pay out more precisely than a build without it. A swap's
+# product of three takes byte math, as `fund` does.
 
 
-@Subroutine(TealType.none)
-def do_axfer(rx, aid, amt):
+class MulDivW(Expr):
+    """a * b / c, the product kept in two words by `mulw` and divided with `divw`"""
+
+    def __init__(self, a: Expr, b: Expr, c: Expr):
+        super().__init__()
+        for arg in (a, b, c):
+            require_type(arg, TealType.uint64)
+        self.a, self.b, self.c = a, b, c
+
+    def __teal__(self, options: "CompileOptions"):
+        start, end = TealBlock.FromOp(options, TealOp(self, Op.mulw), self.a, self.b)
+        c_start, c_end = self.c.__teal__(options)
+        end.setNextBlock(c_start)
+        divw = TealSimpleBlock([TealOp(self, Op.divw)])
+        c_end.setNextBlock(divw)
+        return start, divw
+
+    def __str__(self):
+        return "(MulDivW {} {} {})".format(self.a, self.b, self.c)
+
+    def type_of(self):
+        return TealType.uint64
+
+    def has_return(self):
+        return False
+
+
+@Subroutine(TealType.uint64)
+def mint_tokens_wide(issued, asup, bsup, aamt, bamt):
+    a = ScratchVar(TealType.uint64)
+    b = ScratchVar(TealType.uint64)
     return Seq(
-        InnerTxnBuilder.Begin(),
-        InnerTxnBuilder.SetFields(
+        a.store(MulDivW(aamt, issued, asup)),
+        b.store(MulDivW(bamt, issued, bsup)),
+        If(a.load() < b.load(), a.load(), b.load()),
+    )
+
+
+@Subroutine(TealType.uint64)
+def burn_tokens_wide(issued, sup, amt):
+    # `issued` has already lost the `amt` sent back, which is a share of what was out
+    # before it
+    return MulDivW(sup, amt, issued + amt)
+
+
+@Subroutine(TealType.uint64)
+def swap_tokens_wide(inamt, insup, outsup):
+    # inamt * factor * outsup runs to 138 bits, past what mulw and divmodw hold
+    factored = ScratchVar(TealType.bytes)
+    return Seq(
+        factored.store(BytesMul(Itob(inamt), Itob(scale - fee))),
+        Btoi(
+            BytesDiv(
+                BytesMul(factored.load(), Itob(outsup)),
+                BytesAdd(BytesMul(Itob(insup), Itob(scale)), factored.load()),
+            )
+        ),
+    )
+
+
+def token_math(wide: bool = False):
+    """the mint, burn and swap subroutines for a build"""
+    if wide:
+        return mint_tokens_wide, burn_tokens_wide, swap_tokens_wide
+    return mint_tokens, burn_tokens, swap_tokens
+
+
+def fund_tokens(aamt: Expr, bamt: Expr, wide: bool = False) -> Expr:
+    """pool tokens for the first deposit, the geometric mean of the amounts less
+    `scale`. Wide, the product is taken with byte math and rooted with `bsqrt`"""
+    if wide:
+        return Btoi(BytesSqrt(BytesMul(Itob(aamt), Itob(bamt)))) - scale
+    return Sqrt(aamt * bamt) - scale
+
+
+# Opcode budget. A method whose static cost is over a single call's budget starts with
+# enough op up calls, inner calls to an app that's created and deleted in the same
+# transaction, to cover the rest. The op ups carry no fee of their own, so the app's
+# balance isn't drained, and the caller pools one more fee for each.
+
+op_up_program = Bytes("base16", "068101")  # pragma version 6, int 1
+
+
+def op_up(calls: int) -> Expr:
+    """adds `calls` app calls' budget, as one inner group"""
+    return inner_group(
+        *[
             {
-                TxnField.type_enum: TxnType.AssetTransfer,
-                TxnField.xfer_asset: aid,
-                TxnField.asset_amount: amt,
-                TxnField.asset_receiver: rx,
+                TxnField.type_enum: TxnType.ApplicationCall,
+                TxnField.on_completion: OnComplete.DeleteApplication,
+                TxnField.approval_program: op_up_program,
+                TxnField.clear_state_program: op_up_program,
+                TxnField.fee: Int(0),
             }
-        ),
-        InnerTxnBuilder.Submit(),
+        ]
+        * calls
     )
 
 
+def with_op_ups(router: Router, op_ups: Dict[str, int]) -> Callable:
+    """`router.method`, prefixing the methods named in `op_ups` with that many op ups"""
+
+    def method(fn):
+        calls = op_ups.get(fn.__name__, 0)
+        if calls:
+
+            @functools.wraps(fn)
+            def fn_with_op_up(*args, **kwargs):
+                return Seq(op_up(calls), fn(*args, **kwargs))
+
+            return router.method(fn_with_op_up)
+        return router.method(fn)
+
+    return method
+
+
+def fit_budget(
+    build: Callable[[Dict[str, int]], Tuple[str, str, sdk_abi.Contract]],
+    op_ups: Dict[str, int] = None,
+) -> Tuple[str, str, sdk_abi.Contract]:
+    """runs `build` with the op ups each method needs for its static cost, going again
+    while the op ups themselves push a method over. `op_ups` are the least each method
+    gets, and the only op ups for a method whose cost has no static bound, such as one
+    with a loop. Without them a build with such a method fails"""
+    given = dict(op_ups or {})
+    op_ups = dict(given)
+    while True:
+        approval, clear, contract = build(op_ups)
+        needed = {}
+        for name, method in analyze(approval)["methods"].items():
+            if method["cost"] is not None:
+                needed[name] = -(-method["cost"] // app_budget) - 1
+            elif name not in given:
+                raise ValueError(
+                    "{} has no static cost bound ({}), pass its op ups".format(
+                        name, method.get("unbounded", "every path fails")
+                    )
+                )
+        over = {k: v for k, v in needed.items() if v > op_ups.get(k, 0)}
+        if not over:
+            return approval, clear, contract
+        op_ups.update(over)
+
+
+# Methods to perform inner transactions
+
+
+def inner_group(*txns: dict) -> Expr:
+    """submits the transactions as one inner group, a method's payouts together cost a
+    single itxn_begin/itxn_submit rather than one each"""
+    steps = [InnerTxnBuilder.Begin()]
+    for i, fields in enumerate(txns):
+        if i > 0:
+            steps.append(InnerTxnBuilder.Next())
+        steps.append(InnerTxnBuilder.SetFields(fields))
+    steps.append(InnerTxnBuilder.Submit())
+    return Seq(*steps)
+
+
+def axfer_fields(rx: Expr, aid: Expr, amt: Expr) -> dict:
+    return {
+        TxnField.type_enum: TxnType.AssetTransfer,
+        TxnField.xfer_asset: aid,
+        TxnField.asset_amount: amt,
+        TxnField.asset_receiver: rx,
+    }
+
+
+def pool_token_fields(a_unit_name: Expr, b_unit_name: Expr) -> dict:
+    return {
+        TxnField.type_enum: TxnType.AssetConfig,
+        TxnField.config_asset_name: Concat(
+            Bytes("DPT-"), a_unit_name, Bytes("-"), b_unit_name
+        ),
+        TxnField.config_asset_unit_name: Bytes("dpt"),
+        TxnField.config_asset_total: total_supply,
+        TxnField.config_asset_decimals: Int(3),
+        TxnField.config_asset_manager: me,
+        TxnField.config_asset_reserve: me,
+    }
+
+
 @Subroutine(TealType.none)
-def do_opt_in(aid):
-    return do_axfer(me, aid, Int(0))
+def do_axfer(rx, aid, amt):
+    return Seq(
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(axfer_fields(rx, aid, amt)),
+        InnerTxnBuilder.Submit(),
+    )
 
 
 @Subroutine(TealType.none)
 def do_create_pool_token(a, b):
+    """creates the pool token and opts in to both assets, in one inner group"""
     return Seq(
         una := AssetParam.unitName(a),
         unb := AssetParam.unitName(b),
-        InnerTxnBuilder.Begin(),
-        InnerTxnBuilder.SetFields(
-            {
-                TxnField.type_enum: TxnType.AssetConfig,
-                TxnField.config_asset_name: Concat(
-                    Bytes("DPT-"), una.value(), Bytes("-"), unb.value()
-                ),
-                TxnField.config_asset_unit_name: Bytes("dpt"),
-                TxnField.config_asset_total: total_supply,
-                TxnField.config_asset_decimals: Int(3),
-                TxnField.config_asset_manager: me,
-                TxnField.config_asset_reserve: me,
-            }
+        inner_group(
+            pool_token_fields(una.value(), unb.value()),
+            axfer_fields(me, a, Int(0)),
+            axfer_fields(me, b, Int(0)),
         ),
-        InnerTxnBuilder.Submit(),
-        App.globalPut(pool_key, InnerTxn.created_asset_id()),
+        App.globalPut(pool_key, Gitxn[0].created_asset_id()),
     )
 
 
-def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contract]:
+def build_program(
+    asset_a: int,
+    asset_b: int,
+    reserves: bool = False,
+    wide: bool = False,
+    op_ups: Dict[str, int] = None,
+) -> Tuple[str, str, sdk_abi.Contract]:
     assert asset_a < asset_b
+    return fit_budget(
+        lambda op_ups: _build_program(asset_a, asset_b, reserves, wide, op_ups),
+        op_ups,
+    )
+
+
+def _build_program(
+    asset_a: int, asset_b: int, reserves: bool, wide: bool, op_ups: Dict[str, int]
+) -> Tuple[str, str, sdk_abi.Contract]:
+    mint_tokens, burn_tokens, swap_tokens = token_math(wide)
 
     asset_a = Int(asset_a)
     asset_b = Int(asset_b)
@@ -101,8 +340,9 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             clear_state=OnCompleteAction.call_only(Approve()),
         ),
     )
+    method = with_op_ups(router, op_ups)
 
-    @router.method
+    @method
     def mint(
         a_xfer: abi.AssetTransferTransaction,
         b_xfer: abi.AssetTransferTransaction,
@@ -134,6 +374,33 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             b_xfer.get().sender() == Txn.sender(),
         )
 
+        aamt = a_xfer.get().asset_amount()
+        bamt = b_xfer.get().asset_amount()
+
+        minted = ScratchVar(TealType.uint64)
+
+        if reserves:
+            # The same formula, with the reserves as they stand after the deposit.
+            # Each counter is read once and written once. The asset arguments only
+            # put the assets in the foreign arrays, nothing reads them
+            a_res = ScratchVar(TealType.uint64)
+            b_res = ScratchVar(TealType.uint64)
+            return Seq(
+                Assert(Global.group_size() == Int(3)),
+                Assert(valid_asset_a_xfer),
+                Assert(valid_asset_b_xfer),
+                a_res.store(a_reserve + aamt),
+                b_res.store(b_reserve + bamt),
+                minted.store(
+                    mint_tokens(pool_issued, a_res.load(), b_res.load(), aamt, bamt)
+                ),
+                App.globalPut(a_reserve_key, a_res.load()),
+                App.globalPut(b_reserve_key, b_res.load()),
+                App.globalPut(issued_key, pool_issued + minted.load()),
+                do_axfer(Txn.sender(), pool_token, minted.load()),
+                emit("Mint", aamt, bamt, minted.load(), a_res.load(), b_res.load()),
+            )
+
         return Seq(
             # Check that the transaction is constructed correctly
             Assert(well_formed_mint),
@@ -145,20 +412,21 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             b_bal := b_asset.holding(me).balance(),
             Assert(And(pool_bal.hasValue(), a_bal.hasValue(), b_bal.hasValue())),
             # mint tokens
-            do_axfer(
-                Txn.sender(),
-                pool_token,
+            minted.store(
                 mint_tokens(
                     total_supply - pool_bal.value(),
                     a_bal.value(),
                     b_bal.value(),
                     a_xfer.get().asset_amount(),
                     b_xfer.get().asset_amount(),
-                ),
+                )
             ),
+            do_axfer(Txn.sender(), pool_token, minted.load()),
+            # The deposits had landed before the call, so these are the new reserves
+            emit("Mint", aamt, bamt, minted.load(), a_bal.value(), b_bal.value()),
         )
 
-    @router.method
+    @method
     def burn(
         pool_xfer: abi.AssetTransferTransaction,
         pool_asset: abi.Asset,
@@ -180,6 +448,46 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             pool_xfer.get().xfer_asset() == pool_token,
         )
 
+        amt = pool_xfer.get().asset_amount()
+        a_out = ScratchVar(TealType.uint64)
+        b_out = ScratchVar(TealType.uint64)
+        issued = ScratchVar(TealType.uint64)
+
+        if reserves:
+            # Pool tokens already sent back don't count as issued, as with holdings.
+            # Each counter is read once and written once. The asset arguments only
+            # put the assets in the foreign arrays, nothing reads them
+            burned = ScratchVar(TealType.uint64)
+            a_res = ScratchVar(TealType.uint64)
+            b_res = ScratchVar(TealType.uint64)
+            return Seq(
+                Assert(Global.group_size() == Int(2)),
+                Assert(valid_pool_xfer),
+                burned.store(amt),
+                issued.store(pool_issued - burned.load()),
+                a_res.store(a_reserve),
+                b_res.store(b_reserve),
+                a_out.store(burn_tokens(issued.load(), a_res.load(), burned.load())),
+                b_out.store(burn_tokens(issued.load(), b_res.load(), burned.load())),
+                a_res.store(a_res.load() - a_out.load()),
+                b_res.store(b_res.load() - b_out.load()),
+                App.globalPut(a_reserve_key, a_res.load()),
+                App.globalPut(b_reserve_key, b_res.load()),
+                App.globalPut(issued_key, issued.load()),
+                inner_group(
+                    axfer_fields(Txn.sender(), asset_a, a_out.load()),
+                    axfer_fields(Txn.sender(), asset_b, b_out.load()),
+                ),
+                emit(
+                    "Burn",
+                    burned.load(),
+                    a_out.load(),
+                    b_out.load(),
+                    a_res.load(),
+                    b_res.load(),
+                ),
+            )
+
         return Seq(
             Assert(well_formed_burn),
             Assert(valid_pool_xfer),
@@ -187,41 +495,43 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             a_bal := a_asset.holding(me).balance(),
             b_bal := b_asset.holding(me).balance(),
             Assert(And(pool_bal.hasValue(), a_bal.hasValue(), b_bal.hasValue())),
-            # Send back commensurate amt of a
-            do_axfer(
-                Txn.sender(),
-                asset_a,
-                burn_tokens(
-                    total_supply - pool_bal.value(),
-                    a_bal.value(),
-                    pool_xfer.get().asset_amount(),
-                ),
+            issued.store(total_supply - pool_bal.value()),
+            # Send back commensurate amts of a and b
+            a_out.store(burn_tokens(issued.load(), a_bal.value(), amt)),
+            b_out.store(burn_tokens(issued.load(), b_bal.value(), amt)),
+            inner_group(
+                axfer_fields(Txn.sender(), asset_a, a_out.load()),
+                axfer_fields(Txn.sender(), asset_b, b_out.load()),
             ),
-            # Send back commensurate amt of b
-            do_axfer(
-                Txn.sender(),
-                asset_b,
-                burn_tokens(
-                    total_supply - pool_bal.value(),
-                    b_bal.value(),
-                    pool_xfer.get().asset_amount(),
-                ),
+            emit(
+                "Burn",
+                amt,
+                a_out.load(),
+                b_out.load(),
+                a_bal.value() - a_out.load(),
+                b_bal.value() - b_out.load(),
             ),
         )
 
-    @router.method
+    @method
     def swap(
-        swap_xfer: abi.AssetTransferTransaction, a_asset: abi.Asset, b_asset: abi.Asset
+        swap_xfer: abi.AssetTransferTransaction,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+        min_out: abi.Uint64,
     ):
-        """Swap some amount of either asset A or asset B for the other"""
+        """Swap some amount of either asset A or asset B for the other, failing if it pays out less than `min_out`"""
+        # Swaps through several pools are chained in one group, each paying into the
+        # next, so the group size isn't fixed. Each call only counts its own deposit
         well_formed_swap = And(
-            Global.group_size() == Int(2),
             a_asset.asset_id() == asset_a,
             b_asset.asset_id() == asset_b,
         )
 
         valid_swap_xfer = And(
             swap_xfer.get().type_enum() == TxnType.AssetTransfer,
+            swap_xfer.get().asset_receiver() == me,
+            swap_xfer.get().sender() == Txn.sender(),
             Or(
                 swap_xfer.get().xfer_asset() == asset_a,
                 swap_xfer.get().xfer_asset() == asset_b,
@@ -232,27 +542,59 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
         out_id = If(swap_xfer.get().xfer_asset() == asset_a, asset_b, asset_a)
         in_id = swap_xfer.get().xfer_asset()
 
+        inamt = swap_xfer.get().asset_amount()
+        out = ScratchVar(TealType.uint64)
+
+        if reserves:
+            in_key = ScratchVar(TealType.bytes)
+            out_key = ScratchVar(TealType.bytes)
+            in_res = ScratchVar(TealType.uint64)
+            out_res = ScratchVar(TealType.uint64)
+            return Seq(
+                Assert(well_formed_swap),
+                Assert(valid_swap_xfer),
+                If(in_id == asset_a)
+                .Then(
+                    Seq(in_key.store(a_reserve_key), out_key.store(b_reserve_key))
+                )
+                .Else(
+                    Seq(in_key.store(b_reserve_key), out_key.store(a_reserve_key))
+                ),
+                in_res.store(App.globalGet(in_key.load()) + inamt),
+                out_res.store(App.globalGet(out_key.load())),
+                out.store(swap_tokens(inamt, in_res.load(), out_res.load())),
+                Assert(out.load() >= min_out.get()),
+                App.globalPut(in_key.load(), in_res.load()),
+                App.globalPut(out_key.load(), out_res.load() - out.load()),
+                do_axfer(Txn.sender(), out_id, out.load()),
+                emit("Swap", in_id, inamt, out.load(), a_reserve, b_reserve),
+            )
+
         return Seq(
             Assert(well_formed_swap),
             Assert(valid_swap_xfer),
             in_sup := AssetHolding.balance(me, in_id),
             out_sup := AssetHolding.balance(me, out_id),
             Assert(And(in_sup.hasValue(), out_sup.hasValue())),
-            do_axfer(
-                Txn.sender(),
-                out_id,
-                swap_tokens(
-                    swap_xfer.get().asset_amount(), in_sup.value(), out_sup.value()
-                ),
+            out.store(swap_tokens(inamt, in_sup.value(), out_sup.value())),
+            Assert(out.load() >= min_out.get()),
+            do_axfer(Txn.sender(), out_id, out.load()),
+            emit(
+                "Swap",
+                in_id,
+                inamt,
+                out.load(),
+                If(in_id == asset_a, in_sup.value(), out_sup.value() - out.load()),
+                If(in_id == asset_a, out_sup.value() - out.load(), in_sup.value()),
             ),
         )
 
-    @router.method
+    @method
     def set_governor(new_governor: abi.Account):
         """sets the governor of the contract, may only be called by the current governor"""
         return Seq(Assert(is_governor), App.globalPut(gov_key, new_governor.address()))
 
-    @router.method
+    @method
     def bootstrap(a_asset: abi.Asset, b_asset: abi.Asset, *, output: abi.Uint64):
         """bootstraps the contract by opting into the assets and creating the pool token"""
         well_formed_bootstrap = And(
@@ -265,12 +607,10 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             Assert(is_governor),
             Assert(well_formed_bootstrap),
             do_create_pool_token(asset_a, asset_b),
-            do_opt_in(asset_a),
-            do_opt_in(asset_b),
             output.set(pool_token),
         )
 
-    @router.method
+    @method
     def fund(
         a_xfer: abi.AssetTransferTransaction,
         b_xfer: abi.AssetTransferTransaction,
@@ -300,6 +640,45 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
             b_xfer.get().sender() == Txn.sender(),
         )
 
+        aamt = a_xfer.get().asset_amount()
+        bamt = b_xfer.get().asset_amount()
+        minted = ScratchVar(TealType.uint64)
+
+        if reserves:
+            # The asset arguments only put the assets in the foreign arrays, nothing
+            # reads them
+            a_in = ScratchVar(TealType.uint64)
+            b_in = ScratchVar(TealType.uint64)
+            return Seq(
+                Assert(Global.group_size() == Int(3)),
+                Assert(valid_a_xfer),
+                Assert(valid_b_xfer),
+                Assert(
+                    And(
+                        a_xfer.get().asset_receiver() == me,
+                        b_xfer.get().asset_receiver() == me,
+                        # Make sure this is the first time we've been called, B's
+                        # reserve only ever empties along with A's
+                        Not(a_reserve),
+                    )
+                ),
+                a_in.store(aamt),
+                b_in.store(bamt),
+                minted.store(fund_tokens(a_in.load(), b_in.load(), wide)),
+                App.globalPut(a_reserve_key, a_in.load()),
+                App.globalPut(b_reserve_key, b_in.load()),
+                App.globalPut(issued_key, minted.load()),
+                do_axfer(Txn.sender(), pool_token, minted.load()),
+                emit(
+                    "Mint",
+                    a_in.load(),
+                    b_in.load(),
+                    minted.load(),
+                    a_in.load(),
+                    b_in.load(),
+                ),
+            )
+
         return Seq(
             Assert(well_formed_fund),
             Assert(valid_a_xfer),
@@ -313,16 +692,38 @@ def build_program(asset_a: int, asset_b: int) -> Tuple[str, str, sdk_abi.Contrac
                     b_bal.value() == b_xfer.get().asset_amount(),
                 )
             ),
-            do_axfer(
-                Txn.sender(),
-                pool_token,
-                Sqrt(a_xfer.get().asset_amount() * b_xfer.get().asset_amount()) - scale,
-            ),
+            minted.store(fund_tokens(aamt, bamt, wide)),
+            do_axfer(Txn.sender(), pool_token, minted.load()),
+            emit("Mint", aamt, bamt, minted.load(), aamt, bamt),
         )
 
-    return router.compile_program(
-        version=6, optimize=OptimizeOptions(scratch_slots=True)
-    )
+    if reserves:
+
+        @method
+        def reconcile(pool_asset: abi.Asset, a_asset: abi.Asset, b_asset: abi.Asset):
+            """sets the reserves and issued pool tokens from what the app holds, counting anything sent to it directly, may only be called by the governor"""
+            well_formed_reconcile = And(
+                Global.group_size() == Int(1),
+                pool_asset.asset_id() == pool_token,
+                a_asset.asset_id() == asset_a,
+                b_asset.asset_id() == asset_b,
+            )
+
+            return Seq(
+                Assert(is_governor),
+                Assert(well_formed_reconcile),
+                # Before `fund` this would let a donation block it
+                Assert(pool_issued > Int(0)),
+                pool_bal := pool_asset.holding(me).balance(),
+                a_bal := a_asset.holding(me).balance(),
+                b_bal := b_asset.holding(me).balance(),
+                Assert(And(pool_bal.hasValue(), a_bal.hasValue(), b_bal.hasValue())),
+                App.globalPut(a_reserve_key, a_bal.value()),
+                App.globalPut(b_reserve_key, b_bal.value()),
+                App.globalPut(issued_key, total_supply - pool_bal.value()),
+            )
+
+    return router.compile_program(version=teal_version, optimize=optimize_options)
 
 
 if __name__ == "__main__":
@@ -333,7 +734,9 @@ if __name__ == "__main__":
     with open(os.path.join(path, "contract.json"), "w") as f:
         import json
 
-        f.write(json.dumps(contract.dictify(), indent=2))
+        # ABI contracts don't describe events, ARC-28 adds them alongside the methods
+        contract_json = {**contract.dictify(), "events": event_descriptors()}
+        f.write(json.dumps(contract_json, indent=2))
 
     with open(os.path.join(path, "approval.teal"), "w") as f:
         f.write(approval)
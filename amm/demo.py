@@ -1,11 +1,20 @@
 import base64
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from algosdk import *
 from algosdk.atomic_transaction_composer import *
 from algosdk.algod import AlgodClient
 from algosdk.v2client import algod
 from algosdk.future.transaction import *
-from contract import build_program
+from cache import ProgramCache
+from client import AmmClient
+from factory import build_factory_program
+from common.balances import Balances
+from common.confirm import Confirmations
+from common.params import Params
 from sandbox import get_accounts
 
 
@@ -14,6 +23,14 @@ url = "http://localhost:4001"
 
 client = algod.AlgodClient(token, url)
 
+# Follows rounds once for every step instead of polling per txid
+confirmations = Confirmations(client)
+
+# Suggested params are fetched once and moved along with the rounds
+params = Params(client)
+
+program_cache = ProgramCache()
+
 contract: abi.Contract
 
 
@@ -34,171 +51,84 @@ def demo():
     asset_b = create_asset(addr, sk, "B")
     print("Created asset a with id: {}".format(asset_b))
 
-    approval, clear, contract = build_program(asset_a, asset_b)
+    # Compiled programs are cached per pair, so only the first deploy pays for PyTeal and algod
+    approval, clear, contract = program_cache.compile(
+        client, asset_a, asset_b, params.get()
+    )
+    print("Program cache: {}".format(program_cache.stats()))
 
     # Create app
     app_id, app_addr = create_app(addr, sk, approval, clear)
     print("Created App with id: {} and address: {}".format(app_id, app_addr))
 
-    ###
-    # Bootstrap Pool
-    ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
+    # Method selectors and the fixed parts of each call are worked out once here
+    amm = AmmClient(
+        client,
         app_id,
-        contract.get_method_by_name("bootstrap"),
         addr,
-        sp,
-        signer,
-        [asset_a, asset_b],
+        sk,
+        asset_a,
+        asset_b,
+        contract=contract,
+        confirmations=confirmations,
+        params=params,
     )
-    result = atc.execute(client, 2)
-    pool_token = result.abi_results[0].return_value
+
+    ###
+    # Bootstrap Pool
+    ###
+    pool_token = amm.bootstrap()
     print("Created Pool Token: {}".format(pool_token))
 
+    # Only the holdings printed below are looked up, concurrently, after each step
+    pair = [pool_token, asset_a, asset_b]
+    balances = Balances(
+        client,
+        {app_addr: pair, addr: pair},
+        names={app_addr: "App", addr: "Participant"},
+        assets={pool_token: "Pool", asset_a: "AssetA", asset_b: "AssetB"},
+    )
+
     ###
     # Opt addr into newly created Pool Token
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_transaction(
-        TransactionWithSigner(
-            txn=AssetTransferTxn(addr, sp, addr, 0, pool_token),
-            signer=signer,
-        )
-    )
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.opt_in()
+    print_balances(balances)
 
     ###
     # Fund Pool with initial liquidity
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
-        app_id,
-        contract.get_method_by_name("fund"),
-        addr,
-        sp,
-        signer,
-        [
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 1000, asset_a), signer=signer
-            ),
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 3000, asset_b), signer=signer
-            ),
-            pool_token,
-            asset_a,
-            asset_b,
-        ],
-    )
-
-    # drr = atc.dryrun(client)
-    # print(drr.trace.txns[2].app_trace())
-    # return
-
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.fund(1000, 3000)
+    print_balances(balances)
 
     ###
     # Mint pool tokens
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
-        app_id,
-        contract.get_method_by_name("mint"),
-        addr,
-        sp,
-        signer,
-        [
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 100000, asset_a), signer=signer
-            ),
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 1000, asset_b), signer=signer
-            ),
-            pool_token,
-            asset_a,
-            asset_b,
-        ],
-    )
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.mint(100000, 1000)
+    print_balances(balances)
 
     ###
     # Swap A for B
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
-        app_id,
-        contract.get_method_by_name("swap"),
-        addr,
-        sp,
-        signer,
-        [
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 5, asset_a), signer=signer
-            ),
-            asset_a,
-            asset_b,
-        ],
-    )
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.swap(5, asset_a)
+    print_balances(balances)
 
     ###
     # Swap B for A
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
-        app_id,
-        contract.get_method_by_name("swap"),
-        addr,
-        sp,
-        signer,
-        [
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 5, asset_b), signer=signer
-            ),
-            asset_a,
-            asset_b,
-        ],
-    )
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.swap(5, asset_b)
+    print_balances(balances)
 
     ###
     # Burn pool tokens
     ###
-    sp = client.suggested_params()
-    atc = AtomicTransactionComposer()
-    atc.add_method_call(
-        app_id,
-        contract.get_method_by_name("burn"),
-        addr,
-        sp,
-        signer,
-        [
-            TransactionWithSigner(
-                txn=AssetTransferTxn(addr, sp, app_addr, 100, pool_token), signer=signer
-            ),
-            pool_token,
-            asset_a,
-            asset_b,
-        ],
-    )
-    atc.execute(client, 2)
-    print_balances(app_addr, addr, pool_token, asset_a, asset_b)
+    amm.burn(100)
+    print_balances(balances)
 
 
 def create_asset(addr, pk, unitname):
-    # Get suggested params from network
-    sp = client.suggested_params()
+    # Get suggested params for the current round
+    sp = params.get()
     # Create the transaction
     create_txn = AssetCreateTxn(
         addr, sp, 1000000, 0, False, asset_name="asset", unit_name=unitname
@@ -206,24 +136,15 @@ def create_asset(addr, pk, unitname):
     # Ship it
     txid = client.send_transaction(create_txn.sign(pk))
     # Wait for the result so we can return the app id
-    result = wait_for_confirmation(client, txid, 4)
+    result = confirmations.wait(txid, sp.first, 4)
     return result["asset-index"]
 
 
-def create_app(addr, pk, approval_prog, clear_prog):
-    # Read in approval teal source && compile
-    app_result = client.compile(approval_prog)
-    app_bytes = base64.b64decode(app_result["result"])
-
-    # Read in clear teal source && compile
-    clear_result = client.compile(clear_prog)
-    clear_bytes = base64.b64decode(clear_result["result"])
-
-    gschema = StateSchema(32, 32)
+def create_app(addr, pk, app_bytes, clear_bytes, gschema=StateSchema(32, 32)):
     lschema = StateSchema(0, 0)
 
-    # Get suggested params from network
-    sp = client.suggested_params()
+    # Get suggested params for the current round
+    sp = params.get()
     # Create app call
     atc = AtomicTransactionComposer()
     atc.add_transaction(
@@ -234,39 +155,34 @@ def create_app(addr, pk, approval_prog, clear_prog):
             signer=AccountTransactionSigner(pk),
         )
     )
-    abi_result = atc.execute(client, 2)
+    abi_result = confirmations.execute(atc, 2)
     result = client.pending_transaction_info(abi_result.tx_ids[0])
     app_id = result["application-index"]
     app_addr = logic.get_application_address(app_id)
 
     # Fund App address
-    sp = client.suggested_params()
+    sp = params.get()
     txid = client.send_transaction(PaymentTxn(addr, sp, app_addr, int(1e7)).sign(pk))
-    wait_for_confirmation(client, txid, 4)
+    confirmations.wait(txid, sp.first, 4)
 
     return app_id, app_addr
 
 
-def print_balances(app: str, addr: str, pool: int, a: int, b: int):
-    appbal = client.account_info(app)
-    print("App: ")
-    for asset in appbal["assets"]:
-        if asset["asset-id"] == pool:
-            print("\tPool Balance {}".format(asset["amount"]))
-        if asset["asset-id"] == a:
-            print("\tAssetA Balance {}".format(asset["amount"]))
-        if asset["asset-id"] == b:
-            print("\tAssetB Balance {}".format(asset["amount"]))
-
-    addrbal = client.account_info(addr)
-    print("Participant: ")
-    for asset in addrbal["assets"]:
-        if asset["asset-id"] == pool:
-            print("\tPool Balance {}".format(asset["amount"]))
-        if asset["asset-id"] == a:
-            print("\tAssetA Balance {}".format(asset["amount"]))
-        if asset["asset-id"] == b:
-            print("\tAssetB Balance {}".format(asset["amount"]))
+def create_factory(addr, pk):
+    """deploys a factory app, pairs are then added with `FactoryClient.create_pair`"""
+    approval, clear, _ = build_factory_program()
+    app_bytes = base64.b64decode(client.compile(approval)["result"])
+    clear_bytes = base64.b64decode(client.compile(clear)["result"])
+    # A byte slice per pair, see factory.py
+    return create_app(addr, pk, app_bytes, clear_bytes, StateSchema(0, 64))
+
+
+def print_balances(balances: Balances):
+    snapshot, changes = balances.step()
+    print(balances.format(snapshot))
+    if changes:
+        print("Changes: ")
+        print(balances.format_diff(changes))
 
 
 if __name__ == "__main__":
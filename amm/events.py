@@ -0,0 +1,111 @@
+import base64
+import json
+import os
+import struct
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+from algosdk import encoding
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# Decodes the ARC-28 events the pool methods log. Every event has the same fixed
+# layout, a 4 byte selector, the 32 byte sender and five big endian uint64s, so logs are
+# unpacked in place with `struct.unpack_from`, and a buffer of many back to back
+# decodes into a NumPy record array that views the bytes rather than copying them.
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+default_contract_path = os.path.join(path, "contract.json")
+
+layout = struct.Struct(">4s32s5Q")
+
+# The same layout as a NumPy dtype, for decoding logs that sit back to back in a buffer
+dtype = np.dtype([("selector", "S4"), ("sender", "S32"), ("values", ">u8", (5,))])
+
+
+class Event(NamedTuple):
+    name: str
+    sender: bytes  # raw public key, `encoding.encode_address` for the address
+    values: Dict[str, int]
+
+
+class Events:
+    """The events described in a contract's json, by selector"""
+
+    def __init__(self, contract_path: str = default_contract_path):
+        with open(contract_path) as f:
+            descriptors = json.load(f).get("events", [])
+
+        self.names: Dict[bytes, str] = {}
+        self.args: Dict[bytes, List[str]] = {}
+        for event in descriptors:
+            types = [arg["type"] for arg in event["args"]]
+            if types != ["address"] + ["uint64"] * 5:
+                raise ValueError("Unexpected layout for {}".format(event["name"]))
+            selector = _selector("{}({})".format(event["name"], ",".join(types)))
+            self.names[selector] = event["name"]
+            self.args[selector] = [arg["name"] for arg in event["args"][1:]]
+
+    def decode(self, log: bytes) -> Optional[Event]:
+        """the event in a log, or None for logs that aren't events"""
+        if len(log) != layout.size:
+            return None
+        selector, sender, *values = layout.unpack_from(log)
+        if selector not in self.names:
+            return None
+        args = dict(zip(self.args[selector], values))
+        return Event(self.names[selector], sender, args)
+
+    def from_logs(self, logs: Iterable[bytes]) -> Iterator[Event]:
+        """events among an app call's logs, as a block or pending info holds them"""
+        for log in logs:
+            if isinstance(log, str):
+                log = base64.b64decode(log)
+            event = self.decode(log)
+            if event is not None:
+                yield event
+
+    def decode_array(self, buffer) -> np.ndarray:
+        """a record array viewing `buffer`, which holds events back to back. Filter on
+        `selector` with `self.selector(name)` and read columns from `values`"""
+        return np.frombuffer(memoryview(buffer), dtype=dtype)
+
+    def selector(self, name: str) -> bytes:
+        for selector, event_name in self.names.items():
+            if event_name == name:
+                return selector
+        raise KeyError(name)
+
+
+def _selector(signature: str) -> bytes:
+    return encoding.checksum(signature.encode())[:4]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="benchmark decoding swap events")
+    parser.add_argument("--events", type=int, default=1000000)
+    args = parser.parse_args()
+
+    events = Events()
+    swap = events.selector("Swap")
+    logs = [
+        layout.pack(swap, bytes(32), 1, i, i // 2, 10**9, 10**9)
+        for i in range(args.events)
+    ]
+
+    start = time.perf_counter()
+    total = sum(e.values["in_amount"] for e in events.from_logs(logs))
+    elapsed = time.perf_counter() - start
+    print("one at a time: {:.0f} events per second".format(args.events / elapsed))
+
+    buffer = b"".join(logs)
+    start = time.perf_counter()
+    records = events.decode_array(buffer)
+    swaps = records[records["selector"] == swap]
+    assert int(swaps["values"][:, 1].sum()) == total
+    elapsed = time.perf_counter() - start
+    print("as an array: {:.0f} events per second".format(args.events / elapsed))
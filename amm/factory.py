@@ -0,0 +1,355 @@
+import os
+from typing import Dict, Tuple
+
+from algosdk import abi as sdk_abi
+from pyteal import *
+
+from contract import (
+    axfer_fields,
+    do_axfer,
+    emit,
+    event_descriptors,
+    fit_budget,
+    fund_tokens,
+    gov_key,
+    inner_group,
+    is_governor,
+    me,
+    optimize_options,
+    pool_token_fields,
+    teal_version,
+    token_math,
+    with_op_ups,
+)
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# One application serving many pairs. Each pair is a single global byte slice keyed by
+# its two asset ids, holding its pool token, reserves and issued pool tokens, so a new
+# pair is one `create_pair` call rather than a compile, create, fund and bootstrap.
+#
+# An asset the app holds can belong to several pairs, so only the counters say what's
+# whose, as with `build_program(..., reserves=True)`: anything sent to the app outside
+# a call isn't counted. TEAL 6 has no boxes and global state stops at 64 byte slices,
+# one of them the governor, so a factory holds up to 63 pairs.
+
+max_pairs = 63
+
+# The pool token and up to two new opt ins raise the app's minimum balance this much
+pair_seed = 300_000
+
+# Layout of a pair's value: pool token, A reserve, B reserve, issued, a uint64 each
+token_offset = Int(0)
+a_reserve_offset = Int(8)
+b_reserve_offset = Int(16)
+issued_offset = Int(24)
+
+
+class Pair:
+    """The state of the pair named by a method's asset arguments, read once into
+    scratch space"""
+
+    def __init__(self, a_asset: abi.Asset, b_asset: abi.Asset):
+        self.a = a_asset.asset_id()
+        self.b = b_asset.asset_id()
+        self.key = ScratchVar(TealType.bytes)
+        self.record = ScratchVar(TealType.bytes)
+
+    def load(self) -> Expr:
+        return Seq(
+            self.key.store(Concat(Itob(self.a), Itob(self.b))),
+            record := App.globalGetEx(Int(0), self.key.load()),
+            Assert(record.hasValue()),
+            self.record.store(record.value()),
+        )
+
+    def field(self, offset: Expr) -> Expr:
+        return ExtractUint64(self.record.load(), offset)
+
+    @property
+    def token(self) -> Expr:
+        return self.field(token_offset)
+
+    @property
+    def a_reserve(self) -> Expr:
+        return self.field(a_reserve_offset)
+
+    @property
+    def b_reserve(self) -> Expr:
+        return self.field(b_reserve_offset)
+
+    @property
+    def issued(self) -> Expr:
+        return self.field(issued_offset)
+
+    def store(self, a_reserve: Expr, b_reserve: Expr, issued: Expr) -> Expr:
+        """writes the pair back, reads after this see the new values"""
+        return Seq(
+            self.record.store(
+                Concat(Itob(self.token), Itob(a_reserve), Itob(b_reserve), Itob(issued))
+            ),
+            App.globalPut(self.key.load(), self.record.load()),
+        )
+
+
+@Subroutine(TealType.uint64)
+def do_create_pair_token(a, b):
+    """creates the pair's pool token and opts in to whichever of its assets the app
+    doesn't hold yet, in one inner group, returning the token"""
+    return Seq(
+        una := AssetParam.unitName(a),
+        unb := AssetParam.unitName(b),
+        held_a := AssetHolding.balance(me, a),
+        held_b := AssetHolding.balance(me, b),
+        InnerTxnBuilder.Begin(),
+        InnerTxnBuilder.SetFields(pool_token_fields(una.value(), unb.value())),
+        If(Not(held_a.hasValue())).Then(
+            InnerTxnBuilder.Next(),
+            InnerTxnBuilder.SetFields(axfer_fields(me, a, Int(0))),
+        ),
+        If(Not(held_b.hasValue())).Then(
+            InnerTxnBuilder.Next(),
+            InnerTxnBuilder.SetFields(axfer_fields(me, b, Int(0))),
+        ),
+        InnerTxnBuilder.Submit(),
+        Gitxn[0].created_asset_id(),
+    )
+
+
+def valid_deposit(xfer: abi.AssetTransferTransaction, asset: Expr) -> Expr:
+    return And(
+        xfer.get().type_enum() == TxnType.AssetTransfer,
+        xfer.get().asset_receiver() == me,
+        xfer.get().sender() == Txn.sender(),
+        xfer.get().xfer_asset() == asset,
+        xfer.get().asset_amount() > Int(0),
+    )
+
+
+def build_factory_program(
+    wide: bool = False, op_ups: Dict[str, int] = None
+) -> Tuple[str, str, sdk_abi.Contract]:
+    return fit_budget(lambda op_ups: _build_factory_program(wide, op_ups), op_ups)
+
+
+def _build_factory_program(
+    wide: bool, op_ups: Dict[str, int]
+) -> Tuple[str, str, sdk_abi.Contract]:
+    mint_tokens, burn_tokens, swap_tokens = token_math(wide)
+
+    router = Router(
+        "demo-amm-factory",
+        BareCallActions(
+            no_op=OnCompleteAction.create_only(Approve()),
+            update_application=OnCompleteAction.always(Return(is_governor)),
+            delete_application=OnCompleteAction.always(Return(is_governor)),
+            close_out=OnCompleteAction.never(),
+            opt_in=OnCompleteAction.never(),
+            clear_state=OnCompleteAction.call_only(Approve()),
+        ),
+    )
+    method = with_op_ups(router, op_ups)
+
+    @method
+    def create_pair(
+        seed: abi.PaymentTransaction,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+        *,
+        output: abi.Uint64,
+    ):
+        """adds a pair, opting in to its assets and creating its pool token, may only be called by the governor"""
+        a, b = a_asset.asset_id(), b_asset.asset_id()
+        key = Concat(Itob(a), Itob(b))
+        token = ScratchVar(TealType.uint64)
+
+        valid_seed = And(
+            seed.get().type_enum() == TxnType.Payment,
+            seed.get().receiver() == me,
+            seed.get().amount() >= Int(pair_seed),
+        )
+
+        return Seq(
+            Assert(is_governor),
+            Assert(valid_seed),
+            Assert(a < b),
+            existing := App.globalGetEx(Int(0), key),
+            Assert(Not(existing.hasValue())),
+            token.store(do_create_pair_token(a, b)),
+            App.globalPut(key, Concat(Itob(token.load()), BytesZero(Int(24)))),
+            output.set(token.load()),
+        )
+
+    @method
+    def fund(
+        a_xfer: abi.AssetTransferTransaction,
+        b_xfer: abi.AssetTransferTransaction,
+        pool_asset: abi.Asset,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+    ):
+        """fund a pair with some asset A and asset B, separate from normal `mint` since it uses a slightly different initial formula for minting tokens"""
+        pair = Pair(a_asset, b_asset)
+        aamt = a_xfer.get().asset_amount()
+        bamt = b_xfer.get().asset_amount()
+        minted = ScratchVar(TealType.uint64)
+
+        return Seq(
+            pair.load(),
+            Assert(pool_asset.asset_id() == pair.token),
+            Assert(valid_deposit(a_xfer, pair.a)),
+            Assert(valid_deposit(b_xfer, pair.b)),
+            # Make sure this is the first time the pair's been funded
+            Assert(And(pair.a_reserve == Int(0), pair.b_reserve == Int(0))),
+            minted.store(fund_tokens(aamt, bamt, wide)),
+            pair.store(aamt, bamt, minted.load()),
+            do_axfer(Txn.sender(), pair.token, minted.load()),
+            emit("Mint", aamt, bamt, minted.load(), aamt, bamt),
+        )
+
+    @method
+    def mint(
+        a_xfer: abi.AssetTransferTransaction,
+        b_xfer: abi.AssetTransferTransaction,
+        pool_asset: abi.Asset,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+    ):
+        """mint a pair's pool tokens given some amount of asset A and asset B"""
+        pair = Pair(a_asset, b_asset)
+        aamt = a_xfer.get().asset_amount()
+        bamt = b_xfer.get().asset_amount()
+        minted = ScratchVar(TealType.uint64)
+        a_reserve = ScratchVar(TealType.uint64)
+        b_reserve = ScratchVar(TealType.uint64)
+
+        return Seq(
+            pair.load(),
+            Assert(pool_asset.asset_id() == pair.token),
+            Assert(valid_deposit(a_xfer, pair.a)),
+            Assert(valid_deposit(b_xfer, pair.b)),
+            a_reserve.store(pair.a_reserve + aamt),
+            b_reserve.store(pair.b_reserve + bamt),
+            minted.store(
+                mint_tokens(pair.issued, a_reserve.load(), b_reserve.load(), aamt, bamt)
+            ),
+            pair.store(a_reserve.load(), b_reserve.load(), pair.issued + minted.load()),
+            do_axfer(Txn.sender(), pair.token, minted.load()),
+            emit("Mint", aamt, bamt, minted.load(), a_reserve.load(), b_reserve.load()),
+        )
+
+    @method
+    def burn(
+        pool_xfer: abi.AssetTransferTransaction,
+        pool_asset: abi.Asset,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+    ):
+        """burn a pair's pool tokens to get back some amount of asset A and asset B"""
+        pair = Pair(a_asset, b_asset)
+        amt = pool_xfer.get().asset_amount()
+        issued = ScratchVar(TealType.uint64)
+        a_out = ScratchVar(TealType.uint64)
+        b_out = ScratchVar(TealType.uint64)
+
+        valid_pool_xfer = And(
+            pool_xfer.get().type_enum() == TxnType.AssetTransfer,
+            pool_xfer.get().asset_receiver() == me,
+            pool_xfer.get().xfer_asset() == pair.token,
+        )
+
+        return Seq(
+            pair.load(),
+            Assert(pool_asset.asset_id() == pair.token),
+            Assert(valid_pool_xfer),
+            # Pool tokens already sent back don't count as issued
+            issued.store(pair.issued - amt),
+            a_out.store(burn_tokens(issued.load(), pair.a_reserve, amt)),
+            b_out.store(burn_tokens(issued.load(), pair.b_reserve, amt)),
+            pair.store(
+                pair.a_reserve - a_out.load(),
+                pair.b_reserve - b_out.load(),
+                issued.load(),
+            ),
+            inner_group(
+                axfer_fields(Txn.sender(), pair.a, a_out.load()),
+                axfer_fields(Txn.sender(), pair.b, b_out.load()),
+            ),
+            emit(
+                "Burn",
+                amt,
+                a_out.load(),
+                b_out.load(),
+                pair.a_reserve,
+                pair.b_reserve,
+            ),
+        )
+
+    @method
+    def swap(
+        swap_xfer: abi.AssetTransferTransaction,
+        a_asset: abi.Asset,
+        b_asset: abi.Asset,
+        min_out: abi.Uint64,
+    ):
+        """Swap some amount of either of a pair's assets for the other, failing if it pays out less than `min_out`"""
+        pair = Pair(a_asset, b_asset)
+        in_id = swap_xfer.get().xfer_asset()
+        inamt = swap_xfer.get().asset_amount()
+        in_res = ScratchVar(TealType.uint64)
+        out_res = ScratchVar(TealType.uint64)
+        out = ScratchVar(TealType.uint64)
+
+        valid_swap_xfer = And(
+            swap_xfer.get().type_enum() == TxnType.AssetTransfer,
+            swap_xfer.get().asset_receiver() == me,
+            swap_xfer.get().sender() == Txn.sender(),
+            Or(in_id == pair.a, in_id == pair.b),
+            inamt > Int(0),
+        )
+
+        return Seq(
+            pair.load(),
+            Assert(valid_swap_xfer),
+            If(in_id == pair.a)
+            .Then(
+                Seq(
+                    in_res.store(pair.a_reserve + inamt),
+                    out_res.store(pair.b_reserve),
+                    out.store(swap_tokens(inamt, in_res.load(), out_res.load())),
+                    Assert(out.load() >= min_out.get()),
+                    pair.store(in_res.load(), out_res.load() - out.load(), pair.issued),
+                    do_axfer(Txn.sender(), pair.b, out.load()),
+                )
+            )
+            .Else(
+                Seq(
+                    in_res.store(pair.b_reserve + inamt),
+                    out_res.store(pair.a_reserve),
+                    out.store(swap_tokens(inamt, in_res.load(), out_res.load())),
+                    Assert(out.load() >= min_out.get()),
+                    pair.store(out_res.load() - out.load(), in_res.load(), pair.issued),
+                    do_axfer(Txn.sender(), pair.a, out.load()),
+                )
+            ),
+            emit("Swap", in_id, inamt, out.load(), pair.a_reserve, pair.b_reserve),
+        )
+
+    @method
+    def set_governor(new_governor: abi.Account):
+        """sets the governor of the contract, may only be called by the current governor"""
+        return Seq(Assert(is_governor), App.globalPut(gov_key, new_governor.address()))
+
+    return router.compile_program(version=teal_version, optimize=optimize_options)
+
+
+if __name__ == "__main__":
+    approval, clear, contract = build_factory_program()
+
+    path = os.path.dirname(os.path.abspath(__file__))
+
+    with open(os.path.join(path, "factory.json"), "w") as f:
+        import json
+
+        contract_json = {**contract.dictify(), "events": event_descriptors()}
+        f.write(json.dumps(contract_json, indent=2))
@@ -0,0 +1,167 @@
+import base64
+import os
+import sys
+from collections import Counter
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import encoding, logic
+
+import quote
+from client import load_contract
+from common.follower import Applied, Follower
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# A pool's reserves and issued tokens kept up to date from the blocks a `Follower`
+# hands it. Deposits are the asset transfers into the app account, payouts the inner
+# transfers out of it, and calls are told apart by their method selector. The numbers
+# track the app's holdings exactly, the same ones `quote` works from.
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PoolState:
+    """Reserves of the pool at `app_id`, as of the last round applied"""
+
+    def __init__(
+        self,
+        app_id: int,
+        asset_a: int,
+        asset_b: int,
+        pool_token: int = None,
+        contract=None,
+        wide: bool = False,
+    ):
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        self.asset_a = asset_a
+        self.asset_b = asset_b
+        self.pool_token = pool_token
+        self.wide = wide  # quote as a pool built with `wide=True`
+
+        contract = contract or load_contract()
+        self.methods = {m.get_selector(): m.name for m in contract.methods}
+
+        self.round = 0
+        self.a_reserve = 0
+        self.b_reserve = 0
+        self.issued = 0  # pool tokens held outside the app account
+        self.calls: Dict[str, int] = Counter()
+
+        self._addr = encoding.decode_address(self.app_addr)
+
+    def seed(self, client) -> int:
+        """reads the pool's holdings once to start following from, returns their round"""
+        state = client.application_info(self.app_id)["params"].get("global-state", [])
+        for kv in state:
+            if base64.b64decode(kv["key"]) == b"p":
+                self.pool_token = kv["value"]["uint"]
+
+        info = client.account_info(self.app_addr)
+        holdings = {a["asset-id"]: a["amount"] for a in info.get("assets", [])}
+        self.a_reserve = holdings.get(self.asset_a, 0)
+        self.b_reserve = holdings.get(self.asset_b, 0)
+        if self.pool_token in holdings:
+            self.issued = quote.issued(holdings[self.pool_token])
+        self.round = info["round"]
+        return self.round
+
+    def reserves(self):
+        """(a_reserve, b_reserve, pool_balance), as the `quote` functions take them"""
+        return self.a_reserve, self.b_reserve, quote.total_supply - self.issued
+
+    def quote_swap(self, asset_id: int, amt: int) -> int:
+        if asset_id == self.asset_a:
+            return quote.quote_swap(self.a_reserve, self.b_reserve, amt, self.wide)
+        return quote.quote_swap(self.b_reserve, self.a_reserve, amt, self.wide)
+
+    def apply(self, round: int, group: List[Applied]):
+        for t in group:
+            txn = t.txn
+            if txn["type"] == "axfer" and txn.get("arcv") == self._addr:
+                self._credit(txn["xaid"], txn.get("aamt", 0))
+            elif txn["type"] == "appl" and txn.get("apid") == self.app_id:
+                args = txn.get("apaa", [])
+                self.calls[self.methods.get(args[0] if args else b"", "other")] += 1
+                self._inner(t.inner)
+        self.round = round
+
+    def _inner(self, inner: List[Applied]):
+        for t in inner:
+            txn = t.txn
+            if txn["type"] == "acfg" and t.created_asset:
+                self.pool_token = t.created_asset  # bootstrap
+            elif txn["type"] == "axfer" and txn.get("snd") == self._addr:
+                if txn.get("arcv") != self._addr:  # not an opt in
+                    self._credit(txn["xaid"], -txn.get("aamt", 0))
+
+    def _credit(self, asset_id: int, amt: int):
+        if asset_id == self.asset_a:
+            self.a_reserve += amt
+        elif asset_id == self.asset_b:
+            self.b_reserve += amt
+        elif asset_id == self.pool_token:
+            self.issued -= amt  # coming back in means fewer held outside
+
+    ###
+    # Checkpoints
+    ###
+
+    def key(self) -> list:
+        return [self.app_id, self.asset_a, self.asset_b]
+
+    def dump(self) -> dict:
+        return {
+            "round": self.round,
+            "pool_token": self.pool_token,
+            "a_reserve": self.a_reserve,
+            "b_reserve": self.b_reserve,
+            "issued": self.issued,
+            "calls": dict(self.calls),
+        }
+
+    def load(self, state: dict):
+        self.round = state["round"]
+        self.pool_token = state["pool_token"]
+        self.a_reserve = state["a_reserve"]
+        self.b_reserve = state["b_reserve"]
+        self.issued = state["issued"]
+        self.calls = Counter(state["calls"])
+
+
+def follow(client, app_id: int, asset_a: int, asset_b: int, checkpoint_path: str = None):
+    """a follower for one pool, resumed from its checkpoint or seeded from algod"""
+    state = PoolState(app_id, asset_a, asset_b)
+    checkpoint_path = checkpoint_path or os.path.join(
+        path, ".cache", "amm-{}.json".format(app_id)
+    )
+    follower = Follower(client, {"pool": state}, checkpoint_path)
+    if not follower.resume():
+        follower.round = state.seed(client)
+    return state, follower
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from algosdk.v2client import algod
+
+    parser = argparse.ArgumentParser(description="follow a pool's reserves")
+    parser.add_argument("app_id", type=int)
+    parser.add_argument("asset_a", type=int)
+    parser.add_argument("asset_b", type=int)
+    parser.add_argument("--url", default="http://localhost:4001")
+    parser.add_argument("--token", default="a" * 64)
+    args = parser.parse_args()
+
+    client = algod.AlgodClient(args.token, args.url)
+    state, follower = follow(client, args.app_id, args.asset_a, args.asset_b)
+    print("Following from round {}".format(follower.round))
+    try:
+        while True:
+            follower.step()
+            print("Round {}: {} {}".format(state.round, state.reserves(), dict(state.calls)))
+    except KeyboardInterrupt:
+        follower.checkpoint()
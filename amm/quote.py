@@ -0,0 +1,267 @@
+import base64
+from math import isqrt
+from typing import Tuple
+
+import numpy as np
+
+import contract
+
+# Off-chain mirror of the math subroutines in contract.py
+#
+# Every operation follows AVM uint64 semantics: division truncates, and any
+# intermediate that overflows, underflows or divides by zero fails the program. The
+# scalar functions raise where the program would fail, the `_batch` functions return
+# an `ok` mask alongside the results instead.
+
+uint64_max = 2**64 - 1
+
+fee = contract.fee.value
+scale = contract.scale.value
+total_supply = contract.total_supply.value
+
+
+def _mul(a: int, b: int) -> int:
+    r = a * b
+    if r > uint64_max:
+        raise OverflowError("* overflowed")
+    return r
+
+
+def _add(a: int, b: int) -> int:
+    r = a + b
+    if r > uint64_max:
+        raise OverflowError("+ overflowed")
+    return r
+
+
+def _sub(a: int, b: int) -> int:
+    if b > a:
+        raise OverflowError("- went below zero")
+    return a - b
+
+
+def _div(a: int, b: int) -> int:
+    if b == 0:
+        raise ZeroDivisionError("/ 0")
+    return a // b
+
+
+def _muldiv(a: int, b: int, c: int) -> int:
+    # mulw then divw (or byte math), the product can't overflow but the quotient can
+    if c == 0:
+        raise ZeroDivisionError("divw 0")
+    r = a * b // c
+    if r > uint64_max:
+        raise OverflowError("divw overflowed")
+    return r
+
+
+def issued(pool_balance: int) -> int:
+    """number of pool tokens held outside the app account"""
+    return _sub(total_supply, pool_balance)
+
+
+def mint_tokens(issued: int, asup: int, bsup: int, aamt: int, bamt: int) -> int:
+    a, b = _div(aamt, asup), _div(bamt, bsup)
+    return _mul(a if a < b else b, issued)
+
+
+def burn_tokens(issued: int, sup: int, amt: int) -> int:
+    return _mul(sup, _div(amt, issued))
+
+
+def swap_tokens(inamt: int, insup: int, outsup: int) -> int:
+    factor = _sub(scale, fee)
+    return _div(
+        _mul(_mul(inamt, factor), outsup),
+        _add(_mul(insup, scale), _mul(inamt, factor)),
+    )
+
+
+def fund_tokens(aamt: int, bamt: int) -> int:
+    return _sub(isqrt(_mul(aamt, bamt)), scale)
+
+
+# The same for a build with `wide=True`
+
+
+def mint_tokens_wide(issued: int, asup: int, bsup: int, aamt: int, bamt: int) -> int:
+    return min(_muldiv(aamt, issued, asup), _muldiv(bamt, issued, bsup))
+
+
+def burn_tokens_wide(issued: int, sup: int, amt: int) -> int:
+    return _muldiv(sup, amt, _add(issued, amt))
+
+
+def swap_tokens_wide(inamt: int, insup: int, outsup: int) -> int:
+    # Byte math, nothing overflows until the result goes back to a uint64
+    factored = inamt * (scale - fee)
+    return _muldiv(factored, outsup, insup * scale + factored)
+
+
+def fund_tokens_wide(aamt: int, bamt: int) -> int:
+    return _sub(isqrt(aamt * bamt), scale)
+
+
+# The contract reads its holdings after the group's transfers have landed, these take
+# the reserves as they stand before the trade and account for that
+
+
+def quote_mint(
+    a_reserve: int,
+    b_reserve: int,
+    pool_balance: int,
+    aamt: int,
+    bamt: int,
+    wide: bool = False,
+):
+    mint = mint_tokens_wide if wide else mint_tokens
+    return mint(
+        issued(pool_balance), _add(a_reserve, aamt), _add(b_reserve, bamt), aamt, bamt
+    )
+
+
+def quote_burn(
+    a_reserve: int, b_reserve: int, pool_balance: int, amt: int, wide: bool = False
+):
+    burn = burn_tokens_wide if wide else burn_tokens
+    minted = issued(_add(pool_balance, amt))
+    return burn(minted, a_reserve, amt), burn(minted, b_reserve, amt)
+
+
+def quote_swap(in_reserve: int, out_reserve: int, amt: int, wide: bool = False) -> int:
+    swap = swap_tokens_wide if wide else swap_tokens
+    return swap(amt, _add(in_reserve, amt), out_reserve)
+
+
+def reserves_from_state(global_state: list) -> Tuple[int, int, int]:
+    """the (a_reserve, b_reserve, pool_balance) to quote with, from the global state
+    of a pool built with `reserves=True` as `application_info` returns it"""
+    state = {
+        base64.b64decode(kv["key"]): kv["value"].get("uint", 0) for kv in global_state
+    }
+    return (
+        state.get(_state_key(contract.a_reserve_key), 0),
+        state.get(_state_key(contract.b_reserve_key), 0),
+        total_supply - state.get(_state_key(contract.issued_key), 0),
+    )
+
+
+def _state_key(key) -> bytes:
+    # PyTeal keeps utf-8 byte constants quoted, as they appear in TEAL
+    return key.byte_str.strip('"').encode()
+
+
+def fetch_reserves(client, app_id: int) -> Tuple[int, int, int]:
+    """exact reserves for a pool built with `reserves=True`, in one request"""
+    return reserves_from_state(client.application_info(app_id)["params"]["global-state"])
+
+
+# Batched versions, each argument may be a scalar or an array and they're broadcast
+# against each other. Returns (result, ok) where result is 0 wherever ok is False.
+
+
+def _as_uint64(*args):
+    return [np.asarray(a, dtype=np.uint64) for a in np.broadcast_arrays(*args)]
+
+
+def _mul_batch(a, b, ok):
+    safe_a = np.where(a == 0, np.uint64(1), a)
+    ok &= (a == 0) | (b <= np.uint64(uint64_max) // safe_a)
+    return a * b
+
+
+def _add_batch(a, b, ok):
+    ok &= a <= np.uint64(uint64_max) - b
+    return a + b
+
+
+def _sub_batch(a, b, ok):
+    ok &= a >= b
+    return np.where(a >= b, a - b, np.uint64(0))
+
+
+def _div_batch(a, b, ok):
+    ok &= b != 0
+    return a // np.where(b == 0, np.uint64(1), b)
+
+
+def _isqrt_batch(x):
+    # float64 sqrt is within one of the true root, walk it onto the exact floor
+    r = np.minimum(np.sqrt(x.astype(np.float64)), 2**32 - 1).astype(np.uint64)
+    for _ in range(2):
+        r = np.where(r * r > x, r - np.uint64(1), r)
+    for _ in range(2):
+        n = r + np.uint64(1)
+        r = np.where((n < np.uint64(2**32)) & (n * n <= x), n, r)
+    return r
+
+
+def _done(result, ok) -> Tuple[np.ndarray, np.ndarray]:
+    return np.where(ok, result, np.uint64(0)), ok
+
+
+def mint_tokens_batch(issued, asup, bsup, aamt, bamt):
+    issued, asup, bsup, aamt, bamt = _as_uint64(issued, asup, bsup, aamt, bamt)
+    ok = np.ones(issued.shape, dtype=bool)
+    a, b = _div_batch(aamt, asup, ok), _div_batch(bamt, bsup, ok)
+    return _done(_mul_batch(np.minimum(a, b), issued, ok), ok)
+
+
+def burn_tokens_batch(issued, sup, amt):
+    issued, sup, amt = _as_uint64(issued, sup, amt)
+    ok = np.ones(issued.shape, dtype=bool)
+    return _done(_mul_batch(sup, _div_batch(amt, issued, ok), ok), ok)
+
+
+def swap_tokens_batch(inamt, insup, outsup):
+    inamt, insup, outsup = _as_uint64(inamt, insup, outsup)
+    ok = np.ones(inamt.shape, dtype=bool)
+    factor = np.uint64(scale - fee)
+    num = _mul_batch(_mul_batch(inamt, factor, ok), outsup, ok)
+    den = _add_batch(
+        _mul_batch(insup, np.uint64(scale), ok), _mul_batch(inamt, factor, ok), ok
+    )
+    return _done(_div_batch(num, den, ok), ok)
+
+
+def fund_tokens_batch(aamt, bamt):
+    aamt, bamt = _as_uint64(aamt, bamt)
+    ok = np.ones(aamt.shape, dtype=bool)
+    root = _isqrt_batch(_mul_batch(aamt, bamt, ok))
+    return _done(_sub_batch(root, np.uint64(scale), ok), ok)
+
+
+def quote_swap_batch(in_reserve, out_reserve, amt):
+    in_reserve, out_reserve, amt = _as_uint64(in_reserve, out_reserve, amt)
+    ok = np.ones(amt.shape, dtype=bool)
+    insup = _add_batch(in_reserve, amt, ok)
+    out, swap_ok = swap_tokens_batch(amt, insup, out_reserve)
+    ok &= swap_ok
+    return _done(out, ok)
+
+
+def quote_mint_batch(a_reserve, b_reserve, pool_balance, aamt, bamt):
+    a_reserve, b_reserve, pool_balance, aamt, bamt = _as_uint64(
+        a_reserve, b_reserve, pool_balance, aamt, bamt
+    )
+    ok = np.ones(aamt.shape, dtype=bool)
+    minted = _sub_batch(np.uint64(total_supply), pool_balance, ok)
+    asup, bsup = _add_batch(a_reserve, aamt, ok), _add_batch(b_reserve, bamt, ok)
+    out, mint_ok = mint_tokens_batch(minted, asup, bsup, aamt, bamt)
+    ok &= mint_ok
+    return _done(out, ok)
+
+
+def quote_burn_batch(a_reserve, b_reserve, pool_balance, amt):
+    a_reserve, b_reserve, pool_balance, amt = _as_uint64(
+        a_reserve, b_reserve, pool_balance, amt
+    )
+    ok = np.ones(amt.shape, dtype=bool)
+    minted = _sub_batch(
+        np.uint64(total_supply), _add_batch(pool_balance, amt, ok), ok
+    )
+    a_out, a_ok = burn_tokens_batch(minted, a_reserve, amt)
+    b_out, b_ok = burn_tokens_batch(minted, b_reserve, amt)
+    ok &= a_ok & b_ok
+    return np.where(ok, a_out, np.uint64(0)), np.where(ok, b_out, np.uint64(0)), ok
@@ -0,0 +1,315 @@
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import abi, encoding, logic
+from algosdk.future.transaction import SuggestedParams
+
+import quote
+from client import AmmClient, load_contract
+from common.confirm import Confirmations
+from common.params import Params
+from common.signing import SignedGroup, sign_group, signing_key
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# Finds the best way to trade between two assets across every deployed pool, directly
+# or through others, and sends it as one atomic group of chained swaps. Each hop's
+# transfer into the next pool is the exact output `swap_tokens` gives for the hop
+# before it, worked out from a snapshot of the reserves. Every swap call also carries
+# a `min_out`: a hop feeding the next has to pay out at least that transfer, and the
+# last hop its quote less a slippage tolerance. So if a pool has moved against the
+# trade in the meantime, the group fails as a whole rather than trading at a worse
+# rate.
+
+max_group_size = 16  # each hop is a transfer and a swap call
+
+
+class Pool(NamedTuple):
+    app_id: int
+    asset_a: int
+    asset_b: int
+
+
+class Hop(NamedTuple):
+    pool: Pool
+    asset_in: int
+    amount_in: int
+    amount_out: int
+
+    @property
+    def asset_out(self) -> int:
+        p = self.pool
+        return p.asset_b if self.asset_in == p.asset_a else p.asset_a
+
+
+class Route(NamedTuple):
+    hops: List[Hop]
+
+    @property
+    def amount_in(self) -> int:
+        return self.hops[0].amount_in
+
+    @property
+    def amount_out(self) -> int:
+        return self.hops[-1].amount_out
+
+
+Path = Tuple[Tuple[Pool, int], ...]  # (pool, asset in) for each hop
+
+
+class RouteFinder:
+    """Routes over a set of pools, quoted from a cached snapshot of their reserves
+
+    Paths between a pair of assets are enumerated once and kept, so a quote only runs
+    the swap formula along each of them.
+    """
+
+    def __init__(self, pools: Iterable[Pool], max_hops: int = 3, wide: bool = False):
+        self.pools: Dict[int, Pool] = {p.app_id: p for p in pools}
+        self.max_hops = max_hops
+        self.wide = wide  # the pools were built with `wide=True`
+
+        self.reserves: Dict[int, Tuple[int, int]] = {}  # app id -> (a, b)
+        self.round = 0
+
+        self._edges: Dict[int, List[Tuple[Pool, int]]] = {}  # asset -> (pool, other)
+        for p in self.pools.values():
+            self._edges.setdefault(p.asset_a, []).append((p, p.asset_b))
+            self._edges.setdefault(p.asset_b, []).append((p, p.asset_a))
+        self._paths: Dict[Tuple[int, int], List[Path]] = {}
+
+    def refresh(self, client, workers: int = 16) -> int:
+        """reads every pool's reserves from algod at once, returns the last round"""
+
+        def lookup(p: Pool):
+            info = client.account_info(logic.get_application_address(p.app_id))
+            holdings = {a["asset-id"]: a["amount"] for a in info.get("assets", [])}
+            return p, holdings, info["round"]
+
+        with ThreadPoolExecutor(min(workers, len(self.pools))) as executor:
+            for p, holdings, round in executor.map(lookup, self.pools.values()):
+                a, b = holdings.get(p.asset_a, 0), holdings.get(p.asset_b, 0)
+                self.update(p.app_id, a, b)
+                self.round = max(self.round, round)
+        return self.round
+
+    def update(self, app_id: int, a_reserve: int, b_reserve: int):
+        """sets a pool's reserves, e.g. from a `PoolState` or the reserves an event
+        logged"""
+        self.reserves[app_id] = (a_reserve, b_reserve)
+
+    def paths(self, asset_in: int, asset_out: int) -> List[Path]:
+        """every path from `asset_in` to `asset_out` of up to `max_hops`, using each
+        pool at most once"""
+        key = (asset_in, asset_out)
+        if key not in self._paths:
+            found = []
+
+            def walk(asset: int, path: list, seen: set):
+                for p, other in self._edges.get(asset, []):
+                    if p.app_id in seen or other == asset_in:
+                        continue
+                    step = path + [(p, asset)]
+                    if other == asset_out:
+                        found.append(tuple(step))
+                    elif len(step) < self.max_hops:
+                        walk(other, step, seen | {p.app_id})
+
+            walk(asset_in, [], set())
+            self._paths[key] = found
+        return self._paths[key]
+
+    def quote(self, path: Path, amount: int) -> Optional[Route]:
+        """the route `amount` takes along `path`, None if a hop would fail on chain"""
+        hops = []
+        for p, asset_in in path:
+            if p.app_id not in self.reserves:
+                return None
+            a, b = self.reserves[p.app_id]
+            in_reserve, out_reserve = (a, b) if asset_in == p.asset_a else (b, a)
+            try:
+                out = quote.quote_swap(in_reserve, out_reserve, amount, self.wide)
+            except (OverflowError, ZeroDivisionError):
+                return None
+            if out == 0 or amount == 0:
+                return None  # the next hop's transfer would be empty
+            hops.append(Hop(p, asset_in, amount, out))
+            amount = out
+        return Route(hops)
+
+    def best(self, asset_in: int, asset_out: int, amount: int) -> Optional[Route]:
+        routes = (self.quote(path, amount) for path in self.paths(asset_in, asset_out))
+        return max(filter(None, routes), key=lambda r: r.amount_out, default=None)
+
+    def split(
+        self,
+        asset_in: int,
+        asset_out: int,
+        amount: int,
+        parts: int = 10,
+        max_routes: int = 3,
+    ) -> List[Route]:
+        """spreads `amount` over paths that share no pool, a part at a time to whichever
+        path gives the most for it. Falls back to the best single route when splitting
+        doesn't pay more, and gives no routes when none fits in a group"""
+        best = self.best(asset_in, asset_out, amount)
+        if best is None:
+            return []
+
+        # Candidates in order of what they'd give for the whole amount
+        quoted = (self.quote(p, amount) for p in self.paths(asset_in, asset_out))
+        ranked = sorted(filter(None, quoted), key=lambda r: r.amount_out, reverse=True)
+        paths, used, hops = [], set(), 0
+        for r in ranked:
+            pools = {h.pool.app_id for h in r.hops}
+            if pools & used or 2 * (hops + len(r.hops)) > max_group_size:
+                continue
+            paths.append(tuple((h.pool, h.asset_in) for h in r.hops))
+            used |= pools
+            hops += len(r.hops)
+            if len(paths) == max_routes:
+                break
+        if not paths:
+            # Not even the best route fits in a group
+            return []
+
+        parts = min(parts, amount)
+        allocated = [0] * len(paths)
+        outs = [0] * len(paths)
+        for i in range(parts):
+            chunk = amount // parts + (amount % parts if i == parts - 1 else 0)
+            gains = []
+            for j, path in enumerate(paths):
+                r = self.quote(path, allocated[j] + chunk)
+                gains.append((r.amount_out - outs[j]) if r is not None else -1)
+            j = max(range(len(paths)), key=gains.__getitem__)
+            if gains[j] < 0:
+                return [best]
+            allocated[j] += chunk
+            outs[j] += gains[j]
+
+        routes = [self.quote(p, amt) for p, amt in zip(paths, allocated) if amt]
+        if sum(r.amount_out for r in routes) <= best.amount_out:
+            return [best]
+        return routes
+
+
+class SwapRouter:
+    """Sends routes from a `RouteFinder` as one group of chained swap calls
+
+    Intermediate assets pass through `addr`, which has to be opted in to them. The
+    last hop of a route may pay out up to `slippage_bps` basis points less than its
+    quote. Hops before it have to pay their quote in full, since the next hop's
+    transfer spends exactly that.
+    """
+
+    def __init__(
+        self,
+        client,
+        addr: str,
+        sk: str,
+        finder: RouteFinder,
+        contract: abi.Contract = None,
+        confirmations: Confirmations = None,
+        params: Params = None,
+        slippage_bps: int = 50,
+    ):
+        self.client = client
+        self.addr = addr
+        self.sk = sk
+        self.finder = finder
+        self.slippage_bps = slippage_bps
+        self.contract = contract or load_contract()
+        self.confirmations = confirmations or Confirmations(client)
+        self.params = params or Params(client)
+
+        self.clients: Dict[int, AmmClient] = {}
+        self._keys = {encoding.decode_address(addr): signing_key(sk)}
+
+    def txns(self, sp: SuggestedParams, routes: List[Route], note: bytes = None):
+        txns = []
+        for route in routes:
+            for hop in route.hops:
+                min_out = hop.amount_out
+                if hop is route.hops[-1]:
+                    min_out -= min_out * self.slippage_bps // 10_000
+                amm = self._client(hop.pool)
+                txns.extend(
+                    amm.swap_txns(sp, hop.amount_in, hop.asset_in, note, min_out)
+                )
+        if len(txns) > max_group_size:
+            raise ValueError("{} hops don't fit in a group".format(len(txns) // 2))
+        return txns
+
+    def group(self, sp: SuggestedParams, routes: List[Route], note: bytes = None):
+        return sign_group(self.txns(sp, routes, note), self._keys)
+
+    def swap(
+        self, asset_in: int, asset_out: int, amount: int, split: bool = True
+    ) -> Tuple[List[Route], dict]:
+        """trades `amount` of `asset_in` along the best routes, returns them with the
+        confirmed info of the last swap call"""
+        if split:
+            routes = self.finder.split(asset_in, asset_out, amount)
+        else:
+            routes = list(filter(None, [self.finder.best(asset_in, asset_out, amount)]))
+        if not routes:
+            raise ValueError("No route from {} to {}".format(asset_in, asset_out))
+
+        group: SignedGroup = self.group(self.params.get(), routes)
+        return routes, self._client(routes[0].hops[0].pool).send(group)
+
+    def _client(self, p: Pool) -> AmmClient:
+        if p.app_id not in self.clients:
+            self.clients[p.app_id] = AmmClient(
+                self.client,
+                p.app_id,
+                self.addr,
+                self.sk,
+                p.asset_a,
+                p.asset_b,
+                contract=self.contract,
+                confirmations=self.confirmations,
+                params=self.params,
+            )
+        return self.clients[p.app_id]
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="benchmark route finding")
+    parser.add_argument("--assets", type=int, default=12)
+    parser.add_argument("--pools", type=int, default=40)
+    parser.add_argument("--quotes", type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    pairs = set()
+    while len(pairs) < args.pools:
+        a, b = sorted(rng.sample(range(1, args.assets + 1), 2))
+        pairs.add((a, b))
+    finder = RouteFinder(Pool(1000 + i, a, b) for i, (a, b) in enumerate(sorted(pairs)))
+    for p in finder.pools.values():
+        a, b = rng.randrange(10**6, 10**9), rng.randrange(10**6, 10**9)
+        finder.update(p.app_id, a, b)
+
+    trades = [
+        (*rng.sample(range(1, args.assets + 1), 2), rng.randrange(10**3, 10**6))
+        for _ in range(args.quotes)
+    ]
+    for kind, find in (("best", finder.best), ("split", finder.split)):
+        start = time.perf_counter()
+        paths = sum(len(finder.paths(a, b)) for a, b, n in trades if find(a, b, n))
+        elapsed = time.perf_counter() - start
+        print(
+            "{}: {} trades over {} paths in {:.2f}s, {:.0f} paths per second".format(
+                kind, len(trades), paths, elapsed, paths / elapsed
+            )
+        )
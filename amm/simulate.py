@@ -0,0 +1,265 @@
+import argparse
+import base64
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import account, encoding
+from algosdk.atomic_transaction_composer import *
+from algosdk.future.transaction import *
+
+from common.avm import AVMError, Ledger, app_address, min_txn_fee
+from contract import build_program
+from factory import build_factory_program, pair_seed
+
+# Runs the same flow as demo.py against the offline interpreter in common/avm.py, no
+# sandbox required
+
+
+def get_params(ledger: Ledger, txns_covered: int = 1) -> SuggestedParams:
+    return SuggestedParams(
+        min_txn_fee * txns_covered,
+        ledger.round,
+        ledger.round + 1000,
+        base64.b64encode(bytes(32)).decode(),
+        "avm-sim",
+        flat_fee=True,
+    )
+
+
+def get_method(contract, name):
+    return next(m for m in contract.methods if m.name == name)
+
+
+class Pool:
+    """An AMM deployed on an offline ledger, with a funded liquidity provider"""
+
+    def __init__(
+        self,
+        ledger: Ledger = None,
+        reserves: bool = False,
+        factory: bool = False,
+        wide: bool = False,
+    ):
+        self.ledger = ledger or Ledger()
+
+        self.sk, self.addr = account.generate_account()
+        self.signer = AccountTransactionSigner(self.sk)
+        self.ledger.fund(self.addr, int(1e12))
+
+        self.asset_a = self.create_asset("A")
+        self.asset_b = self.create_asset("B")
+
+        if factory:
+            # One app for every pair, this pool is the first pair in it
+            approval, clear, self.contract = build_factory_program(wide)
+        else:
+            approval, clear, self.contract = build_program(
+                self.asset_a, self.asset_b, reserves, wide
+            )
+        sp = get_params(self.ledger)
+        result = self.ledger.apply_group(
+            [
+                ApplicationCreateTxn(
+                    self.addr,
+                    sp,
+                    OnComplete.NoOpOC,
+                    self.ledger.compile(approval),
+                    self.ledger.compile(clear),
+                    StateSchema(0, 64) if factory else StateSchema(32, 32),
+                    StateSchema(0, 0),
+                )
+            ]
+        )
+        self.app_id = result[0].created_app
+        self.app_addr = encoding.encode_address(app_address(self.app_id))
+        self.ledger.apply_group([PaymentTxn(self.addr, sp, self.app_addr, int(1e7))])
+
+        if factory:
+            seed = TransactionWithSigner(
+                txn=PaymentTxn(self.addr, sp, self.app_addr, pair_seed),
+                signer=self.signer,
+            )
+            result = self.call("create_pair", [seed, self.asset_a, self.asset_b], 4)
+            print("create_pair cost {} ops".format(result[-1].cost))
+        else:
+            result = self.call("bootstrap", [self.asset_a, self.asset_b], 4)
+        self.pool_token = int.from_bytes(result[-1].logs[-1][4:], "big")
+        self.ledger.apply_group(
+            [AssetTransferTxn(self.addr, sp, self.addr, 0, self.pool_token)]
+        )
+
+    def create_asset(self, unitname: str) -> int:
+        txn = AssetCreateTxn(
+            self.addr,
+            get_params(self.ledger),
+            int(1e15),
+            0,
+            False,
+            asset_name="asset",
+            unit_name=unitname,
+        )
+        return self.ledger.apply_group([txn])[0].created_asset
+
+    def xfer(self, amt: int, asset_id: int) -> TransactionWithSigner:
+        return TransactionWithSigner(
+            txn=AssetTransferTxn(
+                self.addr, get_params(self.ledger), self.app_addr, amt, asset_id
+            ),
+            signer=self.signer,
+        )
+
+    def group(self, name: str, args: list, txns_covered: int = 2) -> list:
+        atc = AtomicTransactionComposer()
+        atc.add_method_call(
+            self.app_id,
+            get_method(self.contract, name),
+            self.addr,
+            get_params(self.ledger, txns_covered),
+            self.signer,
+            args,
+        )
+        return [tws.txn for tws in atc.build_group()]
+
+    def call(self, name: str, args: list, txns_covered: int = 2):
+        return self.ledger.apply_group(self.group(name, args, txns_covered))
+
+    def fund(self, a_amt: int, b_amt: int):
+        return self.call(
+            "fund",
+            [
+                self.xfer(a_amt, self.asset_a),
+                self.xfer(b_amt, self.asset_b),
+                self.pool_token,
+                self.asset_a,
+                self.asset_b,
+            ],
+        )
+
+    def mint(self, a_amt: int, b_amt: int):
+        return self.call(
+            "mint",
+            [
+                self.xfer(a_amt, self.asset_a),
+                self.xfer(b_amt, self.asset_b),
+                self.pool_token,
+                self.asset_a,
+                self.asset_b,
+            ],
+        )
+
+    def swap(self, amt: int, asset_id: int, min_out: int = 0):
+        return self.call(
+            "swap", [self.xfer(amt, asset_id), self.asset_a, self.asset_b, min_out]
+        )
+
+    def burn(self, amt: int):
+        return self.call(
+            "burn",
+            [
+                self.xfer(amt, self.pool_token),
+                self.pool_token,
+                self.asset_a,
+                self.asset_b,
+            ],
+            3,
+        )
+
+    def balances(self) -> dict:
+        ids = {"Pool": self.pool_token, "AssetA": self.asset_a, "AssetB": self.asset_b}
+        return {
+            who: {k: self.ledger.holding(addr, v) for k, v in ids.items()}
+            for who, addr in (("App", self.app_addr), ("Participant", self.addr))
+        }
+
+
+def demo(reserves: bool = False, factory: bool = False, wide: bool = False):
+    pool = Pool(reserves=reserves, factory=factory, wide=wide)
+    print("Created App with id: {}".format(pool.app_id))
+
+    for name, step in [
+        ("fund", lambda: pool.fund(1000, 3000)),
+        ("mint", lambda: pool.mint(100000, 1000)),
+        ("swap A for B", lambda: pool.swap(5, pool.asset_a)),
+        ("swap B for A", lambda: pool.swap(5, pool.asset_b)),
+        ("burn", lambda: pool.burn(100)),
+    ]:
+        result = step()
+        print("{} cost {} ops: {}".format(name, result[-1].cost, pool.balances()))
+
+    return pool
+
+
+def bench(pool: Pool, swaps: int):
+    # Groups are evaluated from their msgpack form, the same shape a node receives
+    group = [
+        txn.dictify()
+        for txn in pool.group(
+            "swap", [pool.xfer(5, pool.asset_a), pool.asset_a, pool.asset_b, 0]
+        )
+    ]
+
+    start = time.perf_counter()
+    for _ in range(swaps):
+        pool.ledger.apply_group(group)
+    elapsed = time.perf_counter() - start
+
+    print(
+        "{} swaps in {:.2f}s, {:.0f} per minute".format(
+            swaps, elapsed, swaps / elapsed * 60
+        )
+    )
+
+
+def bench_sizes(reserves: bool = False, factory: bool = False):
+    """opcode cost of each call as the reserves grow, with and without wide math. The
+    amounts scale with the reserves, up to where `fund` would mint more than the pool
+    token's total supply"""
+    for size in (10**6, 10**8, 10**9, 5 * 10**9):
+        for wide in (False, True):
+            pool = Pool(reserves=reserves, factory=factory, wide=wide)
+
+            def held():
+                return pool.ledger.holding(pool.addr, pool.pool_token)
+
+            costs = []
+            for name, step in [
+                ("fund", lambda: pool.fund(size, 3 * size)),
+                ("mint", lambda: pool.mint(size // 10, 3 * size // 10)),
+                ("swap", lambda: pool.swap(size // 100, pool.asset_a)),
+                ("burn", lambda: pool.burn(held() // 10)),
+            ]:
+                try:
+                    costs.append("{} {}".format(name, step()[-1].cost))
+                except AVMError:
+                    costs.append("{} fails".format(name))
+            mode = "wide" if wide else "narrow"
+            print("{:.0e} {}: {}".format(size, mode, ", ".join(costs)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--swaps", type=int, default=0, help="swaps to benchmark")
+    parser.add_argument(
+        "--reserves", action="store_true", help="keep reserves in global state"
+    )
+    parser.add_argument(
+        "--factory", action="store_true", help="serve the pair from a factory app"
+    )
+    parser.add_argument(
+        "--wide", action="store_true", help="use 128 bit intermediates in the math"
+    )
+    parser.add_argument(
+        "--sizes", action="store_true", help="benchmark costs over reserve sizes"
+    )
+    args = parser.parse_args()
+
+    if args.sizes:
+        bench_sizes(args.reserves, args.factory)
+        sys.exit()
+
+    pool = demo(args.reserves, args.factory, args.wide)
+    if args.swaps:
+        bench(pool, args.swaps)
@@ -0,0 +1,184 @@
+import base64
+import json
+import os
+import sys
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import abi as sdk_abi
+
+from cache import ProgramCache
+from common.avm import is_handle, program_handle
+
+# WARNING: THIS IS NOT PROODUCTION LEVEL CODE
+
+# Placeholder asset ids the template is compiled with, chosen so they can't collide
+# with any other constant in the program
+template_asset_a = 2**64 - 3
+template_asset_b = 2**64 - 2
+
+intcblock_op = 0x20
+bytecblock_op = 0x26
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+default_template_path = os.path.join(path, "template.json")
+
+
+def encode_uvarint(val: int) -> bytes:
+    buf = bytearray()
+    while val >= 0x80:
+        buf.append((val & 0x7F) | 0x80)
+        val >>= 7
+    buf.append(val)
+    return bytes(buf)
+
+
+def decode_uvarint(buf: bytes, offset: int) -> Tuple[int, int]:
+    """returns the decoded value and the offset just past it"""
+    val, shift = 0, 0
+    while True:
+        b = buf[offset]
+        offset += 1
+        val |= (b & 0x7F) << shift
+        if b < 0x80:
+            return val, offset
+        shift += 7
+
+
+def split_program(program: bytes) -> Tuple[List[bytes], List[str]]:
+    """Splits assembled bytecode around the placeholder asset ids
+
+    The assembler hoists any constant used more than once into the `intcblock` at the
+    head of the program, ahead of all code. Branch and callsub targets are relative so
+    re-encoding an entry there with a varint of a different length shifts every
+    instruction by the same amount and leaves the program valid.
+    """
+    placeholders = {template_asset_a: "a", template_asset_b: "b"}
+
+    _, offset = decode_uvarint(program, 0)  # version
+
+    segments, slots = [], []
+    start = 0
+    while offset < len(program) and program[offset] in (intcblock_op, bytecblock_op):
+        op = program[offset]
+        count, offset = decode_uvarint(program, offset + 1)
+        for _ in range(count):
+            entry_start = offset
+            val, offset = decode_uvarint(program, offset)
+            if op == bytecblock_op:
+                offset += val
+            elif val in placeholders:
+                segments.append(program[start:entry_start])
+                slots.append(placeholders[val])
+                start = offset
+
+    segments.append(program[start:])
+
+    if sorted(slots) != ["a", "b"]:
+        raise Exception(
+            "Expected each placeholder once in the intcblock, found: {}".format(slots)
+        )
+
+    return segments, slots
+
+
+class ProgramTemplate:
+    """An AMM program compiled once against placeholder asset ids
+
+    `instantiate` produces the bytecode for a concrete pair by splicing the varint
+    encoded asset ids into the intcblock, no PyTeal or algod required. Compiled by the
+    stand-in node there's no bytecode to splice, only a handle carrying the source, so
+    the ids are put into the source and a handle made from that instead.
+    """
+
+    def __init__(
+        self,
+        approval_bytes: bytes,
+        clear_bytes: bytes,
+        contract: sdk_abi.Contract,
+        approval_teal: str = None,
+    ):
+        self.approval_bytes = approval_bytes
+        self.clear_bytes = clear_bytes
+        self.contract = contract
+        self.approval_teal = approval_teal
+
+        self.stand_in = is_handle(approval_bytes)
+        if self.stand_in:
+            if approval_teal is None:
+                raise Exception("A template from the stand-in node needs its TEAL")
+        else:
+            self._segments, self._slots = split_program(approval_bytes)
+
+    @classmethod
+    def compile(cls, client, cache: ProgramCache = None) -> "ProgramTemplate":
+        if cache is None:
+            cache = ProgramCache()
+
+        approval_teal, _, _ = cache.build(template_asset_a, template_asset_b)
+        approval, clear, contract = cache.compile(
+            client, template_asset_a, template_asset_b
+        )
+        return cls(approval, clear, contract, approval_teal)
+
+    @classmethod
+    def load(cls, template_path: str = default_template_path) -> "ProgramTemplate":
+        with open(template_path) as f:
+            t = json.load(f)
+
+        return cls(
+            base64.b64decode(t["approval_bytes"]),
+            base64.b64decode(t["clear_bytes"]),
+            sdk_abi.Contract.undictify(t["contract"]),
+            t.get("approval_teal"),
+        )
+
+    def save(self, template_path: str = default_template_path):
+        with open(template_path, "w") as f:
+            json.dump(
+                {
+                    "approval_bytes": base64.b64encode(self.approval_bytes).decode(),
+                    "clear_bytes": base64.b64encode(self.clear_bytes).decode(),
+                    "contract": self.contract.dictify(),
+                    "approval_teal": self.approval_teal,
+                },
+                f,
+                indent=2,
+            )
+
+    def instantiate(self, asset_a: int, asset_b: int) -> Tuple[bytes, bytes]:
+        """returns the approval and clear bytecode for the pair"""
+        assert asset_a < asset_b
+        if self.stand_in:
+            approval = program_handle(self.instantiate_teal(asset_a, asset_b))
+            return approval, self.clear_bytes
+
+        ids = {"a": encode_uvarint(asset_a), "b": encode_uvarint(asset_b)}
+
+        parts = [self._segments[0]]
+        for slot, segment in zip(self._slots, self._segments[1:]):
+            parts.append(ids[slot])
+            parts.append(segment)
+
+        return b"".join(parts), self.clear_bytes
+
+    def instantiate_teal(self, asset_a: int, asset_b: int) -> str:
+        """returns the approval TEAL source for the pair, for tooling that works on source rather than bytecode"""
+        assert asset_a < asset_b
+        assert self.approval_teal is not None
+
+        return (
+            self.approval_teal.replace(
+                "int {}\n".format(template_asset_a), "int {}\n".format(asset_a)
+            )
+        ).replace("int {}\n".format(template_asset_b), "int {}\n".format(asset_b))
+
+
+if __name__ == "__main__":
+    from demo import client
+
+    template = ProgramTemplate.compile(client)
+    template.save()
+    print("Wrote template to {}".format(default_template_path))
@@ -0,0 +1,103 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from algosdk import account, encoding
+from algosdk.future import transaction
+from pyteal import *
+
+import quote
+from common.avm import AVMError, Ledger, app_address
+from common.cost import analyze, check
+from contract import fit_budget, teal_version, with_op_ups
+from simulate import Pool, get_params
+
+
+def build_looping(op_ups):
+    """a router with one method the cost walk can't bound"""
+    router = Router(
+        "looping", BareCallActions(no_op=OnCompleteAction.create_only(Approve()))
+    )
+    method = with_op_ups(router, op_ups)
+
+    @method
+    def spin(times: abi.Uint64):
+        i = ScratchVar(TealType.uint64)
+        return For(
+            i.store(Int(0)), i.load() < times.get(), i.store(i.load() + Int(1))
+        ).Do(Pop(Sha256(Itob(i.load()))))
+
+    return router.compile_program(version=teal_version)
+
+
+def test_unbounded_method_needs_op_ups():
+    with pytest.raises(ValueError, match="spin"):
+        fit_budget(build_looping)
+
+
+def test_unbounded_method_fails_check():
+    approval, _, _ = build_looping({})
+    report = analyze(approval)
+    assert any(p.startswith("spin has no static cost bound") for p in check(report))
+    assert check(report, allow_unbounded=["spin"]) == []
+
+
+def test_unbounded_method_takes_given_op_ups():
+    approval, _, _ = fit_budget(build_looping, {"spin": 2})
+    assert approval.count("itxn_next") == 1  # two op up calls in one inner group
+
+
+def test_op_ups_are_paid_by_the_caller():
+    approval, clear, contract = fit_budget(build_looping, {"spin": 2})
+    ledger = Ledger()
+    sk, addr = account.generate_account()
+    ledger.fund(addr, 10**12)
+    (created,) = ledger.apply_group(
+        [
+            transaction.ApplicationCreateTxn(
+                addr,
+                get_params(ledger),
+                transaction.OnComplete.NoOpOC,
+                ledger.compile(approval),
+                ledger.compile(clear),
+                transaction.StateSchema(0, 0),
+                transaction.StateSchema(0, 0),
+            )
+        ]
+    )
+    app_addr = encoding.encode_address(app_address(created.created_app))
+    ledger.fund(app_addr, 10**6)
+
+    def spin(txns_covered):
+        return transaction.ApplicationCallTxn(
+            addr,
+            get_params(ledger, txns_covered),
+            created.created_app,
+            transaction.OnComplete.NoOpOC,
+            app_args=[contract.methods[0].get_selector(), bytes(8)],
+        )
+
+    # Short of a fee for each op up, the call fails rather than drawing on the app
+    with pytest.raises(AVMError):
+        ledger.apply_group([spin(1)])
+    ledger.apply_group([spin(3)])
+    assert ledger.balance(app_addr) == 10**6
+
+
+@pytest.mark.parametrize("build", ["holdings", "reserves", "factory"])
+def test_swap_pays_at_least_min_out(build):
+    pool = Pool(reserves=build == "reserves", factory=build == "factory")
+    pool.fund(10**7, 3 * 10**7)
+
+    held = pool.ledger.holding
+    out = quote.quote_swap(
+        held(pool.app_addr, pool.asset_a), held(pool.app_addr, pool.asset_b), 10**5
+    )
+    with pytest.raises(AVMError):
+        pool.swap(10**5, pool.asset_a, min_out=out + 1)
+
+    before = held(pool.addr, pool.asset_b)
+    pool.swap(10**5, pool.asset_a, min_out=out)
+    assert held(pool.addr, pool.asset_b) - before == out
@@ -0,0 +1,278 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pytest
+from algosdk import account
+from algosdk.future.transaction import (
+    ApplicationCallTxn,
+    ApplicationCreateTxn,
+    OnComplete,
+    StateSchema,
+)
+from pyteal import Approve, Btoi, If, Int, Itob, Log, Mode, Seq, Txn, compileTeal
+
+import contract
+import quote
+from common.avm import AVMError, Ledger
+from simulate import Pool, get_params
+
+# Pins quote.py to the contract. Each math subroutine is compiled on its own into a
+# program that logs its result, and run through common/avm.py on the same arguments
+# as the mirror: where the program fails, the mirror has to raise (or clear `ok`), and
+# everywhere else the two have to agree exactly.
+
+uint64_max = 2**64 - 1
+
+# Values the math turns on: zero divisors, ratios that truncate to nothing, the fee
+# scale, the 32 bit boundary products overflow past, and the ends of uint64
+edges = [0, 1, 2, 999, 1000, 10**6, 2**32 - 1, 2**32, 2**63, uint64_max]
+
+
+def fund_tokens(aamt, bamt):
+    return contract.fund_tokens(aamt, bamt)
+
+
+def fund_tokens_wide(aamt, bamt):
+    return contract.fund_tokens(aamt, bamt, wide=True)
+
+
+# (name, contract expression, mirror, number of arguments)
+math = [
+    ("mint_tokens", contract.mint_tokens, quote.mint_tokens, 5),
+    ("burn_tokens", contract.burn_tokens, quote.burn_tokens, 3),
+    ("swap_tokens", contract.swap_tokens, quote.swap_tokens, 3),
+    ("fund_tokens", fund_tokens, quote.fund_tokens, 2),
+    ("mint_tokens_wide", contract.mint_tokens_wide, quote.mint_tokens_wide, 5),
+    ("burn_tokens_wide", contract.burn_tokens_wide, quote.burn_tokens_wide, 3),
+    ("swap_tokens_wide", contract.swap_tokens_wide, quote.swap_tokens_wide, 3),
+    ("fund_tokens_wide", fund_tokens_wide, quote.fund_tokens_wide, 2),
+]
+
+batched = {
+    "mint_tokens": quote.mint_tokens_batch,
+    "burn_tokens": quote.burn_tokens_batch,
+    "swap_tokens": quote.swap_tokens_batch,
+    "fund_tokens": quote.fund_tokens_batch,
+}
+
+# Cases each subroutine has to fail on or truncate at, beyond the random ones
+named_cases = {
+    "mint_tokens": [
+        (1000, 0, 10, 5, 5),  # no A in the pool
+        (1000, 10, 0, 5, 5),
+        (1000, 100, 100, 99, 500),  # a ratio truncates to 0
+        (2**33, 1, 1, 2**32, 2**32),  # minted overflows
+    ],
+    "burn_tokens": [
+        (0, 1000, 5),  # nothing issued
+        (1000, 5000, 999),  # less than the whole issue pays nothing
+        (1000, 5000, 1000),
+        (1, 2**33, 2**32),  # payout overflows
+    ],
+    "swap_tokens": [
+        (0, 0, 1000),  # empty pool
+        (5, 1000, 3000),
+        (1, 10**6, 1),  # rounds down to nothing
+        (2**60, 2**60, 2**60),  # numerator overflows
+        (10**9, 2**62, 10**9),  # denominator overflows
+    ],
+    "fund_tokens": [
+        (1000, 1000),  # root equals the scale, mints nothing
+        (999, 1000),  # root below the scale
+        (2**32, 2**32),  # product overflows
+    ],
+}
+
+
+def pool_shaped(rng: random.Random, name: str) -> tuple:
+    """arguments as a pool would pass them, amounts a fraction of what it holds"""
+
+    def held():
+        return rng.randrange(1, 2 ** rng.randrange(10, 64))
+
+    def part(of):
+        return rng.randrange(1, of + 1)
+
+    kind = name.replace("_wide", "")
+    if kind == "mint_tokens":
+        issued, asup, bsup = held(), held(), held()
+        aamt, bamt = part(asup), part(bsup)
+        return issued, asup, bsup, aamt, bamt
+    if kind == "burn_tokens":
+        issued = held()
+        return issued, held(), part(issued)
+    if kind == "swap_tokens":
+        insup = held()
+        return part(insup), insup, held()
+    return held(), held()
+
+
+def cases(name: str, nargs: int, n: int = 60) -> list:
+    rng = random.Random(name)
+
+    def value():
+        return rng.randrange(2 ** rng.randrange(1, 65))
+
+    found = list(named_cases.get(name.replace("_wide", ""), []))
+    for _ in range(n):
+        found.append(tuple(value() for _ in range(nargs)))
+        found.append(pool_shaped(rng, name))
+    for edge in edges:
+        args = [value() for _ in range(nargs)]
+        args[rng.randrange(nargs)] = edge
+        found.append(tuple(args))
+    return found
+
+
+class Programs:
+    """The math subroutines as standalone apps on an offline ledger"""
+
+    def __init__(self):
+        self.ledger = Ledger()
+        self.sk, self.addr = account.generate_account()
+        self.ledger.fund(self.addr, int(1e12))
+        self.apps = {}
+
+    def app(self, name: str, expr, nargs: int) -> int:
+        if name not in self.apps:
+            args = [Btoi(Txn.application_args[i]) for i in range(nargs)]
+            src = compileTeal(
+                Seq(
+                    If(Txn.application_id() == Int(0)).Then(Approve()),
+                    Log(Itob(expr(*args))),
+                    Approve(),
+                ),
+                Mode.Application,
+                version=contract.teal_version,
+            )
+            self.apps[name] = self.ledger.apply_group(
+                [
+                    ApplicationCreateTxn(
+                        self.addr,
+                        get_params(self.ledger),
+                        OnComplete.NoOpOC,
+                        self.ledger.compile(src),
+                        self.ledger.compile("#pragma version 6\nint 1"),
+                        StateSchema(0, 0),
+                        StateSchema(0, 0),
+                    )
+                ]
+            )[0].created_app
+        return self.apps[name]
+
+    def run(self, name: str, expr, args: tuple):
+        """what the subroutine returns for `args`, None where it fails"""
+        txn = ApplicationCallTxn(
+            self.addr,
+            get_params(self.ledger),
+            self.app(name, expr, len(args)),
+            OnComplete.NoOpOC,
+            app_args=[a.to_bytes(8, "big") for a in args],
+        )
+        try:
+            result = self.ledger.apply_group([txn])
+        except AVMError:
+            return None
+        return int.from_bytes(result[0].logs[-1], "big")
+
+
+def mirror(fn, args: tuple):
+    try:
+        return fn(*args)
+    except (OverflowError, ZeroDivisionError):
+        return None
+
+
+@pytest.fixture(scope="module")
+def programs():
+    return Programs()
+
+
+@pytest.mark.parametrize("name,expr,fn,nargs", math, ids=[m[0] for m in math])
+def test_scalar_matches_contract(programs, name, expr, fn, nargs):
+    for args in cases(name, nargs):
+        assert mirror(fn, args) == programs.run(name, expr, args), args
+
+
+@pytest.mark.parametrize("name,expr,fn,nargs", math[:4], ids=[m[0] for m in math[:4]])
+def test_batch_matches_contract(programs, name, expr, fn, nargs):
+    found = cases(name, nargs)
+    expected = [programs.run(name, expr, args) for args in found]
+
+    result, ok = batched[name](*[np.array(col, dtype=np.uint64) for col in zip(*found)])
+    for args, want, got, passed in zip(found, expected, result.tolist(), ok.tolist()):
+        assert passed == (want is not None), args
+        assert got == (want if passed else 0), args
+
+
+@pytest.mark.parametrize("reserves", [False, True], ids=["holdings", "reserves"])
+@pytest.mark.parametrize("wide", [False, True], ids=["narrow", "wide"])
+def test_quotes_match_calls(reserves, wide):
+    pool = Pool(reserves=reserves, wide=wide)
+    app, lp = pool.app_addr, pool.addr
+
+    def held(addr, asset_id):
+        return pool.ledger.holding(addr, asset_id)
+
+    def state():
+        return (
+            held(app, pool.asset_a),
+            held(app, pool.asset_b),
+            held(app, pool.pool_token),
+        )
+
+    # Small enough that the narrow build doesn't overflow
+    pool.fund(10**7, 3 * 10**7)
+
+    before = held(lp, pool.pool_token)
+    expected = quote.quote_mint(*state(), 10**6, 3 * 10**6, wide)
+    pool.mint(10**6, 3 * 10**6)
+    assert held(lp, pool.pool_token) - before == expected
+
+    for asset_id, other in ((pool.asset_a, pool.asset_b), (pool.asset_b, pool.asset_a)):
+        before = held(lp, other)
+        expected = quote.quote_swap(held(app, asset_id), held(app, other), 10**5, wide)
+        pool.swap(10**5, asset_id)
+        assert held(lp, other) - before == expected
+
+    amt = held(lp, pool.pool_token) // 10
+    before = held(lp, pool.asset_a), held(lp, pool.asset_b)
+    expected = quote.quote_burn(*state(), amt, wide)
+    pool.burn(amt)
+    after = held(lp, pool.asset_a), held(lp, pool.asset_b)
+    assert (after[0] - before[0], after[1] - before[1]) == expected
+
+
+def test_wide_swap_takes_any_reserves(programs):
+    # Past 1.8e16 the narrow products overflow, the wide build only fails where what
+    # the swap pays out doesn't fit
+    for args in [(10**17, 10**18, 10**18), (2**60, 2**62, 2**63), (2**64 - 1,) * 3]:
+        out = programs.run("swap_tokens_wide", contract.swap_tokens_wide, args)
+        assert out is not None and out == quote.swap_tokens_wide(*args), args
+
+
+def test_burn_pays_its_share():
+    # Burning a tenth of the pool tokens out pays a tenth of the reserves, rounded down,
+    # in the wide build. The narrow build truncates the ratio first and pays no more
+    for wide in (False, True):
+        pool = Pool(wide=wide)
+        pool.fund(10**7, 3 * 10**7)
+        pool.mint(10**6, 3 * 10**6)
+
+        held = pool.ledger.holding
+        assets = pool.asset_a, pool.asset_b
+        outstanding = held(pool.addr, pool.pool_token)
+        reserves = [held(pool.app_addr, a) for a in assets]
+
+        amt = outstanding // 10
+        pool.burn(amt)
+        paid = [r - held(pool.app_addr, a) for r, a in zip(reserves, assets)]
+        share = [r * amt // outstanding for r in reserves]
+        if wide:
+            assert paid == share
+        else:
+            assert all(p <= s for p, s in zip(paid, share))
@@ -0,0 +1,51 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from algosdk import account
+from algosdk.future.transaction import SuggestedParams
+
+import quote
+from routing import Pool, RouteFinder, SwapRouter
+
+
+def finder(max_hops: int = 3) -> RouteFinder:
+    # 1 -> 2 -> 3 through two pools, and 1 -> 3 directly through a shallower one
+    pools = [Pool(1001, 1, 2), Pool(1002, 2, 3), Pool(1003, 1, 3)]
+    found = RouteFinder(pools, max_hops=max_hops)
+    found.update(1001, 10**9, 2 * 10**9)
+    found.update(1002, 10**9, 10**9)
+    found.update(1003, 10**6, 10**6)
+    return found
+
+
+def test_every_hop_sets_min_out():
+    found = finder()
+    route = found.best(1, 3, 10**5)
+    assert len(route.hops) == 2
+
+    sk, addr = account.generate_account()
+    router = SwapRouter(None, addr, sk, found, slippage_bps=100)
+    sp = SuggestedParams(1000, 1, 1000, "A" * 44, "sim", flat_fee=True)
+    calls = [t for t in router.txns(sp, [route]) if t["type"] == "appl"]
+
+    min_outs = [int.from_bytes(c["apaa"][-1], "big") for c in calls]
+    first, last = route.hops
+    # The first hop feeds the second's transfer in full, only the last may slip
+    assert min_outs[0] == first.amount_out
+    assert min_outs[1] == last.amount_out - last.amount_out // 100
+    assert last.amount_out == quote.quote_swap(10**9, 10**9, first.amount_out)
+
+
+@pytest.mark.parametrize("max_hops", [3, 9])
+def test_split_fits_a_group(max_hops):
+    # Chains of 9 pools, past the 8 hops a group holds
+    pools = [Pool(2000 + i, i, i + 1) for i in range(9)]
+    found = RouteFinder(pools, max_hops=max_hops)
+    for p in pools:
+        found.update(p.app_id, 10**9, 10**9)
+
+    assert found.split(0, 9, 10**6) == []
+    assert len(found.split(0, 2, 10**6)) == 1
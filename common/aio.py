@@ -0,0 +1,236 @@
+import asyncio
+import base64
+import json
+from typing import List
+
+import aiohttp
+from algosdk import encoding, error
+from algosdk.atomic_transaction_composer import (
+    AtomicTransactionComposer,
+    AtomicTransactionComposerStatus,
+    AtomicTransactionResponse,
+)
+from algosdk.future.transaction import SuggestedParams
+
+from common.confirm import Confirmations, atc_response
+from common.params import Params
+
+# asyncio counterparts of the algod calls the demos make, so a single process can keep
+# many groups in flight. Requests share one aiohttp session whose connector keeps
+# connections alive between calls, instead of urllib opening one per request.
+
+
+class AsyncAlgod:
+    """Coroutine versions of the `AlgodClient` methods used in this repo"""
+
+    def __init__(self, token: str, address: str, connections: int = 64):
+        self.address = address.rstrip("/") + "/v2"
+        self.headers = {"X-Algo-API-Token": token}
+        self.connections = connections
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections),
+                headers=self.headers,
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def _request(self, method: str, path: str, raw: bool = False, **kwargs):
+        async with self.session.request(method, self.address + path, **kwargs) as resp:
+            body = await resp.read()
+            if resp.status != 200:
+                try:
+                    message = json.loads(body)["message"]
+                except (ValueError, KeyError):
+                    message = body.decode(errors="replace")
+                raise error.AlgodHTTPError(message, resp.status)
+            return body if raw else json.loads(body)
+
+    async def status(self) -> dict:
+        return await self._request("GET", "/status")
+
+    async def status_after_block(self, round: int) -> dict:
+        return await self._request("GET", "/status/wait-for-block-after/{}".format(round))
+
+    async def block_info(self, round: int, response_format: str = "json"):
+        return await self._request(
+            "GET",
+            "/blocks/{}".format(round),
+            raw=response_format == "msgpack",
+            params={"format": response_format},
+        )
+
+    async def suggested_params(self) -> SuggestedParams:
+        res = await self._request("GET", "/transactions/params")
+        return SuggestedParams(
+            res["fee"],
+            res["last-round"],
+            res["last-round"] + 1000,
+            res["genesis-hash"],
+            res["genesis-id"],
+            False,
+            res["consensus-version"],
+            res["min-fee"],
+        )
+
+    async def compile(self, source: str) -> dict:
+        return await self._request(
+            "POST",
+            "/teal/compile",
+            data=source.encode(),
+            headers={"Content-Type": "application/x-binary"},
+        )
+
+    async def send_transactions(self, signed: list) -> str:
+        return await self.send_raw_transaction(
+            base64.b64encode(
+                b"".join(base64.b64decode(encoding.msgpack_encode(t)) for t in signed)
+            )
+        )
+
+    async def send_raw_transaction(self, txn) -> str:
+        """takes the signed transactions base64 encoded, as `AlgodClient` does"""
+        res = await self._request(
+            "POST",
+            "/transactions",
+            data=base64.b64decode(txn),
+            headers={"Content-Type": "application/x-binary"},
+        )
+        return res["txId"]
+
+    async def send_transaction(self, stxn) -> str:
+        return await self.send_transactions([stxn])
+
+    async def pending_transaction_info(self, txid: str) -> dict:
+        return await self._request("GET", "/transactions/pending/{}".format(txid))
+
+    async def account_info(self, addr: str, exclude: str = None) -> dict:
+        params = {"exclude": exclude} if exclude else None
+        return await self._request("GET", "/accounts/{}".format(addr), params=params)
+
+
+class AsyncConfirmations(Confirmations):
+    """`Confirmations` that follows rounds in a task on the running event loop and
+    hands out asyncio futures"""
+
+    def __init__(self, client: AsyncAlgod, retain_rounds: int = 16):
+        super().__init__(client, retain_rounds)
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def watch(
+        self, txid: str, first_round: int, wait_rounds: int = 1000
+    ) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            future, late = self._track(txid, first_round, wait_rounds, loop.create_future)
+
+        if self._task is None:
+            self._task = loop.create_task(self._run())
+        self._wake.set()
+
+        if late:
+            loop.create_task(self._check_late(txid))
+        return future
+
+    async def wait(self, txid: str, first_round: int, wait_rounds: int = 1000) -> dict:
+        return await self.watch(txid, first_round, wait_rounds)
+
+    async def wait_group(self, signed_group: list, wait_rounds: int = 1000) -> List[dict]:
+        return await asyncio.gather(*self.watch_group(signed_group, wait_rounds))
+
+    async def execute(
+        self, atc: AtomicTransactionComposer, wait_rounds: int
+    ) -> AtomicTransactionResponse:
+        """the equivalent of `atc.execute(client, wait_rounds)` for an `AsyncAlgod`"""
+        signed = atc.gather_signatures()
+        await self.client.send_transactions(signed)
+        atc.status = AtomicTransactionComposerStatus.SUBMITTED
+        return atc_response(atc, await self.wait_group(signed, wait_rounds))
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _check_late(self, txid: str):
+        try:
+            info = await self.client.pending_transaction_info(txid)
+        except error.AlgodHTTPError:
+            return
+        if info.get("confirmed-round"):
+            self._resolve(txid, info)
+
+    async def _run(self):
+        while True:
+            if not self.waiting:
+                self._wake.clear()
+                await self._wake.wait()
+
+            try:
+                current = self.round
+                fresh, self.fresh = self.fresh, []
+                status = await self.client.status_after_block(current)
+                self._start_deadlines(fresh, status["last-round"])
+                for r in range(current + 1, status["last-round"] + 1):
+                    raw = await self.client.block_info(r, response_format="msgpack")
+                    self._process(r, raw)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._fail(e)
+
+
+class AsyncParams(Params):
+    """`Params` that follows rounds in a task on the running event loop"""
+
+    def __init__(
+        self, client: AsyncAlgod, validity: int = 1000, refresh_rounds: int = 8
+    ):
+        super().__init__(client, validity, refresh_rounds)
+        self._task = None
+
+    async def get(self, covers: int = None) -> SuggestedParams:
+        if self.cached is None:
+            sp = await self.client.suggested_params()
+            with self.lock:
+                self._store(sp)
+        else:
+            self.hits += 1
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        with self.lock:
+            return self._copy(covers)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                last = (await self.client.status_after_block(self.round))["last-round"]
+                if self._advance(last):
+                    sp = await self.client.suggested_params()
+                    with self.lock:
+                        self._store(sp)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.cached = None
+            self._task = None
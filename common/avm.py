@@ -0,0 +1,1863 @@
+import base64
+import hashlib
+import zlib
+from math import isqrt
+from typing import Dict, List, Optional
+
+from algosdk import encoding
+from Cryptodome.Hash import keccak
+
+from common.cost import op_costs
+from common.teal import Program, const_value, parse
+
+# In-process interpreter for the TEAL v6 subset PyTeal emits for the contracts in this
+# repo, along with just enough of a ledger (balances, assets, apps, global state,
+# inner transactions) to evaluate whole transaction groups without a node.
+#
+# Programs are assumed to be type correct, as PyTeal checks that at compile time.
+# Signatures are not checked, and programs are run from TEAL source: `compile` hands
+# back a handle carrying the compressed source that stands in for the bytecode on
+# ApplicationCreate, so a handle stays valid on any ledger.
+
+uint64_max = 2**64 - 1
+
+min_txn_fee = 1000
+min_balance = 100000
+max_txn_life = 1000
+max_inner_depth = 8
+max_inner_txns = 16
+app_budget = 700
+
+zero_address = bytes(32)
+
+# Raw bytecode contracts create inner apps from, by the source it assembles from. Op ups
+# (PyTeal's `OpUp` and amm/contract.py) create and delete an app that approves
+raw_programs = {bytes.fromhex("068101"): "#pragma version 6\nint 1"}
+
+# Handles are the program's version byte, this tag, then the compressed source
+handle_tag = b"avm:"
+
+type_enums = {"pay": 1, "keyreg": 2, "acfg": 3, "axfer": 4, "afrz": 5, "appl": 6}
+
+on_completions = ["NoOp", "OptIn", "CloseOut", "ClearState", "Update", "Delete"]
+noop, opt_in, close_out, clear_state, update_app, delete_app = range(6)
+
+addr_fields = {
+    "Sender",
+    "Receiver",
+    "CloseRemainderTo",
+    "AssetSender",
+    "AssetReceiver",
+    "AssetCloseTo",
+    "RekeyTo",
+    "ConfigAssetManager",
+    "ConfigAssetReserve",
+    "ConfigAssetFreeze",
+    "ConfigAssetClawback",
+    "FreezeAssetAccount",
+}
+bytes_fields = {
+    "Note",
+    "Lease",
+    "Type",
+    "GroupID",
+    "ApprovalProgram",
+    "ClearStateProgram",
+    "ConfigAssetUnitName",
+    "ConfigAssetName",
+    "ConfigAssetURL",
+    "ConfigAssetMetadataHash",
+}
+array_fields = {"ApplicationArgs", "Accounts", "Assets", "Applications", "Logs"}
+
+# msgpack (canonical, as signed and as found in blocks) -> TEAL field names
+msgpack_fields = {
+    "snd": "Sender",
+    "fee": "Fee",
+    "fv": "FirstValid",
+    "lv": "LastValid",
+    "note": "Note",
+    "lx": "Lease",
+    "grp": "GroupID",
+    "rekey": "RekeyTo",
+    "rcv": "Receiver",
+    "amt": "Amount",
+    "close": "CloseRemainderTo",
+    "xaid": "XferAsset",
+    "aamt": "AssetAmount",
+    "arcv": "AssetReceiver",
+    "aclose": "AssetCloseTo",
+    "asnd": "AssetSender",
+    "apid": "ApplicationID",
+    "apan": "OnCompletion",
+    "apap": "ApprovalProgram",
+    "apsu": "ClearStateProgram",
+    "apep": "ExtraProgramPages",
+    "caid": "ConfigAsset",
+    "faid": "FreezeAsset",
+    "fadd": "FreezeAssetAccount",
+    "afrz": "FreezeAssetFrozen",
+}
+msgpack_asset_params = {
+    "t": "ConfigAssetTotal",
+    "dc": "ConfigAssetDecimals",
+    "df": "ConfigAssetDefaultFrozen",
+    "un": "ConfigAssetUnitName",
+    "an": "ConfigAssetName",
+    "au": "ConfigAssetURL",
+    "am": "ConfigAssetMetadataHash",
+    "m": "ConfigAssetManager",
+    "r": "ConfigAssetReserve",
+    "f": "ConfigAssetFreeze",
+    "c": "ConfigAssetClawback",
+}
+
+# asset_params_get field -> key in the asset params we keep
+asset_param_fields = {
+    "AssetTotal": "ConfigAssetTotal",
+    "AssetDecimals": "ConfigAssetDecimals",
+    "AssetDefaultFrozen": "ConfigAssetDefaultFrozen",
+    "AssetUnitName": "ConfigAssetUnitName",
+    "AssetName": "ConfigAssetName",
+    "AssetURL": "ConfigAssetURL",
+    "AssetMetadataHash": "ConfigAssetMetadataHash",
+    "AssetManager": "ConfigAssetManager",
+    "AssetReserve": "ConfigAssetReserve",
+    "AssetFreeze": "ConfigAssetFreeze",
+    "AssetClawback": "ConfigAssetClawback",
+    "AssetCreator": "Creator",
+}
+
+
+class AVMError(Exception):
+    pass
+
+
+def app_address(app_id: int) -> bytes:
+    return encoding.checksum(b"appID" + app_id.to_bytes(8, "big"))
+
+
+def fields_from_msgpack(d: dict) -> dict:
+    """converts a transaction in its canonical msgpack dict form to TEAL field names"""
+    f = {}
+    for k, v in d.items():
+        name = msgpack_fields.get(k)
+        if name is not None:
+            f[name] = v
+        elif k == "type":
+            f["Type"] = v.encode() if isinstance(v, str) else v
+            f["TypeEnum"] = type_enums[f["Type"].decode()]
+        elif k == "apaa":
+            f["ApplicationArgs"] = list(v)
+        elif k == "apat":
+            f["Accounts"] = list(v)
+        elif k == "apas":
+            f["Assets"] = list(v)
+        elif k == "apfa":
+            f["Applications"] = list(v)
+        elif k == "apar":
+            for pk, pv in v.items():
+                f[msgpack_asset_params[pk]] = pv.encode() if isinstance(pv, str) else pv
+        elif k == "apgs":
+            f["GlobalNumUint"] = v.get("nui", 0)
+            f["GlobalNumByteSlice"] = v.get("nbs", 0)
+        elif k == "apls":
+            f["LocalNumUint"] = v.get("nui", 0)
+            f["LocalNumByteSlice"] = v.get("nbs", 0)
+
+    # Accounts and Applications carry the implicit 0th entry the AVM sees
+    f["Accounts"] = [f.get("Sender", zero_address)] + f.get("Accounts", [])
+    f["Applications"] = [f.get("ApplicationID", 0)] + f.get("Applications", [])
+    return f
+
+
+_msgpack_keys = {v: k for k, v in msgpack_fields.items()}
+_msgpack_asset_param_keys = {v: k for k, v in msgpack_asset_params.items()}
+
+
+def fields_to_msgpack(f: dict) -> dict:
+    """the inverse of fields_from_msgpack, zero values are omitted as in the canonical encoding"""
+    d = {}
+    for name, v in f.items():
+        if not v:
+            continue
+        key = _msgpack_keys.get(name)
+        if key is not None:
+            d[key] = v
+        elif name in _msgpack_asset_param_keys:
+            d.setdefault("apar", {})[_msgpack_asset_param_keys[name]] = v
+        elif name == "Type":
+            d["type"] = v.decode()
+        elif name == "ApplicationArgs":
+            d["apaa"] = list(v)
+        elif name == "Assets":
+            d["apas"] = list(v)
+        elif name in ("Accounts", "Applications") and len(v) > 1:
+            d["apat" if name == "Accounts" else "apfa"] = list(v[1:])
+        elif name in ("GlobalNumUint", "GlobalNumByteSlice"):
+            d.setdefault("apgs", {})["nui" if name.endswith("Uint") else "nbs"] = v
+        elif name in ("LocalNumUint", "LocalNumByteSlice"):
+            d.setdefault("apls", {})["nui" if name.endswith("Uint") else "nbs"] = v
+
+    for k in ("apar", "apgs", "apls"):
+        if k in d:
+            d[k] = dict(sorted(d[k].items()))
+    return dict(sorted(d.items()))
+
+
+def as_fields(txn) -> dict:
+    """accepts an algosdk (Signed)Transaction or its msgpack dict"""
+    if hasattr(txn, "transaction"):
+        txn = txn.transaction
+    if hasattr(txn, "dictify"):
+        f = fields_from_msgpack(txn.dictify())
+        f["_txn"] = txn
+        return f
+    if "txn" in txn:
+        txn = txn["txn"]
+    return fields_from_msgpack(txn)
+
+
+def _raw_txid(txn) -> bytes:
+    return base64.b32decode(txn.get_txid() + "====")
+
+
+def get_field(f: dict, name: str):
+    v = f.get(name)
+    if v is not None:
+        return v
+
+    if name in addr_fields:
+        return zero_address
+    if name in bytes_fields:
+        return b""
+    if name in array_fields:
+        return []
+    if name == "TxID":
+        return _raw_txid(f["_txn"]) if "_txn" in f else bytes(32)
+    if name == "NumAppArgs":
+        return len(f.get("ApplicationArgs", ()))
+    if name == "NumAccounts":
+        return len(f.get("Accounts", ())) - 1
+    if name == "NumAssets":
+        return len(f.get("Assets", ()))
+    if name == "NumApplications":
+        return len(f.get("Applications", ())) - 1
+    if name == "NumLogs":
+        return len(f.get("Logs", ()))
+    if name == "LastLog":
+        logs = f.get("Logs")
+        return logs[-1] if logs else b""
+    return 0
+
+
+class TxnResult:
+    """What applying a single transaction produced"""
+
+    __slots__ = ("fields", "logs", "inner", "created_app", "created_asset", "cost")
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+        self.logs: List[bytes] = []
+        self.inner: List["TxnResult"] = []
+        self.created_app: Optional[int] = None
+        self.created_asset: Optional[int] = None
+        self.cost = 0
+
+
+class App:
+    __slots__ = ("approval", "clear", "creator", "global_schema", "local_schema", "pages")
+
+    def __init__(self, approval, clear, creator, global_schema, local_schema, pages):
+        self.approval = approval
+        self.clear = clear
+        self.creator = creator
+        self.global_schema = global_schema
+        self.local_schema = local_schema
+        self.pages = pages
+
+
+_missing = object()
+
+
+class Ledger:
+    """In memory ledger that evaluates transaction groups atomically"""
+
+    def __init__(self, round: int = 1, timestamp: int = 0, first_id: int = 1000):
+        self.round = round
+        self.timestamp = timestamp
+
+        self.balances: Dict[bytes, int] = {}
+        self.holdings: Dict[tuple, int] = {}  # (addr, asset id) -> amount
+        self.assets: Dict[int, dict] = {}
+        self.apps: Dict[int, App] = {}
+        self.globals: Dict[int, dict] = {}
+        self.locals: Dict[tuple, dict] = {}  # (addr, app id) -> state
+        self.asset_counts: Dict[bytes, int] = {}
+        self.min_balance_extra: Dict[bytes, int] = {}
+        self.next_id = first_id
+
+        # Programs by the bytecode handle we gave out for them
+        self.programs: Dict[bytes, Program] = {}
+
+        self._journal = None
+        self._touched = None
+        self._fee_credit = 0
+        self.budget = 0
+
+    # Journaled writes so a failed group can be rolled back
+
+    def _put(self, table: dict, key, value):
+        if self._journal is not None:
+            self._journal.append((table, key, table.get(key, _missing)))
+        table[key] = value
+
+    def _del(self, table: dict, key):
+        if key not in table:
+            return
+        if self._journal is not None:
+            self._journal.append((table, key, table[key]))
+        del table[key]
+
+    def _rollback(self):
+        for table, key, old in reversed(self._journal):
+            if old is _missing:
+                table.pop(key, None)
+            else:
+                table[key] = old
+
+    def _new_id(self) -> int:
+        if self._journal is not None:
+            self._journal.append((self.__dict__, "next_id", self.next_id))
+        self.next_id += 1
+        return self.next_id
+
+    # Setup helpers
+
+    def compile(self, src: str) -> bytes:
+        """parses TEAL source, returns a handle to pass as the program bytes"""
+        handle = program_handle(src)
+        self.programs[handle] = compile_program(src)
+        return handle
+
+    def program(self, handle: bytes) -> Optional[Program]:
+        """looks up the program behind a handle, including ones issued by another ledger"""
+        program = self.programs.get(handle)
+        if program is None and handle in raw_programs:
+            program = self.programs[handle] = compile_program(raw_programs[handle])
+        elif program is None and is_handle(handle):
+            try:
+                src = zlib.decompress(handle[1 + len(handle_tag) :]).decode()
+            except (zlib.error, UnicodeDecodeError):
+                return None
+            program = self.programs[handle] = compile_program(src)
+        return program
+
+    def fund(self, addr, amount: int):
+        addr = _addr(addr)
+        self.balances[addr] = self.balances.get(addr, 0) + amount
+
+    def advance(self, rounds: int = 1, seconds: int = 0):
+        self.round += rounds
+        self.timestamp += seconds
+
+    # Queries
+
+    def balance(self, addr) -> int:
+        return self.balances.get(_addr(addr), 0)
+
+    def holding(self, addr, asset_id: int) -> Optional[int]:
+        return self.holdings.get((_addr(addr), asset_id))
+
+    def global_state(self, app_id: int) -> dict:
+        return dict(self.globals.get(app_id, {}))
+
+    def min_balance(self, addr: bytes) -> int:
+        return (
+            min_balance
+            + min_balance * self.asset_counts.get(addr, 0)
+            + self.min_balance_extra.get(addr, 0)
+        )
+
+    # Evaluation
+
+    def apply_group(self, txns: list) -> List[TxnResult]:
+        group = [as_fields(t) for t in txns]
+        if not 0 < len(group) <= 16:
+            raise AVMError("Group size must be between 1 and 16")
+
+        for gi, f in enumerate(group):
+            f["GroupIndex"] = gi
+
+        self._journal = []
+        self._touched = set()
+        self._fee_credit = sum(f.get("Fee", 0) for f in group) - min_txn_fee * len(
+            group
+        )
+        self.budget = app_budget * sum(1 for f in group if f["TypeEnum"] == 6)
+        try:
+            if self._fee_credit < 0:
+                raise AVMError("Group fees are below the minimum")
+
+            results = []
+            for f in group:
+                fv, lv = f.get("FirstValid", 0), f.get("LastValid", 0)
+                if lv and not fv <= self.round + 1 <= lv:
+                    raise AVMError("Transaction is outside its validity window")
+                results.append(self._apply(f, group, None, 0))
+
+            for addr in self._touched:
+                bal = self.balances.get(addr, 0)
+                if bal < self.min_balance(addr) and (
+                    bal or self.asset_counts.get(addr, 0)
+                ):
+                    raise AVMError(
+                        "{} below min balance".format(encoding.encode_address(addr))
+                    )
+        except Exception:
+            self._rollback()
+            raise
+        finally:
+            self._journal = None
+            self._touched = None
+
+        return results
+
+    def _debit(self, addr: bytes, amount: int):
+        bal = self.balances.get(addr, 0)
+        if bal < amount:
+            raise AVMError(
+                "{} has {} microalgos, needs {}".format(
+                    encoding.encode_address(addr), bal, amount
+                )
+            )
+        self._put(self.balances, addr, bal - amount)
+        self._touched.add(addr)
+
+    def _credit(self, addr: bytes, amount: int):
+        self._put(self.balances, addr, self.balances.get(addr, 0) + amount)
+        self._touched.add(addr)
+
+    def _apply(self, f: dict, group: list, caller: Optional[int], depth: int):
+        result = TxnResult(f)
+        sender = f.get("Sender", zero_address)
+        self._debit(sender, f.get("Fee", 0))
+
+        te = f["TypeEnum"]
+        if te == 1:
+            self._pay(f, sender)
+        elif te == 4:
+            self._axfer(f, sender)
+        elif te == 3:
+            self._acfg(f, sender, result)
+        elif te == 6:
+            self._appl(f, group, sender, result, depth)
+        else:
+            raise AVMError("Unsupported transaction type {}".format(f["Type"]))
+
+        return result
+
+    def _pay(self, f: dict, sender: bytes):
+        amt = f.get("Amount", 0)
+        self._debit(sender, amt)
+        self._credit(f.get("Receiver", zero_address), amt)
+
+        close = f.get("CloseRemainderTo")
+        if close:
+            if self.asset_counts.get(sender, 0):
+                raise AVMError("Cannot close an account still holding assets")
+            self._credit(close, self.balances.get(sender, 0))
+            self._del(self.balances, sender)
+
+    def _axfer(self, f: dict, sender: bytes):
+        aid = f.get("XferAsset", 0)
+        if aid not in self.assets:
+            raise AVMError("Asset {} does not exist".format(aid))
+
+        rcv = f.get("AssetReceiver", zero_address)
+        amt = f.get("AssetAmount", 0)
+        source = f.get("AssetSender") or sender
+        if f.get("AssetSender") and self.assets[aid].get("ConfigAssetClawback") != sender:
+            raise AVMError("Only the clawback account can revoke")
+
+        # Opt in
+        if source == rcv and amt == 0 and (rcv, aid) not in self.holdings:
+            self._put(self.holdings, (rcv, aid), 0)
+            self._put(self.asset_counts, rcv, self.asset_counts.get(rcv, 0) + 1)
+            self._touched.add(rcv)
+            return
+
+        have = self.holdings.get((source, aid))
+        if have is None:
+            raise AVMError("Sender is not opted in to asset {}".format(aid))
+        if (rcv, aid) not in self.holdings:
+            raise AVMError("Receiver is not opted in to asset {}".format(aid))
+        if have < amt:
+            raise AVMError("Asset {} underflow, {} < {}".format(aid, have, amt))
+
+        self._put(self.holdings, (source, aid), have - amt)
+        self._put(self.holdings, (rcv, aid), self.holdings[(rcv, aid)] + amt)
+
+        close = f.get("AssetCloseTo")
+        if close:
+            rest = self.holdings[(source, aid)]
+            if (close, aid) not in self.holdings:
+                raise AVMError("Close to account is not opted in")
+            self._put(self.holdings, (close, aid), self.holdings[(close, aid)] + rest)
+            self._del(self.holdings, (source, aid))
+            self._put(self.asset_counts, source, self.asset_counts[source] - 1)
+
+    def _acfg(self, f: dict, sender: bytes, result: TxnResult):
+        if f.get("ConfigAsset"):
+            raise AVMError("Only asset creation is supported")
+
+        aid = self._new_id()
+        params = {k: v for k, v in f.items() if k.startswith("ConfigAsset")}
+        params["Creator"] = sender
+        self._put(self.assets, aid, params)
+        self._put(self.holdings, (sender, aid), f.get("ConfigAssetTotal", 0))
+        self._put(self.asset_counts, sender, self.asset_counts.get(sender, 0) + 1)
+        result.created_asset = aid
+        f["CreatedAssetID"] = aid
+
+    def _appl(self, f: dict, group: list, sender: bytes, result, depth: int):
+        app_id = f.get("ApplicationID", 0)
+        oc = f.get("OnCompletion", noop)
+
+        if app_id == 0:
+            approval = self.program(f.get("ApprovalProgram"))
+            clear = self.program(f.get("ClearStateProgram"))
+            if approval is None or clear is None:
+                raise AVMError("Programs must come from Ledger.compile")
+
+            app_id = self._new_id()
+            gs = (f.get("GlobalNumUint", 0), f.get("GlobalNumByteSlice", 0))
+            ls = (f.get("LocalNumUint", 0), f.get("LocalNumByteSlice", 0))
+            pages = f.get("ExtraProgramPages", 0)
+            self._put(self.apps, app_id, App(approval, clear, sender, gs, ls, pages))
+            self._put(self.globals, app_id, {})
+            self._put(
+                self.min_balance_extra,
+                sender,
+                self.min_balance_extra.get(sender, 0)
+                + min_balance * (1 + pages)
+                + 28500 * gs[0]
+                + 50000 * gs[1],
+            )
+            result.created_app = app_id
+            f["CreatedApplicationID"] = app_id
+        elif app_id not in self.apps:
+            raise AVMError("App {} does not exist".format(app_id))
+
+        app = self.apps[app_id]
+        if oc == opt_in:
+            key = (sender, app_id)
+            if key in self.locals:
+                raise AVMError("Already opted in to {}".format(app_id))
+            self._put(self.locals, key, {})
+
+        program = app.clear if oc == clear_state else app.approval
+        ok = Eval(self, program, f, group, app_id, result, depth).run()
+
+        if oc == clear_state:
+            self._del(self.locals, (sender, app_id))
+        elif not ok:
+            raise AVMError("App {} rejected the transaction".format(app_id))
+        elif oc == close_out:
+            self._del(self.locals, (sender, app_id))
+        elif oc == update_app:
+            approval = self.program(f.get("ApprovalProgram"))
+            clear = self.program(f.get("ClearStateProgram"))
+            if approval is None or clear is None:
+                raise AVMError("Programs must come from Ledger.compile")
+            updated = App(
+                approval, clear, app.creator, app.global_schema, app.local_schema, app.pages
+            )
+            self._put(self.apps, app_id, updated)
+        elif oc == delete_app:
+            self._del(self.apps, app_id)
+            self._del(self.globals, app_id)
+
+        if app_id in self.globals:
+            _check_schema(self.globals[app_id], app.global_schema)
+
+        f["Logs"] = result.logs
+
+    def submit_inner(self, ev: "Eval", group: List[dict]) -> List[TxnResult]:
+        if ev.depth + 1 > max_inner_depth:
+            raise AVMError("Inner transactions nested too deep")
+
+        results = []
+        for gi, f in enumerate(group):
+            f["GroupIndex"] = gi
+            f["Accounts"] = [f.get("Sender", zero_address)] + f.get("Accounts", [])
+            f["Applications"] = [f.get("ApplicationID", 0)] + f.get("Applications", [])
+
+            if "Fee" not in f:
+                # Default to whatever the pooled fee credit can cover
+                f["Fee"] = 0 if self._fee_credit >= min_txn_fee else min_txn_fee
+            self._fee_credit += f["Fee"] - min_txn_fee
+            if self._fee_credit < 0:
+                raise AVMError("Inner transaction fee is below the minimum")
+
+            if f["TypeEnum"] == 6:
+                self.budget += app_budget
+
+            results.append(self._apply(f, group, ev.app_id, ev.depth + 1))
+        return results
+
+    def account_info(self, addr) -> dict:
+        """account state in the shape algod's /v2/accounts/{address} returns"""
+        raw = _addr(addr)
+        assets = [
+            {"asset-id": aid, "amount": amt, "is-frozen": False}
+            for (holder, aid), amt in self.holdings.items()
+            if holder == raw
+        ]
+        return {
+            "address": encoding.encode_address(raw),
+            "amount": self.balances.get(raw, 0),
+            "min-balance": self.min_balance(raw),
+            "round": self.round,
+            "assets": assets,
+            "created-apps": [
+                {"id": app_id} for app_id, app in self.apps.items() if app.creator == raw
+            ],
+            "created-assets": [
+                {"index": aid}
+                for aid, params in self.assets.items()
+                if params["Creator"] == raw
+            ],
+            "status": "Offline",
+        }
+
+    def application_info(self, app_id: int) -> dict:
+        """app params in the shape algod's /v2/applications/{id} returns"""
+        app = self.apps.get(app_id)
+        if app is None:
+            raise AVMError("application does not exist")
+        # Programs are kept compiled, the bytes they were created from are the handles
+        handles = {id(p): h for h, p in self.programs.items()}
+        return {
+            "id": app_id,
+            "params": {
+                "creator": encoding.encode_address(app.creator),
+                "approval-program": base64.b64encode(
+                    handles.get(id(app.approval), b"")
+                ).decode(),
+                "clear-state-program": base64.b64encode(
+                    handles.get(id(app.clear), b"")
+                ).decode(),
+                "global-state-schema": {
+                    "num-uint": app.global_schema[0],
+                    "num-byte-slice": app.global_schema[1],
+                },
+                "local-state-schema": {
+                    "num-uint": app.local_schema[0],
+                    "num-byte-slice": app.local_schema[1],
+                },
+                "global-state": [
+                    {"key": base64.b64encode(k).decode(), "value": _tealvalue(v)}
+                    for k, v in sorted(self.globals.get(app_id, {}).items())
+                ],
+            },
+        }
+
+
+def _tealvalue(v) -> dict:
+    if isinstance(v, int):
+        return {"type": 2, "uint": v, "bytes": ""}
+    return {"type": 1, "uint": 0, "bytes": base64.b64encode(v).decode()}
+
+
+def _addr(addr) -> bytes:
+    return encoding.decode_address(addr) if isinstance(addr, str) else addr
+
+
+def _check_schema(state: dict, schema: tuple):
+    uints = sum(1 for v in state.values() if isinstance(v, int))
+    if uints > schema[0] or len(state) - uints > schema[1]:
+        raise AVMError("Global state exceeds schema {}".format(schema))
+
+
+class _Return(Exception):
+    def __init__(self, ok: bool):
+        self.ok = ok
+
+
+class Eval:
+    """A single run of an approval or clear program"""
+
+    __slots__ = (
+        "ledger",
+        "program",
+        "txn",
+        "group",
+        "app_id",
+        "app_addr",
+        "result",
+        "depth",
+        "stack",
+        "scratch",
+        "frames",
+        "inner",
+        "last_inner",
+        "created_assets",
+    )
+
+    def __init__(self, ledger, program, txn, group, app_id, result, depth):
+        self.ledger = ledger
+        self.program = program
+        self.txn = txn
+        self.group = group
+        self.app_id = app_id
+        self.app_addr = app_address(app_id)
+        self.result = result
+        self.depth = depth
+        self.stack = []
+        self.scratch = [0] * 256
+        self.frames = []
+        self.inner = None
+        self.last_inner: List[TxnResult] = []
+        self.created_assets = set()
+
+    def run(self) -> bool:
+        code = self.program.code
+        costs = self.program.costs
+        n = len(code)
+        ledger = self.ledger
+        pc = 0
+        spent = 0
+        try:
+            while pc < n:
+                fn = code[pc]
+                spent += costs[pc]
+                pc += 1
+                nxt = fn(self)
+                if nxt is not None:
+                    pc = nxt
+                if spent > ledger.budget:
+                    raise AVMError("Dynamic cost budget exceeded")
+        except _Return as r:
+            ledger.budget -= spent
+            self.result.cost += spent
+            return r.ok
+        except AVMError as e:
+            raise AVMError("{} at line {}".format(e, self._line(pc))) from None
+        except IndexError:
+            raise AVMError("Stack underflow at line {}".format(self._line(pc))) from None
+        except (TypeError, ValueError, OverflowError) as e:
+            raise AVMError("{} at line {}".format(e, self._line(pc))) from None
+
+        ledger.budget -= spent
+        self.result.cost += spent
+        if len(self.stack) != 1:
+            raise AVMError("Stack must hold exactly one value at the end of the program")
+        return self.stack[0] != 0
+
+    def caller_id(self) -> int:
+        return self.txn.get("_caller", 0)
+
+    def _line(self, pc: int) -> int:
+        ops = self.program.ops
+        return ops[max(0, min(pc, len(ops)) - 1)].line
+
+    # Resource lookups, following the v4+ rules of accepting either an offset into the
+    # foreign arrays or a value that appears in them
+
+    def account(self, ref) -> bytes:
+        accounts = self.txn["Accounts"]
+        if isinstance(ref, int):
+            if ref >= len(accounts):
+                raise AVMError("Invalid Accounts index {}".format(ref))
+            return accounts[ref]
+        if ref in accounts or ref == self.app_addr:
+            return ref
+        for app_id in self.txn["Applications"][1:]:
+            if app_address(app_id) == ref:
+                return ref
+        raise AVMError("Unavailable account {}".format(encoding.encode_address(ref)))
+
+    def asset(self, ref: int) -> int:
+        assets = self.txn.get("Assets", ())
+        if ref in assets or ref in self.created_assets:
+            return ref
+        if ref < len(assets):
+            return assets[ref]
+        raise AVMError("Unavailable asset {}".format(ref))
+
+    def application(self, ref: int) -> int:
+        apps = self.txn["Applications"]
+        if ref == 0:
+            return self.app_id
+        if ref in apps:
+            return ref
+        if ref < len(apps):
+            return apps[ref]
+        raise AVMError("Unavailable application {}".format(ref))
+
+
+class CompiledProgram:
+    def __init__(self, program: Program, code: list, costs: list):
+        self.version = program.version
+        self.ops = program.ops
+        self.code = code
+        self.costs = costs
+
+
+_compiled: Dict[str, CompiledProgram] = {}
+
+
+def compile_program(src: str) -> CompiledProgram:
+    """parses TEAL source into a list of handlers, cached by source text"""
+    if src in _compiled:
+        return _compiled[src]
+
+    program = parse(src)
+    code, costs = [], []
+    for i, op in enumerate(program.ops):
+        factory = _ops.get(op.op)
+        if factory is None:
+            raise AVMError("Unsupported op {} at line {}".format(op.op, op.line))
+        code.append(factory(op.args, program, i))
+        costs.append(op_costs.get(op.op, 1))
+
+    compiled = CompiledProgram(program, code, costs)
+    _compiled[src] = compiled
+    return compiled
+
+
+def program_handle(src: str) -> bytes:
+    """the handle `Ledger.compile` gives out for `src`"""
+    program = compile_program(src)
+    return bytes([program.version]) + handle_tag + zlib.compress(src.encode())
+
+
+def is_handle(program: bytes) -> bool:
+    """whether `program` is a handle standing in for bytecode, rather than bytecode"""
+    return program[1 : 1 + len(handle_tag)] == handle_tag
+
+
+# Op handlers
+#
+# Each factory takes the op's immediates and returns a handler. Handlers mutate the
+# Eval's stack and return the next pc when they branch.
+
+_ops = {}
+
+
+def _simple(*names):
+    """registers a handler that takes no immediates"""
+
+    def wrap(fn):
+        for name in names:
+            _ops[name] = lambda args, program, i, fn=fn: fn
+        return fn
+
+    return wrap
+
+
+def _factory(*names):
+    def wrap(fn):
+        for name in names:
+            _ops[name] = fn
+        return fn
+
+    return wrap
+
+
+def _check(v: int) -> int:
+    if v > uint64_max:
+        raise AVMError("Overflow")
+    return v
+
+
+@_factory("int", "pushint", "byte", "pushbytes", "addr", "method")
+def _const(args, program, i):
+    val = const_value(program.ops[i])
+
+    def push(ev):
+        ev.stack.append(val)
+
+    return push
+
+
+@_simple("+")
+def _add(ev):
+    s = ev.stack
+    b = s.pop()
+    r = s[-1] + b
+    if r > uint64_max:
+        raise AVMError("+ overflowed")
+    s[-1] = r
+
+
+@_simple("-")
+def _sub(ev):
+    s = ev.stack
+    b = s.pop()
+    a = s[-1]
+    if b > a:
+        raise AVMError("- would result negative")
+    s[-1] = a - b
+
+
+@_simple("*")
+def _mul(ev):
+    s = ev.stack
+    b = s.pop()
+    r = s[-1] * b
+    if r > uint64_max:
+        raise AVMError("* overflowed")
+    s[-1] = r
+
+
+@_simple("/")
+def _div(ev):
+    s = ev.stack
+    b = s.pop()
+    if b == 0:
+        raise AVMError("/ 0")
+    s[-1] //= b
+
+
+@_simple("%")
+def _mod(ev):
+    s = ev.stack
+    b = s.pop()
+    if b == 0:
+        raise AVMError("% 0")
+    s[-1] %= b
+
+
+def _binary(name, fn):
+    def handler(ev):
+        s = ev.stack
+        b = s.pop()
+        s[-1] = fn(s[-1], b)
+
+    _ops[name] = lambda args, program, i: handler
+
+
+_binary("<", lambda a, b: int(a < b))
+_binary(">", lambda a, b: int(a > b))
+_binary("<=", lambda a, b: int(a <= b))
+_binary(">=", lambda a, b: int(a >= b))
+_binary("==", lambda a, b: int(a == b))
+_binary("!=", lambda a, b: int(a != b))
+_binary("&&", lambda a, b: int(a != 0 and b != 0))
+_binary("||", lambda a, b: int(a != 0 or b != 0))
+_binary("&", lambda a, b: a & b)
+_binary("|", lambda a, b: a | b)
+_binary("^", lambda a, b: a ^ b)
+_binary("shl", lambda a, b: (a << b) & uint64_max)
+_binary("shr", lambda a, b: a >> b)
+_binary("exp", lambda a, b: _exp(a, b))
+_binary("concat", lambda a, b: _bytes_len(a + b))
+_binary("getbyte", lambda a, b: a[b])
+_binary("getbit", lambda a, b: _getbit(a, b))
+
+
+def _fail(msg):
+    raise AVMError(msg)
+
+
+def _exp(a: int, b: int) -> int:
+    if a == 0 and b == 0:
+        raise AVMError("0^0 is undefined")
+    if a > 1 and b >= 64:
+        raise AVMError("exp overflowed")
+    return _check(a**b)
+
+
+def _bytes_len(b: bytes) -> bytes:
+    if len(b) > 4096:
+        raise AVMError("Byte string exceeds 4096 bytes")
+    return b
+
+
+def _getbit(a, b):
+    if isinstance(a, int):
+        if b > 63:
+            raise AVMError("getbit index out of range")
+        return (a >> b) & 1
+    return (a[b // 8] >> (7 - b % 8)) & 1
+
+
+@_simple("!")
+def _not(ev):
+    ev.stack[-1] = int(ev.stack[-1] == 0)
+
+
+@_simple("~")
+def _bitnot(ev):
+    ev.stack[-1] = ev.stack[-1] ^ uint64_max
+
+
+@_simple("sqrt")
+def _sqrt(ev):
+    ev.stack[-1] = isqrt(ev.stack[-1])
+
+
+@_simple("bsqrt")
+def _bsqrt(ev):
+    v = ev.stack[-1]
+    if len(v) > 64:
+        raise AVMError("bsqrt input is over 64 bytes")
+    r = isqrt(int.from_bytes(v, "big"))
+    ev.stack[-1] = r.to_bytes((r.bit_length() + 7) // 8, "big")
+
+
+@_simple("bitlen")
+def _bitlen(ev):
+    v = ev.stack[-1]
+    ev.stack[-1] = v.bit_length() if isinstance(v, int) else int.from_bytes(v, "big").bit_length()
+
+
+@_simple("mulw")
+def _mulw(ev):
+    s = ev.stack
+    b = s.pop()
+    r = s[-1] * b
+    s[-1] = r >> 64
+    s.append(r & uint64_max)
+
+
+@_simple("addw")
+def _addw(ev):
+    s = ev.stack
+    b = s.pop()
+    r = s[-1] + b
+    s[-1] = r >> 64
+    s.append(r & uint64_max)
+
+
+@_simple("divmodw")
+def _divmodw(ev):
+    s = ev.stack
+    dlo, dhi = s.pop(), s.pop()
+    lo, hi = s.pop(), s.pop()
+    d = (dhi << 64) | dlo
+    if d == 0:
+        raise AVMError("divmodw 0")
+    q, r = divmod((hi << 64) | lo, d)
+    s.extend([q >> 64, q & uint64_max, r >> 64, r & uint64_max])
+
+
+@_simple("divw")
+def _divw(ev):
+    s = ev.stack
+    d, lo, hi = s.pop(), s.pop(), s[-1]
+    if d == 0:
+        raise AVMError("divw 0")
+    q = ((hi << 64) | lo) // d
+    if q > uint64_max:
+        raise AVMError("divw overflowed")
+    s[-1] = q
+
+
+@_simple("expw")
+def _expw(ev):
+    s = ev.stack
+    b = s.pop()
+    r = s[-1] ** b
+    if r >> 128:
+        raise AVMError("expw overflowed")
+    s[-1] = r >> 64
+    s.append(r & uint64_max)
+
+
+@_simple("itob")
+def _itob(ev):
+    ev.stack[-1] = ev.stack[-1].to_bytes(8, "big")
+
+
+@_simple("btoi")
+def _btoi(ev):
+    b = ev.stack[-1]
+    if len(b) > 8:
+        raise AVMError("btoi arg too long")
+    ev.stack[-1] = int.from_bytes(b, "big")
+
+
+@_simple("len")
+def _len(ev):
+    ev.stack[-1] = len(ev.stack[-1])
+
+
+@_simple("bzero")
+def _bzero(ev):
+    ev.stack[-1] = _bytes_len(bytes(ev.stack[-1]))
+
+
+def _slice(b: bytes, start: int, end: int) -> bytes:
+    if start > end or end > len(b):
+        raise AVMError("Substring out of range")
+    return b[start:end]
+
+
+@_factory("substring")
+def _substring(args, program, i):
+    start, end = int(args[0]), int(args[1])
+
+    def handler(ev):
+        ev.stack[-1] = _slice(ev.stack[-1], start, end)
+
+    return handler
+
+
+@_simple("substring3")
+def _substring3(ev):
+    s = ev.stack
+    end, start = s.pop(), s.pop()
+    s[-1] = _slice(s[-1], start, end)
+
+
+@_factory("extract")
+def _extract(args, program, i):
+    start, length = int(args[0]), int(args[1])
+
+    def handler(ev):
+        b = ev.stack[-1]
+        ev.stack[-1] = _slice(b, start, len(b) if length == 0 else start + length)
+
+    return handler
+
+
+@_simple("extract3")
+def _extract3(ev):
+    s = ev.stack
+    length, start = s.pop(), s.pop()
+    s[-1] = _slice(s[-1], start, start + length)
+
+
+def _extract_uint(width):
+    def handler(ev):
+        s = ev.stack
+        start = s.pop()
+        s[-1] = int.from_bytes(_slice(s[-1], start, start + width), "big")
+
+    return handler
+
+
+for _width in (2, 4, 8):
+    _ops["extract_uint{}".format(_width * 8)] = (
+        lambda args, program, i, h=_extract_uint(_width): h
+    )
+
+
+@_simple("setbyte")
+def _setbyte(ev):
+    s = ev.stack
+    val, idx = s.pop(), s.pop()
+    b = bytearray(s[-1])
+    if val > 255:
+        raise AVMError("setbyte value > 255")
+    b[idx] = val
+    s[-1] = bytes(b)
+
+
+@_simple("setbit")
+def _setbit(ev):
+    s = ev.stack
+    val, idx = s.pop(), s.pop()
+    target = s[-1]
+    if val > 1:
+        raise AVMError("setbit value > 1")
+    if isinstance(target, int):
+        if idx > 63:
+            raise AVMError("setbit index out of range")
+        s[-1] = target | (1 << idx) if val else target & ~(1 << idx)
+    else:
+        b = bytearray(target)
+        mask = 1 << (7 - idx % 8)
+        b[idx // 8] = b[idx // 8] | mask if val else b[idx // 8] & ~mask
+        s[-1] = bytes(b)
+
+
+def _bytes_math(name, fn, result_is_bytes=True):
+    def handler(ev):
+        s = ev.stack
+        b = int.from_bytes(s.pop(), "big")
+        a = int.from_bytes(s[-1], "big")
+        r = fn(a, b)
+        if result_is_bytes:
+            if r < 0:
+                raise AVMError("{} would result negative".format(name))
+            r = r.to_bytes(max(1, (r.bit_length() + 7) // 8), "big") if r else b""
+        s[-1] = r
+
+    _ops[name] = lambda args, program, i: handler
+
+
+_bytes_math("b+", lambda a, b: a + b)
+_bytes_math("b-", lambda a, b: a - b)
+_bytes_math("b*", lambda a, b: a * b)
+_bytes_math("b/", lambda a, b: a // b if b else _fail("b/ 0"))
+_bytes_math("b%", lambda a, b: a % b if b else _fail("b% 0"))
+_bytes_math("b==", lambda a, b: int(a == b), False)
+_bytes_math("b!=", lambda a, b: int(a != b), False)
+_bytes_math("b<", lambda a, b: int(a < b), False)
+_bytes_math("b>", lambda a, b: int(a > b), False)
+_bytes_math("b<=", lambda a, b: int(a <= b), False)
+_bytes_math("b>=", lambda a, b: int(a >= b), False)
+
+
+def _hash(fn):
+    def handler(ev):
+        ev.stack[-1] = fn(ev.stack[-1])
+
+    return lambda args, program, i: handler
+
+
+_ops["sha256"] = _hash(lambda b: hashlib.sha256(b).digest())
+_ops["sha512_256"] = _hash(encoding.checksum)
+_ops["keccak256"] = _hash(lambda b: keccak.new(data=b, digest_bits=256).digest())
+
+
+# Stack manipulation
+
+
+@_simple("pop")
+def _pop(ev):
+    ev.stack.pop()
+
+
+@_simple("dup")
+def _dup(ev):
+    ev.stack.append(ev.stack[-1])
+
+
+@_simple("dup2")
+def _dup2(ev):
+    ev.stack.extend(ev.stack[-2:])
+
+
+@_simple("swap")
+def _swap(ev):
+    s = ev.stack
+    s[-1], s[-2] = s[-2], s[-1]
+
+
+@_simple("select")
+def _select(ev):
+    s = ev.stack
+    c, b = s.pop(), s.pop()
+    if c != 0:
+        s[-1] = b
+
+
+@_factory("dig")
+def _dig(args, program, i):
+    n = int(args[0]) + 1
+
+    def handler(ev):
+        ev.stack.append(ev.stack[-n])
+
+    return handler
+
+
+@_factory("cover")
+def _cover(args, program, i):
+    n = int(args[0])
+
+    def handler(ev):
+        s = ev.stack
+        s.insert(len(s) - 1 - n, s.pop())
+
+    return handler
+
+
+@_factory("uncover")
+def _uncover(args, program, i):
+    n = int(args[0])
+
+    def handler(ev):
+        s = ev.stack
+        s.append(s.pop(len(s) - 1 - n))
+
+    return handler
+
+
+# Flow control
+
+
+@_simple("err")
+def _err(ev):
+    raise AVMError("err opcode executed")
+
+
+@_simple("return")
+def _return(ev):
+    raise _Return(ev.stack[-1] != 0)
+
+
+@_simple("assert")
+def _assert(ev):
+    if ev.stack.pop() == 0:
+        raise AVMError("assert failed")
+
+
+def _target(program, label):
+    if label not in program.labels:
+        raise AVMError("Unknown label {}".format(label))
+    return program.labels[label]
+
+
+@_factory("b")
+def _b(args, program, i):
+    target = _target(program, args[0])
+    return lambda ev: target
+
+
+@_factory("bz")
+def _bz(args, program, i):
+    target = _target(program, args[0])
+
+    def handler(ev):
+        if ev.stack.pop() == 0:
+            return target
+
+    return handler
+
+
+@_factory("bnz")
+def _bnz(args, program, i):
+    target = _target(program, args[0])
+
+    def handler(ev):
+        if ev.stack.pop() != 0:
+            return target
+
+    return handler
+
+
+@_factory("callsub")
+def _callsub(args, program, i):
+    target, ret = _target(program, args[0]), i + 1
+
+    def handler(ev):
+        if len(ev.frames) >= 2048:
+            raise AVMError("callsub too deep")
+        ev.frames.append(ret)
+        return target
+
+    return handler
+
+
+@_simple("retsub")
+def _retsub(ev):
+    if not ev.frames:
+        raise AVMError("retsub with no callsub")
+    return ev.frames.pop()
+
+
+# Scratch space
+
+
+@_factory("load")
+def _load(args, program, i):
+    slot = int(args[0])
+
+    def handler(ev):
+        ev.stack.append(ev.scratch[slot])
+
+    return handler
+
+
+@_factory("store")
+def _store(args, program, i):
+    slot = int(args[0])
+
+    def handler(ev):
+        ev.scratch[slot] = ev.stack.pop()
+
+    return handler
+
+
+@_simple("loads")
+def _loads(ev):
+    ev.stack[-1] = ev.scratch[ev.stack[-1]]
+
+
+@_simple("stores")
+def _stores(ev):
+    s = ev.stack
+    val = s.pop()
+    ev.scratch[s.pop()] = val
+
+
+# Transaction fields
+
+
+def _field_getter(name: str, index=None):
+    if index is None:
+
+        def get(f):
+            return get_field(f, name)
+
+    else:
+
+        def get(f):
+            arr = get_field(f, name)
+            if index >= len(arr):
+                raise AVMError("{} index {} out of range".format(name, index))
+            return arr[index]
+
+    return get
+
+
+def _array_get(f, name, index):
+    arr = get_field(f, name)
+    if index >= len(arr):
+        raise AVMError("{} index {} out of range".format(name, index))
+    return arr[index]
+
+
+def _group_txn(ev, gi):
+    if gi >= len(ev.group):
+        raise AVMError("Group index {} out of range".format(gi))
+    return ev.group[gi]
+
+
+@_factory("txn")
+def _txn(args, program, i):
+    get = _field_getter(args[0], int(args[1]) if len(args) > 1 else None)
+    return lambda ev: ev.stack.append(get(ev.txn))
+
+
+@_factory("txna")
+def _txna(args, program, i):
+    get = _field_getter(args[0], int(args[1]))
+    return lambda ev: ev.stack.append(get(ev.txn))
+
+
+@_factory("txnas")
+def _txnas(args, program, i):
+    name = args[0]
+
+    def handler(ev):
+        ev.stack[-1] = _array_get(ev.txn, name, ev.stack[-1])
+
+    return handler
+
+
+@_factory("gtxn")
+def _gtxn(args, program, i):
+    gi = int(args[0])
+    get = _field_getter(args[1], int(args[2]) if len(args) > 2 else None)
+    return lambda ev: ev.stack.append(get(_group_txn(ev, gi)))
+
+
+@_factory("gtxna")
+def _gtxna(args, program, i):
+    gi = int(args[0])
+    get = _field_getter(args[1], int(args[2]))
+    return lambda ev: ev.stack.append(get(_group_txn(ev, gi)))
+
+
+@_factory("gtxnas")
+def _gtxnas(args, program, i):
+    gi, name = int(args[0]), args[1]
+
+    def handler(ev):
+        ev.stack[-1] = _array_get(_group_txn(ev, gi), name, ev.stack[-1])
+
+    return handler
+
+
+@_factory("gtxns")
+def _gtxns(args, program, i):
+    get = _field_getter(args[0], int(args[1]) if len(args) > 1 else None)
+
+    def handler(ev):
+        ev.stack[-1] = get(_group_txn(ev, ev.stack[-1]))
+
+    return handler
+
+
+@_factory("gtxnsa")
+def _gtxnsa(args, program, i):
+    get = _field_getter(args[0], int(args[1]))
+
+    def handler(ev):
+        ev.stack[-1] = get(_group_txn(ev, ev.stack[-1]))
+
+    return handler
+
+
+@_factory("gtxnsas")
+def _gtxnsas(args, program, i):
+    name = args[0]
+
+    def handler(ev):
+        s = ev.stack
+        idx = s.pop()
+        s[-1] = _array_get(_group_txn(ev, s[-1]), name, idx)
+
+    return handler
+
+
+def _gaid(ev, gi):
+    if gi >= ev.txn["GroupIndex"]:
+        raise AVMError("gaid can only look at earlier transactions")
+    f = _group_txn(ev, gi)
+    created = f.get("CreatedAssetID") or f.get("CreatedApplicationID")
+    if not created:
+        raise AVMError("Transaction {} created nothing".format(gi))
+    return created
+
+
+@_factory("gaid")
+def _gaid_op(args, program, i):
+    gi = int(args[0])
+    return lambda ev: ev.stack.append(_gaid(ev, gi))
+
+
+@_simple("gaids")
+def _gaids(ev):
+    ev.stack[-1] = _gaid(ev, ev.stack[-1])
+
+
+@_factory("global")
+def _global(args, program, i):
+    name = args[0]
+    getters = {
+        "MinTxnFee": lambda ev: min_txn_fee,
+        "MinBalance": lambda ev: min_balance,
+        "MaxTxnLife": lambda ev: max_txn_life,
+        "ZeroAddress": lambda ev: zero_address,
+        "GroupSize": lambda ev: len(ev.group),
+        "LogicSigVersion": lambda ev: 6,
+        "Round": lambda ev: ev.ledger.round,
+        "LatestTimestamp": lambda ev: ev.ledger.timestamp,
+        "CurrentApplicationID": lambda ev: ev.app_id,
+        "CreatorAddress": lambda ev: ev.ledger.apps[ev.app_id].creator,
+        "CurrentApplicationAddress": lambda ev: ev.app_addr,
+        "GroupID": lambda ev: ev.txn.get("GroupID", bytes(32)),
+        "OpcodeBudget": lambda ev: ev.ledger.budget,
+        "CallerApplicationID": lambda ev: ev.caller_id(),
+        "CallerApplicationAddress": lambda ev: app_address(ev.caller_id())
+        if ev.caller_id()
+        else zero_address,
+    }
+    if name not in getters:
+        raise AVMError("Unsupported global {}".format(name))
+    get = getters[name]
+    return lambda ev: ev.stack.append(get(ev))
+
+
+# State
+
+
+def _opt_global(ev, app_ref):
+    app_id = ev.application(app_ref)
+    return ev.ledger.globals.get(app_id, {})
+
+
+@_simple("app_global_get")
+def _app_global_get(ev):
+    ev.stack[-1] = ev.ledger.globals[ev.app_id].get(ev.stack[-1], 0)
+
+
+@_simple("app_global_get_ex")
+def _app_global_get_ex(ev):
+    s = ev.stack
+    key = s.pop()
+    state = _opt_global(ev, s[-1])
+    if key in state:
+        s[-1] = state[key]
+        s.append(1)
+    else:
+        s[-1] = 0
+        s.append(0)
+
+
+@_simple("app_global_put")
+def _app_global_put(ev):
+    s = ev.stack
+    val, key = s.pop(), s.pop()
+    if len(key) > 64 or len(key) + (len(val) if isinstance(val, bytes) else 0) > 128:
+        raise AVMError("Global state key or value too long")
+    ev.ledger._put(ev.ledger.globals[ev.app_id], key, val)
+
+
+@_simple("app_global_del")
+def _app_global_del(ev):
+    ev.ledger._del(ev.ledger.globals[ev.app_id], ev.stack.pop())
+
+
+def _local_state(ev, acct_ref, app_id):
+    key = (ev.account(acct_ref), app_id)
+    state = ev.ledger.locals.get(key)
+    if state is None:
+        raise AVMError("Account is not opted in to {}".format(app_id))
+    return state
+
+
+@_simple("app_local_get")
+def _app_local_get(ev):
+    s = ev.stack
+    key = s.pop()
+    s[-1] = _local_state(ev, s[-1], ev.app_id).get(key, 0)
+
+
+@_simple("app_local_get_ex")
+def _app_local_get_ex(ev):
+    s = ev.stack
+    key, app_ref = s.pop(), s.pop()
+    state = ev.ledger.locals.get((ev.account(s[-1]), ev.application(app_ref)), {})
+    if key in state:
+        s[-1] = state[key]
+        s.append(1)
+    else:
+        s[-1] = 0
+        s.append(0)
+
+
+@_simple("app_local_put")
+def _app_local_put(ev):
+    s = ev.stack
+    val, key, acct = s.pop(), s.pop(), s.pop()
+    ev.ledger._put(_local_state(ev, acct, ev.app_id), key, val)
+
+
+@_simple("app_local_del")
+def _app_local_del(ev):
+    s = ev.stack
+    key, acct = s.pop(), s.pop()
+    ev.ledger._del(_local_state(ev, acct, ev.app_id), key)
+
+
+@_simple("app_opted_in")
+def _app_opted_in(ev):
+    s = ev.stack
+    app_id = ev.application(s.pop())
+    s[-1] = int((ev.account(s[-1]), app_id) in ev.ledger.locals)
+
+
+@_simple("balance")
+def _balance(ev):
+    ev.stack[-1] = ev.ledger.balances.get(ev.account(ev.stack[-1]), 0)
+
+
+@_simple("min_balance")
+def _min_balance(ev):
+    ev.stack[-1] = ev.ledger.min_balance(ev.account(ev.stack[-1]))
+
+
+@_factory("asset_holding_get")
+def _asset_holding_get(args, program, i):
+    if args[0] not in ("AssetBalance", "AssetFrozen"):
+        raise AVMError("Unsupported holding field {}".format(args[0]))
+    frozen = args[0] == "AssetFrozen"
+
+    def handler(ev):
+        s = ev.stack
+        aid = ev.asset(s.pop())
+        amt = ev.ledger.holdings.get((ev.account(s[-1]), aid))
+        if amt is None:
+            s[-1] = 0
+            s.append(0)
+        else:
+            s[-1] = 0 if frozen else amt
+            s.append(1)
+
+    return handler
+
+
+@_factory("asset_params_get")
+def _asset_params_get(args, program, i):
+    key = asset_param_fields[args[0]]
+    default = zero_address if key in addr_fields or key == "Creator" else (
+        b"" if key in bytes_fields else 0
+    )
+
+    def handler(ev):
+        s = ev.stack
+        params = ev.ledger.assets.get(ev.asset(s[-1]))
+        if params is None:
+            s[-1] = 0
+            s.append(0)
+        else:
+            s[-1] = params.get(key, default)
+            s.append(1)
+
+    return handler
+
+
+@_factory("app_params_get")
+def _app_params_get(args, program, i):
+    name = args[0]
+
+    def handler(ev):
+        s = ev.stack
+        app_id = ev.application(s[-1])
+        app = ev.ledger.apps.get(app_id)
+        if app is None:
+            s[-1] = 0
+            s.append(0)
+            return
+        s[-1] = {
+            "AppGlobalNumUint": app.global_schema[0],
+            "AppGlobalNumByteSlice": app.global_schema[1],
+            "AppLocalNumUint": app.local_schema[0],
+            "AppLocalNumByteSlice": app.local_schema[1],
+            "AppExtraProgramPages": app.pages,
+            "AppCreator": app.creator,
+            "AppAddress": app_address(app_id),
+        }[name]
+        s.append(1)
+
+    return handler
+
+
+@_factory("acct_params_get")
+def _acct_params_get(args, program, i):
+    name = args[0]
+
+    def handler(ev):
+        s = ev.stack
+        addr = ev.account(s[-1])
+        ledger = ev.ledger
+        bal = ledger.balances.get(addr)
+        s[-1] = {
+            "AcctBalance": bal or 0,
+            "AcctMinBalance": ledger.min_balance(addr),
+            "AcctAuthAddr": zero_address,
+        }[name]
+        s.append(int(bool(bal)))
+
+    return handler
+
+
+@_simple("log")
+def _log(ev):
+    logs = ev.result.logs
+    if len(logs) >= 32:
+        raise AVMError("Too many log calls")
+    logs.append(ev.stack.pop())
+
+
+# Inner transactions
+
+
+def _new_inner(ev) -> dict:
+    return {"Sender": ev.app_addr, "_caller": ev.app_id}
+
+
+@_simple("itxn_begin")
+def _itxn_begin(ev):
+    if ev.inner is not None:
+        raise AVMError("itxn_begin without itxn_submit")
+    ev.inner = [_new_inner(ev)]
+
+
+@_simple("itxn_next")
+def _itxn_next(ev):
+    if ev.inner is None:
+        raise AVMError("itxn_next without itxn_begin")
+    if len(ev.inner) >= max_inner_txns:
+        raise AVMError("Too many transactions in inner group")
+    ev.inner.append(_new_inner(ev))
+
+
+@_factory("itxn_field")
+def _itxn_field(args, program, i):
+    name = args[0]
+    is_array = name in array_fields
+
+    def handler(ev):
+        if ev.inner is None:
+            raise AVMError("itxn_field without itxn_begin")
+        f = ev.inner[-1]
+        val = ev.stack.pop()
+        if name in addr_fields:
+            val = ev.account(val) if name in ("Receiver", "AssetReceiver") else val
+        if name == "XferAsset":
+            val = ev.asset(val)
+        if is_array:
+            f.setdefault(name, []).append(val)
+        elif name == "Type":
+            f["Type"] = val
+            f["TypeEnum"] = type_enums[val.decode()]
+        elif name == "TypeEnum":
+            f["TypeEnum"] = val
+            f["Type"] = next(k for k, v in type_enums.items() if v == val).encode()
+        else:
+            f[name] = val
+
+    return handler
+
+
+@_simple("itxn_submit")
+def _itxn_submit(ev):
+    if ev.inner is None:
+        raise AVMError("itxn_submit without itxn_begin")
+    group, ev.inner = ev.inner, None
+    for f in group:
+        if "TypeEnum" not in f:
+            raise AVMError("Inner transaction is missing its type")
+
+    results = ev.ledger.submit_inner(ev, group)
+    for r in results:
+        if r.created_asset:
+            ev.created_assets.add(r.created_asset)
+    ev.result.inner.extend(results)
+    ev.last_inner = results
+
+
+def _last_inner(ev, gi=None) -> dict:
+    if not ev.last_inner:
+        raise AVMError("No inner transaction has been submitted")
+    if gi is None:
+        gi = len(ev.last_inner) - 1
+    if gi >= len(ev.last_inner):
+        raise AVMError("Inner group index {} out of range".format(gi))
+    return ev.last_inner[gi].fields
+
+
+@_factory("itxn")
+def _itxn(args, program, i):
+    get = _field_getter(args[0], int(args[1]) if len(args) > 1 else None)
+    return lambda ev: ev.stack.append(get(_last_inner(ev)))
+
+
+@_factory("itxna")
+def _itxna(args, program, i):
+    get = _field_getter(args[0], int(args[1]))
+    return lambda ev: ev.stack.append(get(_last_inner(ev)))
+
+
+@_factory("itxnas")
+def _itxnas(args, program, i):
+    name = args[0]
+
+    def handler(ev):
+        ev.stack[-1] = _array_get(_last_inner(ev), name, ev.stack[-1])
+
+    return handler
+
+
+@_factory("gitxn")
+def _gitxn(args, program, i):
+    gi = int(args[0])
+    get = _field_getter(args[1], int(args[2]) if len(args) > 2 else None)
+    return lambda ev: ev.stack.append(get(_last_inner(ev, gi)))
+
+
+@_factory("gitxna")
+def _gitxna(args, program, i):
+    gi = int(args[0])
+    get = _field_getter(args[1], int(args[2]))
+    return lambda ev: ev.stack.append(get(_last_inner(ev, gi)))
+
+
+@_factory("gitxnas")
+def _gitxnas(args, program, i):
+    gi, name = int(args[0]), args[1]
+
+    def handler(ev):
+        ev.stack[-1] = _array_get(_last_inner(ev, gi), name, ev.stack[-1])
+
+    return handler
@@ -0,0 +1,125 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Tuple
+
+from algosdk import error
+
+# Looks up just the holdings a caller cares about, one `account_asset_info` call per
+# holding (or `account_info` with `exclude=all` for algos), rather than pulling every
+# account's full asset list and scanning it. Lookups run concurrently and the results
+# are indexed by account and asset id.
+
+ALGO = 0  # asset id standing in for an account's algo balance
+
+Holdings = Dict[str, Iterable[int]]  # address -> asset ids to look up
+
+
+class Snapshot:
+    """Balances by account and asset id at `round`. Holdings an account hasn't opted
+    in to are left out"""
+
+    def __init__(self, round: int, balances: Dict[str, Dict[int, int]]):
+        self.round = round
+        self.balances = balances
+
+    def get(self, addr: str, asset_id: int = ALGO) -> int:
+        return self.balances.get(addr, {}).get(asset_id, 0)
+
+    def diff(self, before: "Snapshot") -> Dict[str, Dict[int, int]]:
+        """changes since `before`, leaving out anything that didn't move"""
+        changes = {}
+        for addr in self.balances.keys() | before.balances.keys():
+            mine, theirs = self.balances.get(addr, {}), before.balances.get(addr, {})
+            moved = {
+                aid: mine.get(aid, 0) - theirs.get(aid, 0)
+                for aid in mine.keys() | theirs.keys()
+                if mine.get(aid, 0) != theirs.get(aid, 0)
+            }
+            if moved:
+                changes[addr] = moved
+        return changes
+
+
+class Balances:
+    """Snapshots of a fixed set of holdings, each diffed against the last"""
+
+    def __init__(
+        self,
+        client,
+        holdings: Holdings,
+        names: Dict[str, str] = None,
+        assets: Dict[int, str] = None,
+        workers: int = 16,
+    ):
+        self.client = client
+        self.lookups: List[Tuple[str, int]] = [
+            (addr, aid) for addr, ids in holdings.items() for aid in ids
+        ]
+        self.names = names or {}
+        self.assets = {ALGO: "Algo", **(assets or {})}
+        self.workers = workers
+
+        self.last: Snapshot = None
+
+    def snapshot(self) -> Snapshot:
+        balances: Dict[str, Dict[int, int]] = {}
+        rounds = []
+        with ThreadPoolExecutor(min(self.workers, len(self.lookups))) as pool:
+            for addr, aid, found in pool.map(lambda l: self._lookup(*l), self.lookups):
+                if found is not None:
+                    amount, round = found
+                    balances.setdefault(addr, {})[aid] = amount
+                    rounds.append(round)
+        # Lookups can straddle a block, the snapshot is as of the latest one seen
+        return Snapshot(max(rounds, default=0), balances)
+
+    def step(self) -> Tuple[Snapshot, Dict[str, Dict[int, int]]]:
+        """takes a snapshot and returns it with its changes since the previous one"""
+        snapshot = self.snapshot()
+        changes = snapshot.diff(self.last) if self.last is not None else {}
+        self.last = snapshot
+        return snapshot, changes
+
+    def format(self, snapshot: Snapshot) -> str:
+        lines = []
+        for addr, ids in self._by_account():
+            lines.append("{}: ".format(self.names.get(addr, addr)))
+            for aid in ids:
+                if aid in snapshot.balances.get(addr, {}):
+                    lines.append(
+                        "\t{} Balance {}".format(self._asset(aid), snapshot.get(addr, aid))
+                    )
+        return "\n".join(lines)
+
+    def format_diff(self, changes: Dict[str, Dict[int, int]]) -> str:
+        """one line per account that moved, e.g. `App: Pool -100, AssetA +95`"""
+        lines = []
+        for addr, ids in self._by_account():
+            if addr in changes:
+                moved = [
+                    "{} {:+d}".format(self._asset(aid), changes[addr][aid])
+                    for aid in ids
+                    if aid in changes[addr]
+                ]
+                lines.append("{}: {}".format(self.names.get(addr, addr), ", ".join(moved)))
+        return "\n".join(lines)
+
+    def _lookup(self, addr: str, asset_id: int):
+        try:
+            if asset_id == ALGO:
+                info = self.client.account_info(addr, exclude="all")
+                return addr, asset_id, (info["amount"], info["round"])
+            info = self.client.account_asset_info(addr, asset_id)
+            return addr, asset_id, (info["asset-holding"]["amount"], info["round"])
+        except error.AlgodHTTPError as e:
+            if e.code == 404:
+                return addr, asset_id, None  # not opted in
+            raise
+
+    def _by_account(self):
+        accounts: Dict[str, List[int]] = {}
+        for addr, aid in self.lookups:
+            accounts.setdefault(addr, []).append(aid)
+        return accounts.items()
+
+    def _asset(self, asset_id: int) -> str:
+        return self.assets.get(asset_id, str(asset_id))
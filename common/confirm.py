@@ -0,0 +1,248 @@
+import base64
+import threading
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import msgpack
+from algosdk import abi, error
+from algosdk.atomic_transaction_composer import (
+    ABI_RETURN_HASH,
+    ABIResult,
+    AtomicTransactionComposer,
+    AtomicTransactionComposerStatus,
+    AtomicTransactionResponse,
+)
+
+from common.wire import encode_txid, pending_info, restore_genesis, txid_of
+
+# Waits for transactions by following the chain a round at a time instead of polling
+# `pending_transaction_info` per txid. One thread blocks on `status_after_block`,
+# fetches each new block once and resolves every watched txid found in it, so the
+# number of requests grows with rounds rather than with transactions in flight.
+
+
+class Confirmations:
+    """Hands out futures for transactions that resolve to their pending transaction
+    info (as `wait_for_confirmation` returns it) once they're seen in a block"""
+
+    def __init__(self, client, retain_rounds: int = 16):
+        self.client = client
+        self.retain_rounds = retain_rounds
+
+        self.lock = threading.Condition()
+        self.round: Optional[int] = None  # last round we've processed
+        self.waiting: Dict[str, Future] = {}
+        self.deadlines: Dict[int, List[str]] = {}  # round -> txids that time out then
+        self.fresh: List[tuple] = []  # (txid, wait rounds) still to be given a deadline
+
+        # Txids from the last few blocks, for watchers that show up after their
+        # transaction was already confirmed
+        self.seen: Dict[int, Dict[str, tuple]] = {}  # round -> txid -> (entry, txn)
+        self.seen_from = 0
+
+        self.blocks = 0
+        self.resolved = 0
+
+        self._thread = None
+        self._stop = False
+
+    def watch(self, txid: str, first_round: int, wait_rounds: int = 1000) -> Future:
+        """returns a future for `txid`, which can't be confirmed before `first_round`
+        (its first valid round)"""
+        with self.lock:
+            future, late = self._track(txid, first_round, wait_rounds, Future)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self.lock.notify_all()
+
+        if late:
+            # It may have landed in a round we processed but no longer remember
+            info = self.client.pending_transaction_info(txid)
+            if info.get("confirmed-round"):
+                self._resolve(txid, info)
+
+        return future
+
+    def _track(self, txid: str, first_round: int, wait_rounds: int, new_future):
+        """registers a watch, the caller holds the lock. Returns the future and whether
+        the transaction may already be in a block we no longer remember"""
+        if txid in self.waiting:
+            return self.waiting[txid], False
+
+        future = new_future()
+        idle = not self.waiting
+        if self.round is None or (idle and first_round > self.round + 1):
+            # Nobody is waiting on the rounds in between, so skip straight ahead
+            self.round = first_round - 1
+            self.deadlines = {}
+            self.seen = {}
+            self.seen_from = first_round
+
+        for r, txns in self.seen.items():
+            if txid in txns:
+                future.set_result(_confirmed_info(r, *txns[txid]))
+                return future, False
+
+        self.waiting[txid] = future
+        self.fresh.append((txid, wait_rounds))
+        return future, first_round < self.seen_from
+
+    def _start_deadlines(self, fresh: list, last_round: int):
+        """like wait_for_confirmation, count wait rounds from the first status we get
+        back after a watch started"""
+        with self.lock:
+            for txid, wait_rounds in fresh:
+                if txid in self.waiting:
+                    self.deadlines.setdefault(last_round + wait_rounds, []).append(txid)
+
+    def wait(self, txid: str, first_round: int, wait_rounds: int = 1000) -> dict:
+        return self.watch(txid, first_round, wait_rounds).result()
+
+    def watch_group(self, signed_group: list, wait_rounds: int = 1000) -> List[Future]:
+        return [
+            self.watch(stxn.get_txid(), stxn.transaction.first_valid_round, wait_rounds)
+            for stxn in signed_group
+        ]
+
+    def wait_group(self, signed_group: list, wait_rounds: int = 1000) -> List[dict]:
+        return [f.result() for f in self.watch_group(signed_group, wait_rounds)]
+
+    def execute(
+        self, atc: AtomicTransactionComposer, wait_rounds: int
+    ) -> AtomicTransactionResponse:
+        """the equivalent of `atc.execute(client, wait_rounds)`, without polling"""
+        tx_ids = atc.submit(self.client)
+        futures = [
+            self.watch(txid, tws.txn.first_valid_round, wait_rounds)
+            for txid, tws in zip(tx_ids, atc.txn_list)
+        ]
+        return atc_response(atc, [f.result() for f in futures])
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "round": self.round,
+                "blocks": self.blocks,
+                "resolved": self.resolved,
+                "waiting": len(self.waiting),
+            }
+
+    def close(self):
+        with self.lock:
+            self._stop = True
+            self.lock.notify_all()
+
+    def _resolve(self, txid: str, info: dict):
+        with self.lock:
+            future = self.waiting.pop(txid, None)
+            if future is not None:
+                self.resolved += 1
+                _settle(future, info)
+
+    def _fail(self, e: Exception):
+        """hands a failure to everyone waiting rather than retrying forever"""
+        with self.lock:
+            waiting, self.waiting, self.deadlines = self.waiting, {}, {}
+            self.fresh = []
+        for future in waiting.values():
+            _settle(future, error=e)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.waiting or self._stop)
+                if self._stop:
+                    return
+                current = self.round
+                fresh, self.fresh = self.fresh, []
+
+            try:
+                last = self.client.status_after_block(current)["last-round"]
+                self._start_deadlines(fresh, last)
+                for r in range(current + 1, last + 1):
+                    raw = self.client.block_info(r, response_format="msgpack")
+                    self._process(r, raw)
+            except Exception as e:
+                self._fail(e)
+
+    def _process(self, round: int, raw: bytes):
+        block = msgpack.unpackb(raw, raw=False, strict_map_key=False)["block"]
+        txns = {}
+        for entry in block.get("txns", []):
+            txn = restore_genesis(entry, block)
+            txns[encode_txid(txid_of(txn))] = (entry, txn)
+
+        with self.lock:
+            self.blocks += 1
+            if round <= self.round:
+                return  # watch() skipped past it while we were fetching
+            self.round = round
+
+            self.seen[round] = txns
+            while len(self.seen) > self.retain_rounds:
+                self.seen.pop(self.seen_from, None)
+                self.seen_from += 1
+
+            for txid in txns.keys() & self.waiting.keys():
+                self.resolved += 1
+                _settle(self.waiting.pop(txid), _confirmed_info(round, *txns[txid]))
+
+            for txid in self.deadlines.pop(round, []):
+                future = self.waiting.pop(txid, None)
+                if future is not None:
+                    _settle(
+                        future,
+                        error=error.ConfirmationTimeoutError(
+                            "Wait for transaction id {} timed out".format(txid)
+                        ),
+                    )
+
+
+def _settle(future, result=None, error: Exception = None):
+    # Works for both concurrent and asyncio futures, either may have been cancelled
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+def atc_response(
+    atc: AtomicTransactionComposer, infos: List[dict]
+) -> AtomicTransactionResponse:
+    """builds what `atc.execute` returns from the confirmed info of each transaction"""
+    atc.status = AtomicTransactionComposerStatus.COMMITTED
+
+    results = []
+    for i, (txid, info) in enumerate(zip(atc.tx_ids, infos)):
+        if i in atc.method_dict:
+            results.append(_abi_result(atc.method_dict[i], txid, info))
+
+    return AtomicTransactionResponse(infos[0]["confirmed-round"], atc.tx_ids, results)
+
+
+def _confirmed_info(round: int, entry: dict, txn: dict) -> dict:
+    info = pending_info({**entry, "txn": txn})
+    info["confirmed-round"] = round
+    return info
+
+
+def _abi_result(method: abi.Method, txid: str, info: dict) -> ABIResult:
+    """decodes a method's return value from its last log, as the ATC does"""
+    raw_value = return_value = decode_error = None
+    if method.returns.type != abi.Returns.VOID:
+        try:
+            logs = info.get("logs", [])
+            result = base64.b64decode(logs[-1]) if logs else b""
+            if result[:4] != ABI_RETURN_HASH:
+                raise error.AtomicTransactionComposerError(
+                    "app call transaction did not log a return value"
+                )
+            raw_value = result[4:]
+            return_value = method.returns.type.decode(raw_value)
+        except Exception as e:
+            decode_error = e
+
+    return ABIResult(txid, raw_value, return_value, decode_error, info)
@@ -0,0 +1,445 @@
+import argparse
+import json
+import sys
+from collections import Counter
+from typing import Dict, List, Optional
+
+from common.teal import Program, branch_ops, const_value, halt_ops, parse
+
+# Static opcode cost and bytecode size for an approval program
+#
+# Costs are the worst case over every path that doesn't end in `err`, following
+# `callsub` into subroutines. Sizes are an estimate of what the assembler produces:
+# constants referenced more than once are hoisted into the int/byte constant blocks,
+# the rest are pushed inline.
+
+default_budget = 700
+
+# Everything not listed here costs 1
+op_costs = {
+    "sha256": 35,
+    "keccak256": 130,
+    "sha512_256": 45,
+    "ed25519verify": 1900,
+    "ecdsa_verify": 1700,
+    "ecdsa_pk_decompress": 650,
+    "ecdsa_pk_recover": 2000,
+    "divmodw": 20,
+    "expw": 10,
+    "sqrt": 4,
+    "bsqrt": 40,
+    "b+": 10,
+    "b-": 10,
+    "b*": 20,
+    "b/": 20,
+    "b%": 20,
+    "b|": 6,
+    "b&": 6,
+    "b^": 6,
+    "b~": 4,
+}
+
+# Encoded size for ops with immediates, everything else is a single byte
+op_sizes = {
+    **dict.fromkeys(
+        [
+            "txn",
+            "txnas",
+            "gtxns",
+            "gtxnsas",
+            "global",
+            "load",
+            "store",
+            "gloads",
+            "gaid",
+            "itxn_field",
+            "itxn",
+            "itxnas",
+            "asset_holding_get",
+            "asset_params_get",
+            "app_params_get",
+            "acct_params_get",
+            "dig",
+            "cover",
+            "uncover",
+            "intc",
+            "bytec",
+            "arg",
+            "ecdsa_verify",
+            "ecdsa_pk_decompress",
+            "ecdsa_pk_recover",
+            "base64_decode",
+        ],
+        2,
+    ),
+    **dict.fromkeys(
+        [
+            "txna",
+            "gtxn",
+            "gtxnsa",
+            "gtxnas",
+            "gitxn",
+            "itxna",
+            "substring",
+            "extract",
+            "gload",
+            "b",
+            "bz",
+            "bnz",
+            "callsub",
+        ],
+        3,
+    ),
+    **dict.fromkeys(["gtxna", "gitxna"], 4),
+}
+
+const_ops = {"int", "byte", "addr", "method", "pushint", "pushbytes"}
+
+
+class UnboundedCost(Exception):
+    pass
+
+
+def _uvarint_len(val: int) -> int:
+    n = 1
+    while val >= 0x80:
+        val >>= 7
+        n += 1
+    return n
+
+
+class Analyzer:
+    def __init__(self, program: Program):
+        self.program = program
+        ops = program.ops
+
+        # Split into basic blocks, a block starts at any label and after any op that
+        # doesn't simply fall through
+        leaders = {0, *program.labels.values()}
+        for i, op in enumerate(ops):
+            if op.op in halt_ops or (op.op in branch_ops and op.op != "callsub"):
+                leaders.add(i + 1)
+        self.starts = sorted(l for l in leaders if l < len(ops))
+        self.block_of = {}
+        self.blocks = []
+        for n, start in enumerate(self.starts):
+            end = self.starts[n + 1] if n + 1 < len(self.starts) else len(ops)
+            self.blocks.append((start, end))
+            for i in range(start, end):
+                self.block_of[i] = n
+
+        self._layout_constants()
+
+        self._longest: Dict[int, Optional[int]] = {}
+        self._visiting = set()
+
+    def _layout_constants(self):
+        ints, byts = Counter(), Counter()
+        order = {}
+        for i, op in enumerate(self.program.ops):
+            if op.op not in ("int", "byte", "addr", "method"):
+                continue
+            val = const_value(op)
+            order.setdefault(val, i)
+            (ints if isinstance(val, int) else byts)[val] += 1
+
+        def block(counts):
+            shared = [v for v, c in counts.items() if c > 1]
+            shared.sort(key=lambda v: (-counts[v], order[v]))
+            return {v: idx for idx, v in enumerate(shared)}
+
+        self.intcblock = block(ints)
+        self.bytecblock = block(byts)
+
+    def header_size(self) -> int:
+        size = _uvarint_len(self.program.version)
+        if self.intcblock:
+            size += 1 + _uvarint_len(len(self.intcblock))
+            size += sum(_uvarint_len(v) for v in self.intcblock)
+        if self.bytecblock:
+            size += 1 + _uvarint_len(len(self.bytecblock))
+            size += sum(_uvarint_len(len(v)) + len(v) for v in self.bytecblock)
+        return size
+
+    def op_size(self, i: int) -> int:
+        op = self.program.ops[i]
+        if op.op not in const_ops:
+            return op_sizes.get(op.op, 1)
+
+        val = const_value(op)
+        if isinstance(val, int):
+            idx = self.intcblock.get(val) if op.op == "int" else None
+            if idx is None:
+                return 1 + _uvarint_len(val)
+        else:
+            idx = self.bytecblock.get(val) if op.op != "pushbytes" else None
+            if idx is None:
+                return 1 + _uvarint_len(len(val)) + len(val)
+
+        return 1 if idx < 4 else 2
+
+    def op_cost(self, i: int) -> Optional[int]:
+        op = self.program.ops[i]
+        cost = op_costs.get(op.op, 1)
+        if op.op == "callsub":
+            sub = self.subroutine_cost(op.args[0])
+            if sub is None:
+                return None
+            cost += sub
+        return cost
+
+    def _successors(self, n: int) -> List[int]:
+        start, end = self.blocks[n]
+        last = self.program.ops[end - 1]
+
+        succ = []
+        if last.op in ("b", "bz", "bnz"):
+            succ.append(self.block_of[self.program.labels[last.args[0]]])
+        if last.op not in halt_ops and last.op != "b" and end < len(self.program.ops):
+            succ.append(self.block_of[end])
+        return succ
+
+    def _cost_between(self, start: int, end: int) -> Optional[int]:
+        total = 0
+        for i in range(start, end):
+            cost = self.op_cost(i)
+            if cost is None:
+                return None
+            total += cost
+        return total
+
+    def longest(self, n: int) -> Optional[int]:
+        """worst case cost from the start of block `n` until the program (or subroutine) returns, None if every path errs"""
+        if n in self._longest:
+            return self._longest[n]
+        if n in self._visiting:
+            raise UnboundedCost(
+                "Loop at line {}".format(self.program.ops[self.blocks[n][0]].line)
+            )
+
+        self._visiting.add(n)
+        try:
+            result = self._longest_uncached(n)
+        finally:
+            self._visiting.discard(n)
+
+        self._longest[n] = result
+        return result
+
+    def _longest_uncached(self, n: int) -> Optional[int]:
+        start, end = self.blocks[n]
+        last = self.program.ops[end - 1]
+
+        result = self._cost_between(start, end)
+        if result is None or last.op == "err":
+            return None
+        if last.op in halt_ops:
+            return result
+
+        tails = [t for t in map(self.longest, self._successors(n)) if t is not None]
+        # Falling off the end of the program is an implicit return
+        if not tails and end == len(self.program.ops) and last.op != "b":
+            tails = [0]
+        return result + max(tails) if tails else None
+
+    def longest_to(self, n: int, target: int, memo=None) -> Optional[int]:
+        """worst case cost from the start of block `n` up to and including op `target`"""
+        if memo is None:
+            memo = {}
+        if n in memo:
+            return memo[n]
+
+        memo[n] = None  # guards against loops, we only need one way in
+        start, end = self.blocks[n]
+        if start <= target < end:
+            result = self._cost_between(start, target + 1)
+        else:
+            # Only cost this block if it actually leads to the target
+            tails = [self.longest_to(s, target, memo) for s in self._successors(n)]
+            tails = [t for t in tails if t is not None]
+            head = self._cost_between(start, end) if tails else None
+            result = None if head is None else head + max(tails)
+
+        memo[n] = result
+        return result
+
+    def subroutine_cost(self, label: str) -> Optional[int]:
+        return self.longest(self.block_of[self.program.labels[label]])
+
+    def reachable_size(self, n: int) -> int:
+        seen, stack = set(), [n]
+        while stack:
+            b = stack.pop()
+            if b in seen:
+                continue
+            seen.add(b)
+            stack.extend(self._successors(b))
+            start, end = self.blocks[b]
+            for i in range(start, end):
+                op = self.program.ops[i]
+                if op.op == "callsub":
+                    stack.append(self.block_of[self.program.labels[op.args[0]]])
+
+        return sum(
+            self.op_size(i) for b in seen for i in range(*self.blocks[b])
+        )
+
+    def methods(self) -> Dict[str, dict]:
+        """finds dispatch entries on the first app arg, either an ABI router's
+        `method "sig"` or a plain `byte "action"` comparison, followed by `==; bnz label`"""
+        ops = self.program.ops
+        found = {}
+        for i in range(1, len(ops) - 2):
+            arg, const, eq, branch = ops[i - 1], ops[i], ops[i + 1], ops[i + 2]
+            if not (
+                arg.op == "txna"
+                and arg.args == ["ApplicationArgs", "0"]
+                and const.op in ("method", "byte")
+                and eq.op == "=="
+                and branch.op == "bnz"
+            ):
+                continue
+
+            entry = self.block_of[self.program.labels[branch.args[0]]]
+            method = {"size": self.reachable_size(entry)}
+            if const.op == "method":
+                signature = const.args[0][1:-1]
+                name = signature.split("(")[0]
+                method["signature"] = signature
+                method["selector"] = const_value(const).hex()
+            else:
+                name = const_value(const).decode(errors="replace")
+
+            try:
+                dispatch = self.longest_to(0, i + 2)
+                body = self.longest(entry)
+                method["dispatch_cost"] = dispatch
+                method["cost"] = None if None in (dispatch, body) else dispatch + body
+            except UnboundedCost as e:
+                method["cost"] = None
+                method["unbounded"] = str(e)
+
+            found[name] = method
+        return found
+
+    def subroutines(self) -> Dict[str, dict]:
+        subs = {}
+        for op in self.program.ops:
+            if op.op == "callsub" and op.args[0] not in subs:
+                label = op.args[0]
+                sub = {
+                    "size": self.reachable_size(
+                        self.block_of[self.program.labels[label]]
+                    )
+                }
+                try:
+                    sub["cost"] = self.subroutine_cost(label)
+                except UnboundedCost as e:
+                    sub["cost"] = None
+                    sub["unbounded"] = str(e)
+                subs[label] = sub
+        return subs
+
+    def max_cost(self) -> Optional[int]:
+        try:
+            return self.longest(0)
+        except UnboundedCost:
+            return None
+
+    def program_size(self) -> int:
+        return self.header_size() + sum(
+            self.op_size(i) for i in range(len(self.program.ops))
+        )
+
+
+def analyze(src: str) -> dict:
+    analyzer = Analyzer(parse(src))
+    return {
+        "program": {
+            "size": analyzer.program_size(),
+            "max_cost": analyzer.max_cost(),
+        },
+        "methods": analyzer.methods(),
+        "subroutines": analyzer.subroutines(),
+    }
+
+
+def check(
+    report: dict,
+    budget: int = default_budget,
+    limits=None,
+    baseline=None,
+    allow_unbounded=(),
+):
+    """returns a list of human readable violations, empty if the report passes. A
+    method the walk can't bound is one, unless it's named in `allow_unbounded`"""
+    problems = []
+    for name, method in report["methods"].items():
+        cost = method["cost"]
+        if cost is None:
+            if name not in allow_unbounded:
+                problems.append(
+                    "{} has no static cost bound: {}".format(
+                        name, method.get("unbounded", "cost unknown")
+                    )
+                )
+            continue
+
+        if cost > budget:
+            problems.append("{} costs {} over budget {}".format(name, cost, budget))
+        if limits and name in limits and cost > limits[name]:
+            problems.append(
+                "{} costs {} over limit {}".format(name, cost, limits[name])
+            )
+        if baseline and name in baseline.get("methods", {}):
+            was = baseline["methods"][name]["cost"]
+            if was is not None and cost > was:
+                problems.append("{} went from {} to {}".format(name, was, cost))
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report per method opcode cost and size of an approval program"
+    )
+    parser.add_argument("teal", help="path to the approval TEAL source")
+    parser.add_argument("--budget", type=int, default=default_budget)
+    parser.add_argument(
+        "--max",
+        action="append",
+        default=[],
+        metavar="METHOD=COST",
+        help="fail if METHOD costs more than COST, may be repeated",
+    )
+    parser.add_argument(
+        "--baseline", help="fail if any method costs more than in this saved report"
+    )
+    parser.add_argument(
+        "--allow-unbounded",
+        action="append",
+        default=[],
+        metavar="METHOD",
+        help="don't fail if METHOD has no static cost bound, may be repeated",
+    )
+    parser.add_argument("--write", help="save the report to this path")
+    args = parser.parse_args()
+
+    with open(args.teal) as f:
+        report = analyze(f.read())
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    limits = {k: int(v) for k, v in (m.split("=", 1) for m in args.max)}
+
+    print(json.dumps(report, indent=2))
+    if args.write:
+        with open(args.write, "w") as f:
+            json.dump(report, f, indent=2)
+
+    problems = check(report, args.budget, limits, baseline, args.allow_unbounded)
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    sys.exit(1 if problems else 0)
@@ -0,0 +1,233 @@
+import json
+import os
+import threading
+from typing import Dict, List, NamedTuple, Optional
+
+import msgpack
+from algosdk import error
+
+from common.wire import checksum
+
+# Follows the chain a block at a time and hands each transaction group, with what
+# evaluating it produced (inner transactions, logs, created ids), to a set of state
+# models. The models keep themselves up to date from those deltas, so nobody has to
+# poll `account_info` to learn where a pool stands. Progress is checkpointed to disk
+# with the models' state, so a restart picks up after the last round it saved. Blocks
+# come from algod, or from files recorded earlier through `BlockFiles`.
+
+version = 1
+
+
+class Applied(NamedTuple):
+    """A transaction as it appears in a block, in msgpack dict form, with its effects"""
+
+    txn: dict
+    inner: List["Applied"]
+    logs: List[bytes]
+    created_asset: int
+    created_app: int
+
+
+def applied(entry: dict) -> Applied:
+    dt = entry.get("dt", {})
+    return Applied(
+        entry["txn"],
+        [applied(inner) for inner in dt.get("itx", [])],
+        dt.get("lg", []),
+        entry.get("caid", 0),
+        entry.get("apid", 0),
+    )
+
+
+def groups(block: dict) -> List[List[Applied]]:
+    """the block's transactions, split into the groups they were submitted in"""
+    result, last_gid = [], None
+    for entry in block.get("txns", []):
+        gid = entry["txn"].get("grp")
+        if gid is None or gid != last_gid:
+            result.append([])
+        result[-1].append(applied(entry))
+        last_gid = gid
+    return result
+
+
+def block_hash(block: dict) -> str:
+    """a digest of the block header, to tell whether a checkpoint is from this chain"""
+    header = {k: v for k, v in sorted(block.items()) if k != "txns"}
+    return checksum(msgpack.packb(header, use_bin_type=True)).hex()
+
+
+class BlockFiles:
+    """Stands in for algod's block and status endpoints over blocks recorded to
+    `directory`, one `<round>.msgp` file each, as `record_blocks` writes them. Replaying
+    a range this way doesn't touch the node"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, round: int) -> str:
+        return os.path.join(self.directory, "{}.msgp".format(round))
+
+    @property
+    def last_round(self) -> int:
+        rounds = [
+            int(name[: -len(".msgp")])
+            for name in os.listdir(self.directory)
+            if name.endswith(".msgp")
+        ]
+        return max(rounds, default=0)
+
+    def block_info(self, round: int, response_format: str = "msgpack") -> bytes:
+        try:
+            with open(self.path(round), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            raise error.AlgodHTTPError("No block file for round {}".format(round), 404)
+
+    def status_after_block(self, round: int) -> dict:
+        return {"last-round": self.last_round}
+
+
+def record_blocks(client, first: int, last: int, directory: str) -> int:
+    """saves rounds `first` to `last` from algod as block files, skipping the ones
+    already there, returns how many it fetched"""
+    files = BlockFiles(directory)
+    os.makedirs(directory, exist_ok=True)
+    fetched = 0
+    for r in range(first, last + 1):
+        if os.path.exists(files.path(r)):
+            continue
+        raw = client.block_info(r, response_format="msgpack")
+        tmp = "{}.{}.tmp".format(files.path(r), os.getpid())
+        with open(tmp, "wb") as f:
+            f.write(raw)
+        os.replace(tmp, files.path(r))
+        fetched += 1
+    return fetched
+
+
+class Follower:
+    """Applies every block after `round` to the models, a group at a time
+
+    Models need `apply(round, group)`, plus `key()`, `dump()` and `load(state)` to be
+    checkpointed. They're updated from the follower's thread, one block at a time.
+    """
+
+    def __init__(
+        self,
+        client,
+        models: Dict[str, object],
+        checkpoint_path: str = None,
+        checkpoint_rounds: int = 16,
+    ):
+        self.client = client
+        self.models = models
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_rounds = checkpoint_rounds
+
+        self.lock = threading.Lock()
+        self.round: Optional[int] = None  # last round applied to the models
+        self.hash: Optional[str] = None
+        self.checkpointed = 0
+
+        self.blocks = 0
+        self.groups = 0
+
+        self._thread = None
+        self._stop = False
+
+    def resume(self) -> bool:
+        """loads the checkpoint if it's from this chain and these models, returns
+        whether it did. Otherwise the caller seeds the models and sets `round`"""
+        if self.checkpoint_path is None or not os.path.exists(self.checkpoint_path):
+            return False
+        with open(self.checkpoint_path) as f:
+            stored = json.load(f)
+
+        if stored.get("version") != version:
+            return False
+        if stored["keys"] != {n: m.key() for n, m in self.models.items()}:
+            return False
+        try:
+            if block_hash(self._block(stored["round"])) != stored["hash"]:
+                return False  # the chain was reset underneath us
+        except error.AlgodHTTPError:
+            return False  # or reset and hasn't got that far again
+
+        for name, model in self.models.items():
+            model.load(stored["models"][name])
+        self.round = self.checkpointed = stored["round"]
+        self.hash = stored["hash"]
+        return True
+
+    def checkpoint(self):
+        if self.checkpoint_path is None or self.round is None:
+            return
+        with self.lock:
+            contents = {
+                "version": version,
+                "round": self.round,
+                "hash": self.hash,
+                "keys": {n: m.key() for n, m in self.models.items()},
+                "models": {n: m.dump() for n, m in self.models.items()},
+            }
+            self.checkpointed = self.round
+
+        os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+        # Moved into place so a crash mid write leaves the previous checkpoint
+        tmp = "{}.{}.tmp".format(self.checkpoint_path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(contents, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def step(self, until_round: int = None) -> int:
+        """waits for the next round to close and applies every block up to it, or up to
+        `until_round`, returns the last round applied"""
+        if self.round is None:
+            raise ValueError("Nothing to follow from, resume() or set round first")
+        last = self.client.status_after_block(self.round)["last-round"]
+        if until_round is not None:
+            last = min(last, until_round)
+        for r in range(self.round + 1, last + 1):
+            self.apply(r, self._block(r))
+            if r - self.checkpointed >= self.checkpoint_rounds:
+                self.checkpoint()
+        return self.round
+
+    def apply(self, round: int, block: dict):
+        with self.lock:
+            for group in groups(block):
+                for model in self.models.values():
+                    model.apply(round, group)
+                self.groups += 1
+            self.blocks += 1
+            self.round = round
+            self.hash = block_hash(block)
+
+    def run(self, until_round: int = None):
+        while not self._stop and (until_round is None or self.round < until_round):
+            self.step(until_round)
+        self.checkpoint()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "round": self.round,
+                "blocks": self.blocks,
+                "groups": self.groups,
+                "checkpointed": self.checkpointed,
+            }
+
+    def _block(self, round: int) -> dict:
+        raw = self.client.block_info(round, response_format="msgpack")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)["block"]
@@ -0,0 +1,179 @@
+import base64
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from algosdk import account
+from algosdk.kmd import KMDClient
+from nacl import pwhash, secret, utils
+
+# Exporting keys from KMD takes a request per account. The keystore keeps the exported
+# keys in a file only the user can read, encrypted when a password is given, and checks
+# it against the wallet's address list on each load so only new accounts are exported.
+# With `offline` (or no KMD to talk to) the file is used as it is, which also lets a
+# generated keystore stand in for a wallet entirely.
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+default_keystore_path = os.environ.get(
+    "DEMO_POOL_KEYSTORE", os.path.join(path, ".cache", "keystore.json")
+)
+
+version = 1
+
+Accounts = List[Tuple[str, str]]  # (address, private key)
+
+
+class KeystoreError(Exception):
+    pass
+
+
+class Keystore:
+    """Private keys exported from a KMD wallet, cached on disk"""
+
+    def __init__(
+        self,
+        keystore_path: str = default_keystore_path,
+        password: str = None,
+        export_workers: int = 16,
+    ):
+        self.keystore_path = keystore_path
+        self.password = password or os.environ.get("DEMO_POOL_KEYSTORE_PASSWORD")
+        self.export_workers = export_workers
+
+        self.exported = 0  # keys exported from KMD by the last load
+
+    def accounts(
+        self,
+        kmd: KMDClient,
+        wallet_name: str,
+        wallet_password: str = "",
+        offline: bool = False,
+    ) -> Accounts:
+        """the wallet's accounts, from the keystore where it still matches the wallet"""
+        cached = self.read()
+        if offline:
+            if cached is None:
+                raise KeystoreError("No keystore at {}".format(self.keystore_path))
+            return cached["accounts"]
+
+        try:
+            wallet_id = _wallet_id(kmd, wallet_name)
+        except OSError:
+            if cached is None:
+                raise
+            return cached["accounts"]  # KMD is down, the cache is all we have
+
+        if cached is not None and cached.get("wallet") != [kmd.kmd_address, wallet_id]:
+            cached = None  # a different (or reset) wallet
+
+        handle = kmd.init_wallet_handle(wallet_id, wallet_password)
+        try:
+            addresses = kmd.list_keys(handle)
+            known = dict(cached["accounts"]) if cached is not None else {}
+            missing = [addr for addr in addresses if addr not in known]
+
+            self.exported = len(missing)
+            if missing:
+                with ThreadPoolExecutor(self.export_workers) as pool:
+                    keys = pool.map(
+                        lambda addr: kmd.export_key(handle, wallet_password, addr),
+                        missing,
+                    )
+                    known.update(zip(missing, keys))
+        finally:
+            kmd.release_wallet_handle(handle)
+
+        accounts = [(addr, known[addr]) for addr in addresses]
+        if cached is None or self.exported or len(accounts) != len(cached["accounts"]):
+            self.write(accounts, [kmd.kmd_address, wallet_id])
+        return accounts
+
+    def read(self) -> Optional[dict]:
+        if not os.path.exists(self.keystore_path):
+            return None
+        with open(self.keystore_path) as f:
+            stored = json.load(f)
+
+        if stored.get("version") != version:
+            return None
+        if "box" in stored:
+            stored = json.loads(self._open(stored))
+        stored["accounts"] = [tuple(a) for a in stored["accounts"]]
+        return stored
+
+    def write(self, accounts: Accounts, wallet: list = None):
+        contents = {"version": version, "wallet": wallet, "accounts": accounts}
+        if self.password:
+            contents = self._seal(json.dumps(contents).encode())
+
+        os.makedirs(os.path.dirname(self.keystore_path) or ".", mode=0o700, exist_ok=True)
+        # Written to a private temporary file and moved into place, so the keys are
+        # never readable by anyone else and a reader never sees half a file
+        tmp = "{}.{}.tmp".format(self.keystore_path, os.getpid())
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(contents, f)
+        os.replace(tmp, self.keystore_path)
+
+    def generate(self, count: int) -> Accounts:
+        """writes a keystore of fresh accounts that belong to no wallet, for use offline
+        with a node that funds them (`python -m common.node --keystore`)"""
+        accounts = [
+            (addr, sk) for sk, addr in (account.generate_account() for _ in range(count))
+        ]
+        self.write(accounts)
+        return accounts
+
+    def clear(self):
+        if os.path.exists(self.keystore_path):
+            os.remove(self.keystore_path)
+
+    def _key(self, salt: bytes) -> bytes:
+        return pwhash.argon2id.kdf(
+            secret.SecretBox.KEY_SIZE,
+            self.password.encode(),
+            salt,
+            opslimit=pwhash.argon2id.OPSLIMIT_INTERACTIVE,
+            memlimit=pwhash.argon2id.MEMLIMIT_INTERACTIVE,
+        )
+
+    def _seal(self, plaintext: bytes) -> dict:
+        salt = utils.random(pwhash.argon2id.SALTBYTES)
+        box = secret.SecretBox(self._key(salt)).encrypt(plaintext)
+        return {
+            "version": version,
+            "salt": base64.b64encode(salt).decode(),
+            "box": base64.b64encode(box).decode(),
+        }
+
+    def _open(self, stored: dict) -> bytes:
+        if not self.password:
+            raise KeystoreError("The keystore is encrypted, set a password")
+        salt = base64.b64decode(stored["salt"])
+        try:
+            return secret.SecretBox(self._key(salt)).decrypt(
+                base64.b64decode(stored["box"])
+            )
+        except Exception:
+            raise KeystoreError("Wrong password for {}".format(self.keystore_path))
+
+
+def _wallet_id(kmd: KMDClient, wallet_name: str) -> str:
+    for wallet in kmd.list_wallets():
+        if wallet["name"] == wallet_name:
+            return wallet["id"]
+    raise KeystoreError("Wallet not found: {}".format(wallet_name))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="generate an offline keystore")
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--path", default=default_keystore_path)
+    args = parser.parse_args()
+
+    accounts = Keystore(args.path).generate(args.accounts)
+    print("Wrote {} accounts to {}".format(len(accounts), args.path))
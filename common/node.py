@@ -0,0 +1,582 @@
+import argparse
+import base64
+import hashlib
+import io
+import json
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+import msgpack
+from algosdk import account, encoding
+from nacl.exceptions import BadSignatureError
+from nacl.signing import VerifyKey
+
+from common.avm import (
+    AVMError,
+    Ledger,
+    TxnResult,
+    fields_to_msgpack,
+    max_txn_life,
+    min_txn_fee,
+)
+from common.keystore import Keystore
+from common.wire import (
+    encode_txid,
+    group_id_of,
+    pending_info,
+    strip_genesis,
+    to_json,
+    txid_of,
+)
+
+# Local stand-in for the algod and KMD endpoints the demos use, backed by the in-memory
+# ledger in common/avm.py. Point the demo clients at it in place of sandbox to measure
+# throughput and latency without a network or Docker:
+#
+#   python -m common.node --round-time 0
+#
+# Groups are evaluated as they arrive, so a rejected group fails the POST the same way
+# algod's transaction pool check does. They're confirmed when the next block closes,
+# every `round_time` seconds, or straight away with a round time of 0 (like sandbox's
+# dev mode). Programs are only ever run from the handles `/v2/teal/compile` returns.
+
+genesis_id = "avm-localnet-v1"
+genesis_hash = base64.b64encode(hashlib.sha256(genesis_id.encode()).digest()).decode()
+consensus_version = "avm-localnet"
+
+wallet_name = "unencrypted-default-wallet"
+wallet_id = hashlib.sha256(wallet_name.encode()).hexdigest()[:32]
+
+default_balance = 4 * 10**15
+
+# How long /v2/status/wait-for-block-after blocks before returning anyway
+wait_timeout = 60.0
+
+
+class NodeError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def apply_data(result: TxnResult) -> dict:
+    """what evaluating a transaction adds to it in a block, in msgpack form"""
+    ad = {}
+    if result.created_app:
+        ad["apid"] = result.created_app
+    if result.created_asset:
+        ad["caid"] = result.created_asset
+
+    dt = {}
+    if result.logs:
+        dt["lg"] = list(result.logs)
+    if result.inner:
+        dt["itx"] = [
+            {"txn": fields_to_msgpack(r.fields), **apply_data(r)} for r in result.inner
+        ]
+    if dt:
+        ad["dt"] = dt
+    return ad
+
+
+class Node:
+    """An algod and KMD pair over a single in-memory ledger"""
+
+    def __init__(
+        self,
+        ledger: Ledger = None,
+        round_time: float = 0.0,
+        accounts: int = 3,
+        balance: int = default_balance,
+        verify: bool = True,
+        token: str = None,
+        keys: Dict[str, str] = None,
+    ):
+        self.ledger = ledger or Ledger(timestamp=int(time.time()))
+        self.round_time = round_time
+        self.verify = verify
+        self.token = token
+
+        # Everything touching the ledger or the tables below holds this
+        self.lock = threading.Condition()
+
+        # The default wallet, funded like sandbox's genesis accounts. Pass `keys` to
+        # use known accounts rather than fresh ones
+        if keys is None:
+            keys = {
+                addr: sk
+                for sk, addr in (account.generate_account() for _ in range(accounts))
+            }
+        self.keys: Dict[str, str] = dict(keys)
+        for addr in self.keys:
+            self.ledger.fund(addr, balance)
+        self.handles = set()
+
+        # Signed transactions with their apply data, by txid and in blocks by round
+        self.txns: Dict[str, list] = {}  # txid -> [signed txn, confirmed round]
+        self.expires: Dict[int, List[str]] = {}  # last valid round -> txids
+        self.pending: List[str] = []  # txids waiting on the next block
+        self.blocks: Dict[int, dict] = {self.ledger.round: self._header()}
+        self.pruned = 0
+        self.last_block = time.monotonic()
+
+        self.servers: List[ThreadingHTTPServer] = []
+        self._stop = threading.Event()
+
+    # Blocks
+
+    def close_block(self):
+        """confirms everything pending in a new block, the caller holds the lock"""
+        now = time.time()
+        self.ledger.advance(1, max(0, int(now) - self.ledger.timestamp))
+        self.last_block = time.monotonic()
+
+        block = self._header()
+        if self.pending:
+            block["txns"] = []
+            for txid in self.pending:
+                self.txns[txid][1] = self.ledger.round
+                block["txns"].append(strip_genesis(self.txns[txid][0]))
+        self.blocks[self.ledger.round] = block
+        self.pending = []
+
+        # Forget transactions and blocks once they're well past any validity window
+        while self.pruned < self.ledger.round - max_txn_life:
+            self.pruned += 1
+            self.blocks.pop(self.pruned, None)
+            for txid in self.expires.pop(self.pruned, []):
+                self.txns.pop(txid, None)
+
+        self.lock.notify_all()
+
+    def _header(self) -> dict:
+        return {
+            "gen": genesis_id,
+            "gh": base64.b64decode(genesis_hash),
+            "rnd": self.ledger.round,
+            "ts": self.ledger.timestamp,
+        }
+
+    def _run_blocks(self):
+        while not self._stop.wait(self.round_time):
+            with self.lock:
+                self.close_block()
+
+    def wait_for_block_after(self, round: int, timeout: float = wait_timeout):
+        with self.lock:
+            self.lock.wait_for(lambda: self.ledger.round > round, timeout)
+            return self.status()
+
+    # algod
+
+    def status(self) -> dict:
+        r = self.ledger.round
+        return {
+            "catchup-time": 0,
+            "last-round": r,
+            "last-version": consensus_version,
+            "next-version": consensus_version,
+            "next-version-round": r + 1,
+            "next-version-supported": True,
+            "stopped-at-unsupported-round": False,
+            "time-since-last-round": int((time.monotonic() - self.last_block) * 1e9),
+        }
+
+    def suggested_params(self) -> dict:
+        return {
+            "consensus-version": consensus_version,
+            "fee": 0,
+            "genesis-hash": genesis_hash,
+            "genesis-id": genesis_id,
+            "last-round": self.ledger.round,
+            "min-fee": min_txn_fee,
+        }
+
+    def compile(self, src: str) -> dict:
+        try:
+            handle = self.ledger.compile(src)
+        except Exception as e:
+            raise NodeError("compile failed: {}".format(e))
+        return {
+            "hash": encoding.encode_address(encoding.checksum(b"Program" + handle)),
+            "result": base64.b64encode(handle).decode(),
+        }
+
+    def submit(self, raw: bytes) -> str:
+        """checks and evaluates a group of signed transactions, returns the first txid"""
+        stxns = list(msgpack.Unpacker(io.BytesIO(raw), raw=False))
+        if not stxns or not all(isinstance(s, dict) and "txn" in s for s in stxns):
+            raise NodeError("Malformed signed transactions")
+
+        raw_txids = [txid_of(s["txn"]) for s in stxns]
+        txids = [encode_txid(t) for t in raw_txids]
+        for stxn, txid in zip(stxns, txids):
+            self._check(stxn, txid)
+
+        # The group id commits to the txids of the members as they were before it was set
+        grps = {s["txn"].get("grp") for s in stxns}
+        if len(stxns) > 1 or grps != {None}:
+            ungrouped = [
+                txid_of({k: v for k, v in s["txn"].items() if k != "grp"})
+                for s in stxns
+            ]
+            if grps != {group_id_of(ungrouped)}:
+                raise NodeError("transactionGroup: incomplete group")
+
+        with self.lock:
+            for txid in txids:
+                if txid in self.txns:
+                    raise NodeError("transaction already in ledger: {}".format(txid))
+
+            try:
+                results = self.ledger.apply_group([s["txn"] for s in stxns])
+            except AVMError as e:
+                raise NodeError(
+                    "TransactionPool.Remember: transaction {}: {}".format(txids[0], e)
+                )
+
+            for stxn, txid, result in zip(stxns, txids, results):
+                self.txns[txid] = [{**stxn, **apply_data(result)}, None]
+                self.expires.setdefault(stxn["txn"].get("lv", 0), []).append(txid)
+                self.pending.append(txid)
+
+            if self.round_time == 0:
+                self.close_block()
+
+        return txids[0]
+
+    def _check(self, stxn: dict, txid: str):
+        if "sig" not in stxn:
+            raise NodeError(
+                "{}: only single signature transactions are supported".format(txid)
+            )
+
+        txn = stxn["txn"]
+        if txn.get("gh") != base64.b64decode(genesis_hash):
+            raise NodeError("{}: genesis hash mismatch".format(txid))
+        if txn.get("gen", genesis_id) != genesis_id:
+            raise NodeError("{}: genesis id mismatch".format(txid))
+
+        # The ledger doesn't track rekeying, so the sender always has to sign
+        signer = stxn.get("sgnr", txn.get("snd"))
+        if signer != txn.get("snd"):
+            raise NodeError(
+                "{}: should have been authorized by {} but was actually authorized by {}".format(
+                    txid,
+                    encoding.encode_address(txn.get("snd")),
+                    encoding.encode_address(signer),
+                )
+            )
+
+        if self.verify:
+            try:
+                VerifyKey(signer).verify(
+                    b"TX" + msgpack.packb(txn, use_bin_type=True), stxn["sig"]
+                )
+            except (BadSignatureError, ValueError, TypeError):
+                raise NodeError("{}: invalid signature".format(txid))
+
+    def pending_info(self, txid: str) -> dict:
+        with self.lock:
+            if txid not in self.txns:
+                raise NodeError("txn does not exist", 404)
+            stxn, confirmed = self.txns[txid]
+
+        info = pending_info(stxn)
+        if confirmed is not None:
+            info["confirmed-round"] = confirmed
+        return info
+
+    def block(self, round: int, format: str = "json"):
+        with self.lock:
+            block = self.blocks.get(round)
+        if block is None:
+            raise NodeError("ledger does not have entry {}".format(round), 404)
+
+        if format == "msgpack":
+            return msgpack.packb({"block": block}, use_bin_type=True)
+        return to_json({"block": block})
+
+    def account_info(self, addr: str, exclude: str = None) -> dict:
+        if not encoding.is_valid_address(addr):
+            raise NodeError("failed to parse the address")
+        with self.lock:
+            info = self.ledger.account_info(addr)
+        if exclude == "all":
+            for k in ("assets", "created-apps", "created-assets"):
+                info.pop(k)
+        return info
+
+    def account_asset_info(self, addr: str, asset_id: int) -> dict:
+        if not encoding.is_valid_address(addr):
+            raise NodeError("failed to parse the address")
+        with self.lock:
+            amount = self.ledger.holding(addr, asset_id)
+            round = self.ledger.round
+        if amount is None:
+            raise NodeError("account asset info not found", 404)
+        return {
+            "round": round,
+            "asset-holding": {"asset-id": asset_id, "amount": amount, "is-frozen": False},
+        }
+
+    def application_info(self, app_id: int) -> dict:
+        with self.lock:
+            try:
+                return self.ledger.application_info(app_id)
+            except AVMError as e:
+                raise NodeError(str(e), 404)
+
+    # KMD
+
+    def list_wallets(self) -> dict:
+        return {
+            "wallets": [
+                {
+                    "driver_name": "sqlite",
+                    "driver_version": 1,
+                    "id": wallet_id,
+                    "mnemonic_ux": False,
+                    "name": wallet_name,
+                    "supported_txs": ["pay", "keyreg"],
+                }
+            ]
+        }
+
+    def init_wallet_handle(self, body: dict) -> dict:
+        if body.get("wallet_id") != wallet_id:
+            raise NodeError("wallet not found", 404)
+        if body.get("wallet_password", ""):
+            raise NodeError("wrong password")
+        handle = secrets.token_hex(16)
+        with self.lock:
+            self.handles.add(handle)
+        return {"wallet_handle_token": handle}
+
+    def _handle(self, body: dict):
+        if body.get("wallet_handle_token") not in self.handles:
+            raise NodeError("handle does not exist", 401)
+
+    def list_keys(self, body: dict) -> dict:
+        self._handle(body)
+        return {"addresses": list(self.keys)}
+
+    def export_key(self, body: dict) -> dict:
+        self._handle(body)
+        if body.get("address") not in self.keys:
+            raise NodeError("key does not exist in this wallet", 404)
+        return {"private_key": self.keys[body["address"]]}
+
+    def release_wallet_handle(self, body: dict) -> dict:
+        with self.lock:
+            self.handles.discard(body.get("wallet_handle_token"))
+        return {}
+
+    # Serving
+
+    def serve(
+        self, host: str = "localhost", algod_port: int = 4001, kmd_port: int = 4002
+    ):
+        """starts algod and KMD listeners (and the block timer) on background threads"""
+        for port, routes, header, json_body in (
+            (algod_port, algod_routes, "X-Algo-API-Token", False),
+            (kmd_port, kmd_routes, "X-KMD-API-Token", True),
+        ):
+            handler = type(
+                "Handler",
+                (RequestHandler,),
+                {
+                    "node": self,
+                    "routes": routes,
+                    "token_header": header,
+                    "json_body": json_body,
+                },
+            )
+            server = Server((host, port), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+
+        if self.round_time > 0:
+            threading.Thread(target=self._run_blocks, daemon=True).start()
+
+    @property
+    def algod_address(self) -> str:
+        return "http://{}:{}".format(*self.servers[0].server_address[:2])
+
+    @property
+    def kmd_address(self) -> str:
+        return "http://{}:{}".format(*self.servers[1].server_address[:2])
+
+    def shutdown(self):
+        self._stop.set()
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+        self.servers = []
+
+
+# (method, path pattern, handler) where the handler gets the node, the path match,
+# the query string and the body, raw for algod and decoded JSON for KMD
+algod_routes = [
+    ("GET", r"/v2/status", lambda n, m, q, b: n.status()),
+    (
+        "GET",
+        r"/v2/status/wait-for-block-after/(\d+)",
+        lambda n, m, q, b: n.wait_for_block_after(int(m[1])),
+    ),
+    ("GET", r"/v2/transactions/params", lambda n, m, q, b: n.suggested_params()),
+    ("POST", r"/v2/teal/compile", lambda n, m, q, b: n.compile(b.decode())),
+    ("POST", r"/v2/transactions", lambda n, m, q, b: {"txId": n.submit(b)}),
+    (
+        "GET",
+        r"/v2/transactions/pending/([A-Z2-7]+)",
+        lambda n, m, q, b: n.pending_info(m[1]),
+    ),
+    (
+        "GET",
+        r"/v2/blocks/(\d+)",
+        lambda n, m, q, b: n.block(int(m[1]), q.get("format", "json")),
+    ),
+    (
+        "GET",
+        r"/v2/accounts/([A-Z2-7]+)",
+        lambda n, m, q, b: n.account_info(m[1], q.get("exclude")),
+    ),
+    (
+        "GET",
+        r"/v2/accounts/([A-Z2-7]+)/assets/(\d+)",
+        lambda n, m, q, b: n.account_asset_info(m[1], int(m[2])),
+    ),
+    (
+        "GET",
+        r"/v2/applications/(\d+)",
+        lambda n, m, q, b: n.application_info(int(m[1])),
+    ),
+]
+
+kmd_routes = [
+    ("GET", r"/v1/wallets", lambda n, m, q, b: n.list_wallets()),
+    ("POST", r"/v1/wallet/init", lambda n, m, q, b: n.init_wallet_handle(b)),
+    ("POST", r"/v1/wallet/release", lambda n, m, q, b: n.release_wallet_handle(b)),
+    ("POST", r"/v1/key/list", lambda n, m, q, b: n.list_keys(b)),
+    ("POST", r"/v1/key/export", lambda n, m, q, b: n.export_key(b)),
+]
+
+algod_routes = [(m, re.compile(p + "$"), fn) for m, p, fn in algod_routes]
+kmd_routes = [(m, re.compile(p + "$"), fn) for m, p, fn in kmd_routes]
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections as soon as a client opens a few dozen
+    # at once
+    request_queue_size = 1024
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    # Send each response in one write, headers and body split across packets stall
+    # keep-alive clients on delayed acks
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    node: Node
+    routes: list
+    token_header: str
+    json_body: bool
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str):
+        url = urlparse(self.path)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if self.json_body:
+            body = json.loads(body) if body else {}
+
+        try:
+            token = self.headers.get(self.token_header)
+            if self.node.token and token != self.node.token:
+                raise NodeError("Invalid API Token", 401)
+
+            for route_method, pattern, fn in self.routes:
+                match = pattern.match(url.path)
+                if match and route_method == method:
+                    self._reply(200, fn(self.node, match, query, body))
+                    return
+            raise NodeError("Not Found", 404)
+        except NodeError as e:
+            self._reply(e.status, {"message": str(e)})
+        except Exception as e:
+            self._reply(500, {"message": "{}: {}".format(type(e).__name__, e)})
+
+    def _reply(self, status: int, payload):
+        if isinstance(payload, bytes):
+            data, content_type = payload, "application/msgpack"
+        else:
+            data, content_type = json.dumps(payload).encode(), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve the algod and KMD endpoints the demos use from an in-memory ledger"
+    )
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--algod-port", type=int, default=4001)
+    parser.add_argument("--kmd-port", type=int, default=4002)
+    parser.add_argument(
+        "--round-time",
+        type=float,
+        default=0.0,
+        help="seconds per block, 0 confirms every group as soon as it arrives",
+    )
+    parser.add_argument("--accounts", type=int, default=3)
+    parser.add_argument(
+        "--keystore",
+        help="fund the accounts in this keystore (`python -m common.keystore`) "
+        "and serve them as the default wallet, instead of generating --accounts",
+    )
+    parser.add_argument(
+        "--no-verify", action="store_true", help="skip signature verification"
+    )
+    args = parser.parse_args()
+
+    keys = None
+    if args.keystore:
+        keys = dict(Keystore(args.keystore).read()["accounts"])
+
+    node = Node(
+        round_time=args.round_time,
+        accounts=args.accounts,
+        verify=not args.no_verify,
+        keys=keys,
+    )
+    node.serve(args.host, args.algod_port, args.kmd_port)
+    print("algod on {}, kmd on {}".format(node.algod_address, node.kmd_address))
+    for addr in list(node.keys)[:10]:
+        print("\t{}".format(addr))
+    if len(node.keys) > 10:
+        print("\t... and {} more".format(len(node.keys) - 10))
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        node.shutdown()
@@ -0,0 +1,95 @@
+import threading
+from typing import Optional
+
+from algosdk.future.transaction import SuggestedParams
+
+# Suggested params only change from round to round, but the demos ask algod for them
+# before every group. This keeps one copy, moves its validity window along as rounds
+# close and refetches it every few rounds in case the fee has moved.
+
+
+class Params:
+    """Hands out copies of the suggested params, following rounds in a background
+    thread so asking for them doesn't cost a request"""
+
+    def __init__(self, client, validity: int = 1000, refresh_rounds: int = 8):
+        self.client = client
+        self.validity = validity
+        self.refresh_rounds = refresh_rounds
+
+        self.lock = threading.Lock()
+        self.cached: Optional[SuggestedParams] = None
+        self.fetched_round = 0
+        self.round = 0
+
+        self.fetches = 0
+        self.hits = 0
+
+        self._thread = None
+        self._stop = False
+
+    def get(self, covers: int = None) -> SuggestedParams:
+        """returns params valid from the latest round we know of. Pass `covers` to pay
+        the minimum fee for that many transactions with a flat fee, so one transaction
+        can cover its group or an app's inner transactions"""
+        with self.lock:
+            if self.cached is None:
+                self._store(self.client.suggested_params())
+            else:
+                self.hits += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            return self._copy(covers)
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {"round": self.round, "fetches": self.fetches, "hits": self.hits}
+
+    def close(self):
+        self._stop = True
+
+    def _store(self, sp: SuggestedParams):
+        """the caller holds the lock"""
+        self.cached = sp
+        self.fetches += 1
+        self.fetched_round = self.round = max(self.round, sp.first)
+
+    def _copy(self, covers: int = None) -> SuggestedParams:
+        sp = self.cached
+        fee, flat_fee = sp.fee, sp.flat_fee
+        if covers is not None:
+            # Overpaying per byte (fee = min_fee * n without flat_fee) costs n * min_fee
+            # for every byte of the transaction, a flat fee is what was meant
+            fee, flat_fee = sp.min_fee * covers, True
+        return SuggestedParams(
+            fee,
+            self.round,
+            self.round + self.validity,
+            sp.gh,
+            sp.gen,
+            flat_fee,
+            sp.consensus_version,
+            sp.min_fee,
+        )
+
+    def _advance(self, round: int) -> bool:
+        """moves the window to `round`, returns whether it's time to refetch"""
+        with self.lock:
+            self.round = max(self.round, round)
+            return self.round - self.fetched_round >= self.refresh_rounds
+
+    def _run(self):
+        while not self._stop:
+            try:
+                last = self.client.status_after_block(self.round)["last-round"]
+                if self._advance(last):
+                    sp = self.client.suggested_params()
+                    with self.lock:
+                        self._store(sp)
+            except Exception:
+                # Drop the copy so the next caller fetches (and sees any error) itself
+                with self.lock:
+                    self.cached = None
+                    self._thread = None
+                return
@@ -0,0 +1,167 @@
+import base64
+import multiprocessing
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Union
+
+import msgpack
+from algosdk.future.transaction import Transaction
+from nacl.signing import SigningKey
+
+from common.wire import checksum, encode_txid, group_id_of
+
+# Signs groups of transactions in their canonical msgpack dict form. The `Signer`
+# spreads that over a pool of worker processes, each loading the private keys once when
+# it starts, so only unsigned transactions and signed bytes cross between processes.
+
+# Msgpack prefix of a signed transaction, {"sig": <64 bytes>, "txn": ...}, so the
+# transaction is only packed once to hash, sign and send it
+_sig_prefix = b"\x82\xa3sig\xc4\x40"
+_txn_key = b"\xa3txn"
+
+# The signature and the keys around it, for estimating a signed transaction's size
+sig_overhead = len(_sig_prefix) + 64 + len(_txn_key)
+
+
+class SignedGroup(NamedTuple):
+    txids: List[str]
+    first_round: int
+    raw: bytes  # the signed transactions back to back, as algod takes them
+
+
+def pack(txn: dict) -> bytes:
+    # Canonical msgpack leaves out empty fields and sorts the keys
+    return msgpack.packb(
+        {k: v for k, v in sorted(txn.items()) if v}, use_bin_type=True
+    )
+
+
+def signing_key(sk: str) -> SigningKey:
+    """the ed25519 key for a private key as algosdk encodes it"""
+    return SigningKey(base64.b64decode(sk)[:32])
+
+
+def sign_group(txns: List[dict], keys: Dict[bytes, SigningKey]) -> SignedGroup:
+    """signs each transaction with the key for its sender, assigning a group id first
+    to groups that don't have one"""
+    if len(txns) > 1 and not txns[0].get("grp"):
+        gid = group_id_of([checksum(b"TX" + pack(t)) for t in txns])
+        for txn in txns:
+            txn["grp"] = gid
+
+    txids, raw = [], []
+    for txn in txns:
+        packed = pack(txn)
+        to_sign = b"TX" + packed
+        txids.append(encode_txid(checksum(to_sign)))
+        signature = keys[txn["snd"]].sign(to_sign).signature
+        raw.append(_sig_prefix + signature + _txn_key + packed)
+
+    return SignedGroup(txids, min(t["fv"] for t in txns), b"".join(raw))
+
+
+# Keys of the current worker process, set once by `_init_worker`
+_worker_keys: Dict[bytes, SigningKey] = {}
+
+
+def _init_worker(sks: List[str]):
+    global _worker_keys
+    _worker_keys = _load_keys(sks)
+
+
+def _sign_in_worker(txns: List[dict]) -> SignedGroup:
+    return sign_group(txns, _worker_keys)
+
+
+def _load_keys(sks: List[str]) -> Dict[bytes, SigningKey]:
+    keys = {}
+    for sk in sks:
+        key = signing_key(sk)
+        keys[bytes(key.verify_key)] = key
+    return keys
+
+
+class Signer:
+    """Signs batches of groups across a process pool, returning them in order
+
+    Groups are lists of algosdk transactions or their msgpack dict form. With
+    `processes=0` groups are signed inline, which is quicker for small batches.
+    """
+
+    def __init__(self, sks: List[str], processes: int = None, chunksize: int = 64):
+        self.keys = _load_keys(sks)
+        self.chunksize = chunksize
+        self.processes = multiprocessing.cpu_count() if processes is None else processes
+
+        self._pool = None
+        if self.processes > 0:
+            self._pool = multiprocessing.Pool(
+                self.processes, initializer=_init_worker, initargs=(sks,)
+            )
+
+    def sign(
+        self, groups: Iterable[List[Union[dict, Transaction]]]
+    ) -> List[SignedGroup]:
+        return list(self.stream(groups))
+
+    def stream(
+        self, groups: Iterable[List[Union[dict, Transaction]]]
+    ) -> Iterator[SignedGroup]:
+        """yields signed groups as they're ready, so sending the first can start while
+        the rest are still being signed"""
+        prepared = (_as_dicts(group) for group in groups)
+        if self._pool is None:
+            return (sign_group(txns, self.keys) for txns in prepared)
+        return self._pool.imap(_sign_in_worker, prepared, self.chunksize)
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _as_dicts(group: List[Union[dict, Transaction]]) -> List[dict]:
+    return [t if isinstance(t, dict) else dict(t.dictify()) for t in group]
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from algosdk import account, encoding
+
+    parser = argparse.ArgumentParser(description="benchmark signing payment pairs")
+    parser.add_argument("--groups", type=int, default=20000)
+    parser.add_argument("--accounts", type=int, default=16)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+
+    accounts = [account.generate_account() for _ in range(args.accounts)]
+    senders = [encoding.decode_address(addr) for _, addr in accounts]
+
+    def groups():
+        # Built in dict form, as AmmClient does, the SDK's constructors would cost more
+        # than signing
+        for i in range(args.groups):
+            snd = senders[i % len(senders)]
+            base = {"amt": 1, "fee": 1000, "fv": 1, "lv": 1001, "gh": bytes(32)}
+            yield [
+                {**base, "snd": snd, "rcv": snd, "type": "pay", "note": bytes([n]) * 8}
+                for n in range(2)
+            ]
+
+    for processes in (0, args.processes):
+        with Signer([sk for sk, _ in accounts], processes) as signer:
+            start = time.perf_counter()
+            count = sum(1 for _ in signer.stream(groups()))
+            elapsed = time.perf_counter() - start
+        print(
+            "{} processes: {} groups in {:.2f}s, {:.0f} per second".format(
+                signer.processes, count, elapsed, count / elapsed
+            )
+        )
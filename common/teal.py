@@ -0,0 +1,149 @@
+import base64
+from typing import Dict, List, NamedTuple
+
+from algosdk import encoding
+
+# Minimal reader for TEAL source as emitted by PyTeal, shared by the cost analyzer and
+# the offline interpreter
+
+named_ints = {
+    # OnCompletion
+    "NoOp": 0,
+    "OptIn": 1,
+    "CloseOut": 2,
+    "ClearState": 3,
+    "UpdateApplication": 4,
+    "DeleteApplication": 5,
+    # TypeEnum
+    "unknown": 0,
+    "pay": 1,
+    "keyreg": 2,
+    "acfg": 3,
+    "axfer": 4,
+    "afrz": 5,
+    "appl": 6,
+}
+
+branch_ops = {"b", "bz", "bnz", "callsub"}
+halt_ops = {"return", "err", "retsub"}
+
+
+class Op(NamedTuple):
+    op: str
+    args: List[str]
+    line: int
+
+
+class Program:
+    def __init__(self, version: int, ops: List[Op], labels: Dict[str, int]):
+        self.version = version
+        self.ops = ops
+        # label name -> index of the op that follows it
+        self.labels = labels
+
+
+def tokenize(line: str) -> List[str]:
+    tokens, i, n = [], 0, len(line)
+    while i < n:
+        c = line[i]
+        if c.isspace():
+            i += 1
+        elif line.startswith("//", i):
+            break
+        elif c == '"':
+            j = i + 1
+            while j < n and line[j] != '"':
+                j += 2 if line[j] == "\\" else 1
+            tokens.append(line[i : j + 1])
+            i = j + 1
+        else:
+            j = i
+            while j < n and not line[j].isspace():
+                j += 1
+            tokens.append(line[i:j])
+            i = j
+    return tokens
+
+
+def parse(src: str) -> Program:
+    version, ops, labels = 1, [], {}
+    for lineno, line in enumerate(src.splitlines(), 1):
+        tokens = tokenize(line)
+        if not tokens:
+            continue
+
+        if tokens[0] == "#pragma":
+            if tokens[1] == "version":
+                version = int(tokens[2])
+            continue
+
+        if len(tokens) == 1 and tokens[0].endswith(":"):
+            labels[tokens[0][:-1]] = len(ops)
+            continue
+
+        ops.append(Op(tokens[0], tokens[1:], lineno))
+
+    return Program(version, ops, labels)
+
+
+def parse_int(token: str) -> int:
+    if token in named_ints:
+        return named_ints[token]
+    return int(token, 0)
+
+
+def _unescape(s: str) -> bytes:
+    out, i = bytearray(), 0
+    raw = s.encode()
+    while i < len(raw):
+        c = raw[i]
+        if c != ord("\\"):
+            out.append(c)
+            i += 1
+            continue
+
+        esc = chr(raw[i + 1])
+        if esc == "x":
+            out.append(int(raw[i + 2 : i + 4], 16))
+            i += 4
+            continue
+
+        out.append(ord({"n": "\n", "r": "\r", "t": "\t", "0": "\0"}.get(esc, esc)))
+        i += 2
+    return bytes(out)
+
+
+def parse_bytes(args: List[str]) -> bytes:
+    """decodes the immediate of a `byte` or `pushbytes` op"""
+    first = args[0]
+    if first.startswith('"'):
+        return _unescape(first[1:-1])
+    if first.startswith("0x"):
+        return bytes.fromhex(first[2:])
+    if first in ("base64", "b64"):
+        return base64.b64decode(args[1])
+    if first in ("base32", "b32"):
+        return base64.b32decode(args[1] + "=" * (-len(args[1]) % 8))
+    if first.startswith(("base64(", "b64(")):
+        return base64.b64decode(first[first.index("(") + 1 : -1])
+    if first.startswith(("base32(", "b32(")):
+        inner = first[first.index("(") + 1 : -1]
+        return base64.b32decode(inner + "=" * (-len(inner) % 8))
+    raise ValueError("Unsupported byte immediate: {}".format(" ".join(args)))
+
+
+def method_selector(signature: str) -> bytes:
+    return encoding.checksum(signature.encode())[:4]
+
+
+def const_value(op: Op):
+    """returns the value pushed by a constant pseudo-op, int or bytes"""
+    if op.op in ("int", "pushint"):
+        return parse_int(op.args[0])
+    if op.op in ("byte", "pushbytes"):
+        return parse_bytes(op.args)
+    if op.op == "addr":
+        return encoding.decode_address(op.args[0])
+    if op.op == "method":
+        return method_selector(_unescape(op.args[0][1:-1]).decode())
+    raise ValueError("Not a constant: {}".format(op.op))
@@ -0,0 +1,107 @@
+import base64
+import hashlib
+from typing import List
+
+import msgpack
+from algosdk import encoding
+
+# Encodings shared by the node stand-in and the clients that follow its blocks:
+# transaction and group ids, signed transactions as they're stored in a block, and the
+# JSON algod renders them as in pending transaction responses
+
+# Msgpack keys that hold addresses, rendered in base32 rather than base64 as JSON
+address_keys = {
+    "snd",
+    "rcv",
+    "close",
+    "arcv",
+    "aclose",
+    "asnd",
+    "rekey",
+    "fadd",
+    "sgnr",
+    "apat",
+    "m",
+    "r",
+    "f",
+    "c",
+}
+
+
+def checksum(data: bytes) -> bytes:
+    """sha512/256 as `encoding.checksum`, through OpenSSL where it's available"""
+    try:
+        return hashlib.new("sha512_256", data).digest()
+    except ValueError:
+        return encoding.checksum(data)
+
+
+def txid_of(txn: dict) -> bytes:
+    """the raw transaction id of a transaction in its canonical msgpack dict form"""
+    return checksum(b"TX" + msgpack.packb(txn, use_bin_type=True))
+
+
+def encode_txid(raw: bytes) -> str:
+    return base64.b32encode(raw).decode().strip("=")
+
+
+def group_id_of(txids: List[bytes]) -> bytes:
+    packed = msgpack.packb({"txlist": txids}, use_bin_type=True)
+    return checksum(b"TG" + packed)
+
+
+def to_json(v, key: str = None):
+    """renders a msgpack dict the way algod does in JSON responses"""
+    if isinstance(v, dict):
+        return {k: to_json(x, k) for k, x in v.items()}
+    if isinstance(v, list):
+        return [to_json(x, key) for x in v]
+    if isinstance(v, bytes):
+        if key in address_keys and len(v) == 32:
+            return encoding.encode_address(v)
+        return base64.b64encode(v).decode()
+    return v
+
+
+def strip_genesis(stxn: dict) -> dict:
+    """a signed transaction as a block stores it, the genesis fields come from the header"""
+    txn = dict(stxn["txn"])
+    entry = {k: v for k, v in stxn.items() if k != "txn"}
+    if txn.pop("gen", None) is not None:
+        entry["hgi"] = True
+    if txn.pop("gh", None) is not None:
+        entry["hgh"] = True
+    entry["txn"] = txn
+    return entry
+
+
+def restore_genesis(entry: dict, block: dict) -> dict:
+    """the inverse of strip_genesis, returns the transaction as it was signed"""
+    txn = dict(entry["txn"])
+    if entry.get("hgi"):
+        txn["gen"] = block["gen"]
+    if entry.get("hgh"):
+        txn["gh"] = block["gh"]
+    return dict(sorted(txn.items()))
+
+
+def pending_info(stxn: dict) -> dict:
+    """the pending transaction response for a signed transaction with its apply data"""
+    signed = {k: stxn[k] for k in ("lsig", "msig", "sgnr", "sig", "txn") if k in stxn}
+    info = {"pool-error": "", "txn": to_json(signed)}
+
+    if "apid" in stxn:
+        info["application-index"] = stxn["apid"]
+    if "caid" in stxn:
+        info["asset-index"] = stxn["caid"]
+    if "ca" in stxn:
+        info["closing-amount"] = stxn["ca"]
+    if "aca" in stxn:
+        info["asset-closing-amount"] = stxn["aca"]
+
+    dt = stxn.get("dt", {})
+    if dt.get("lg"):
+        info["logs"] = [base64.b64encode(log).decode() for log in dt["lg"]]
+    if dt.get("itx"):
+        info["inner-txns"] = [pending_info(inner) for inner in dt["itx"]]
+    return info
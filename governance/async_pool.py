@@ -0,0 +1,204 @@
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import logic
+from algosdk.future.transaction import *
+
+from client import app_args
+from common.aio import AsyncAlgod, AsyncConfirmations, AsyncParams
+from pool import get_approval_src, get_clear_src, seed_amount
+from sandbox import get_accounts
+
+# Coroutine versions of the pool operations in demo.py. Each call awaits its own
+# confirmation, so running many of them concurrently keeps that many groups in flight
+# from a single process.
+
+token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
+url = "http://localhost:4001"
+
+governance_addr = "57QZ4S7YHTWPRAM3DQ2MLNSVLAQB7DTK4D7SUNRIEFMRGOU7DMYFGF55BY"
+
+
+class AsyncGovernancePool:
+    """A governance pool operated through an `AsyncAlgod`"""
+
+    def __init__(
+        self,
+        client: AsyncAlgod,
+        confirmations: AsyncConfirmations,
+        params: AsyncParams,
+        addr: str,
+        sk: str,
+        app_id: int,
+        pool_token: int = None,
+    ):
+        self.client = client
+        self.confirmations = confirmations
+        self.params = params
+        self.addr = addr
+        self.sk = sk
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        self.pool_token = pool_token
+
+    @classmethod
+    async def deploy(
+        cls, client, confirmations, params, addr, sk
+    ) -> "AsyncGovernancePool":
+        """creates and boots a pool, the creator opts in to the pool token"""
+        approval = await client.compile(get_approval_src(lock_start=100, lock_stop=110))
+        clear = await client.compile(get_clear_src())
+
+        sp = await params.get()
+        create_txn = ApplicationCreateTxn(
+            addr,
+            sp,
+            0,
+            base64.b64decode(approval["result"]),
+            base64.b64decode(clear["result"]),
+            StateSchema(32, 32),
+            StateSchema(0, 0),
+        )
+        result = await cls._send(client, confirmations, [create_txn.sign(sk)])
+
+        app_id = result["application-index"]
+        pool = cls(client, confirmations, params, addr, sk, app_id)
+        await pool.boot()
+
+        sp = await params.get()
+        optin_txn = AssetTransferTxn(addr, sp, addr, 0, pool.pool_token)
+        await pool.send([optin_txn])
+        return pool
+
+    @staticmethod
+    async def _send(client, confirmations, signed_group) -> dict:
+        await client.send_transactions(signed_group)
+        # return the result for the last txid
+        return (await confirmations.wait_group(signed_group, 4))[-1]
+
+    async def send(self, txns: list) -> dict:
+        if len(txns) > 1:
+            txns = assign_group_id(txns)
+        signed = [txn.sign(self.sk) for txn in txns]
+        return await self._send(self.client, self.confirmations, signed)
+
+    def app_call(self, sp, app_args, assets=[], accounts=[], note=None):
+        return ApplicationCallTxn(
+            self.addr,
+            sp,
+            self.app_id,
+            OnComplete.NoOpOC,
+            app_args=app_args,
+            foreign_assets=assets,
+            accounts=accounts,
+            note=note,
+        )
+
+    # Notes only need to be set to keep otherwise identical groups in the same round
+    # from sharing txids
+
+    async def boot(self) -> int:
+        sp = await self.params.get(covers=2)  # pay for the txn on behalf of app
+        result = await self.send(
+            [
+                PaymentTxn(self.addr, sp, self.app_addr, seed_amount),
+                self.app_call(sp, app_args("boot")),
+            ]
+        )
+        self.pool_token = result["inner-txns"][0]["asset-index"]
+        return self.pool_token
+
+    async def join(self, amt: int, note: bytes = None) -> dict:
+        sp = await self.params.get(covers=2)  # pay for the txn
+        return await self.send(
+            [
+                PaymentTxn(self.addr, sp, self.app_addr, amt, note=note),
+                self.app_call(sp, app_args("join", 0), [self.pool_token], note=note),
+            ]
+        )
+
+    async def vote(self, payload: str, note: bytes = None) -> dict:
+        sp = await self.params.get(covers=2)  # pay for the txn
+        return await self.send(
+            [
+                self.app_call(
+                    sp,
+                    app_args("vote", 1, payload.encode()),
+                    accounts=[governance_addr],
+                    note=note,
+                )
+            ]
+        )
+
+    async def exit(self, amt: int, note: bytes = None) -> dict:
+        sp = await self.params.get(covers=2)  # pay for the txn
+        return await self.send(
+            [
+                AssetTransferTxn(
+                    self.addr, sp, self.app_addr, amt, self.pool_token, note=note
+                ),
+                self.app_call(sp, app_args("exit", 0), [self.pool_token], note=note),
+            ]
+        )
+
+
+async def load(rounds: int, concurrency: int):
+    addr, sk = get_accounts()[0]
+
+    async with AsyncAlgod(token, url, connections=concurrency * 2) as client:
+        confirmations = AsyncConfirmations(client)
+        params = AsyncParams(client)
+
+        pool = await AsyncGovernancePool.deploy(
+            client, confirmations, params, addr, sk
+        )
+        print("Created App with id: {}".format(pool.app_id))
+        await pool.vote(json.dumps({"vote": "a"}))
+
+        counter = itertools.count()
+        latencies = []
+
+        async def worker():
+            while (i := next(counter)) < rounds:
+                note = i.to_bytes(8, "big")
+                for step in (pool.join(1000, note), pool.exit(1000, note)):
+                    start = time.perf_counter()
+                    await step
+                    latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+
+        await confirmations.close()
+        await params.close()
+
+    latencies.sort()
+    print(
+        "{} join/exit pairs in {:.2f}s with {} in flight, {:.0f} calls per minute, latency p50 {:.0f}ms p99 {:.0f}ms".format(
+            rounds,
+            elapsed,
+            concurrency,
+            len(latencies) / elapsed * 60,
+            statistics.median(latencies) * 1000,
+            latencies[int(len(latencies) * 0.99)] * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=500, help="join/exit pairs to run")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    asyncio.run(load(args.rounds, args.concurrency))
@@ -0,0 +1,155 @@
+import base64
+import os
+import sys
+from typing import List, NamedTuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import account, constants, encoding, logic
+from algosdk.future.transaction import SuggestedParams
+
+from client import app_args
+from common.confirm import Confirmations
+from common.params import Params
+from common.signing import SignedGroup, sign_group, signing_key
+
+# Settles joins and exits in bulk through `join_batch` and `exit_batch`. Pending
+# requests are packed into batches of up to `max_batch` participants, each batch being
+# their transfers followed by one call that mints or pays for all of them, and the
+# batches into groups of up to `max_group_size` transactions. A full group settles 12
+# participants with 3 app calls, where single joins take 12 groups of 2.
+
+max_batch = 4  # foreign accounts an app call can list
+max_group_size = 16
+batches_per_group = max_group_size // (max_batch + 1)
+
+
+class Request(NamedTuple):
+    method: str  # "join_batch" or "exit_batch"
+    sender: str
+    amount: int  # algos paid in to join, pool tokens sent back to exit
+
+
+Batch = List[Request]  # all of one method
+
+
+def pack(requests: List[Request]) -> List[List[Batch]]:
+    """splits `requests` into batches of one method, in the order they came, and the
+    batches into groups"""
+    batches: List[Batch] = []
+    for method in ("join_batch", "exit_batch"):
+        pending = [r for r in requests if r.method == method]
+        batches.extend(
+            pending[i : i + max_batch] for i in range(0, len(pending), max_batch)
+        )
+    return [
+        batches[i : i + batches_per_group]
+        for i in range(0, len(batches), batches_per_group)
+    ]
+
+
+def batch_txns(
+    sp: SuggestedParams, app_id: int, pool_token: int, caller: str, batch: Batch
+) -> List[dict]:
+    """the transfers in `batch` and the call settling them, sent by `caller`, whose fee
+    covers the inner transactions"""
+    app_addr = encoding.decode_address(logic.get_application_address(app_id))
+    min_fee = sp.min_fee or constants.min_txn_fee
+    txns = []
+    for r in batch:
+        if r.method == "join_batch":
+            txn = {"amt": r.amount, "rcv": app_addr, "type": "pay"}
+        else:
+            txn = {
+                "aamt": r.amount,
+                "arcv": app_addr,
+                "type": "axfer",
+                "xaid": pool_token,
+            }
+        txn.update(snd=encoding.decode_address(r.sender), fee=min_fee)
+        txns.append(txn)
+
+    txns.append(
+        {
+            "apaa": app_args(batch[0].method, 0),
+            "apas": [pool_token],
+            "apat": [encoding.decode_address(r.sender) for r in batch],
+            "apid": app_id,
+            "fee": min_fee * (len(batch) + 1),
+            "snd": encoding.decode_address(caller),
+            "type": "appl",
+        }
+    )
+
+    gh = base64.b64decode(sp.gh)
+    for txn in txns:
+        txn.update(fv=sp.first, lv=sp.last, gen=sp.gen, gh=gh)
+    return txns
+
+
+class Batcher:
+    """Queues joins and exits for the pool at `app_id` and sends them in full groups
+
+    Batch calls are sent and paid for by `addr`. Each participant's transfer is signed
+    with the key it was queued with, since the group it lands in is only known once
+    the queue is packed.
+    """
+
+    def __init__(
+        self,
+        client,
+        app_id: int,
+        pool_token: int,
+        addr: str,
+        sk: str,
+        confirmations: Confirmations = None,
+        params: Params = None,
+    ):
+        self.client = client
+        self.app_id = app_id
+        self.pool_token = pool_token
+        self.addr = addr
+        self.confirmations = confirmations or Confirmations(client)
+        self.params = params or Params(client)
+
+        self.pending: List[Request] = []
+        self._keys = {encoding.decode_address(addr): signing_key(sk)}
+
+    def join(self, sk: str, amount: int):
+        """queues a join paying in `amount` algos from the account of `sk`"""
+        self._queue("join_batch", sk, amount)
+
+    def exit(self, sk: str, amount: int):
+        """queues an exit sending back `amount` pool tokens from the account of `sk`"""
+        self._queue("exit_batch", sk, amount)
+
+    def groups(self, sp: SuggestedParams) -> List[SignedGroup]:
+        """packs and signs everything queued, emptying the queue"""
+        groups = []
+        for batches in pack(self.pending):
+            txns = []
+            for batch in batches:
+                txns.extend(
+                    batch_txns(sp, self.app_id, self.pool_token, self.addr, batch)
+                )
+            groups.append(sign_group(txns, self._keys))
+        self.pending = []
+        return groups
+
+    def flush(self, wait_rounds: int = 4) -> List[dict]:
+        """sends everything queued at once, returns the confirmed info of the last call
+        in each group"""
+        groups = self.groups(self.params.get())
+        futures = []
+        for group in groups:
+            self.client.send_raw_transaction(base64.b64encode(group.raw))
+            last = group.txids[-1]
+            futures.append(
+                self.confirmations.watch(last, group.first_round, wait_rounds)
+            )
+        return [f.result() for f in futures]
+
+    def _queue(self, method: str, sk: str, amount: int):
+        sender = account.address_from_private_key(sk)
+        self._keys[encoding.decode_address(sender)] = signing_key(sk)
+        self.pending.append(Request(method, sender, amount))
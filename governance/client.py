@@ -0,0 +1,38 @@
+import os
+from typing import List
+
+from algosdk import abi
+
+# The governance pool's ABI methods, for building calls by hand. Transaction arguments
+# are the transactions ahead of the call in its group, and reference arguments (accounts
+# and assets) are passed as their index in the call's foreign arrays, where account 0
+# is the sender.
+
+path = os.path.dirname(os.path.abspath(__file__))
+
+default_contract_path = os.path.join(path, "contract.json")
+
+
+def load_contract(contract_path: str = default_contract_path) -> abi.Contract:
+    with open(contract_path) as f:
+        return abi.Contract.from_json(f.read())
+
+
+methods = {m.name: m for m in load_contract().methods}
+
+
+def app_args(method: str, *args) -> List[bytes]:
+    """the app args calling `method` with `args`, one for each argument that isn't a
+    transaction"""
+    m = methods[method]
+    encoded = [m.get_selector()]
+    values = iter(args)
+    for arg in m.args:
+        if abi.is_abi_transaction_type(arg.type):
+            continue
+        value = next(values)
+        if abi.is_abi_reference_type(arg.type):
+            encoded.append(bytes([value]))
+        else:
+            encoded.append(arg.type.encode(value))
+    return encoded
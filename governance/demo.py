@@ -1,15 +1,22 @@
 import base64
 import os
-import json
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from algosdk import *
 from algosdk.algod import AlgodClient
 from algosdk.encoding import msgpack_encode
 from algosdk.v2client import algod
 from algosdk.future.transaction import *
+from common.balances import ALGO, Balances
+from common.confirm import Confirmations
+from common.params import Params
 from sandbox import get_accounts
 from pyteal import compileTeal, Mode
 
+from client import app_args
+from payload import encode_votes, op_ups
 from pool import get_approval_src, get_clear_src, seed_amount
 
 token = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
@@ -17,6 +24,12 @@ url = "http://localhost:4001"
 
 client = algod.AlgodClient(token, url)
 
+# Follows rounds once for every step instead of polling per txid
+confirmations = Confirmations(client)
+
+# Suggested params are fetched once and moved along with the rounds
+params = Params(client)
+
 
 def demo(app_id=None):
     # Get Account from sandbox
@@ -35,12 +48,11 @@ def demo(app_id=None):
     print("Application Address: {}".format(app_addr))
 
     # Bootstrap Pool
-    sp = client.suggested_params()
-    sp.fee = sp.min_fee * 2  # pay for the txn on behalf of app
+    sp = params.get(covers=2)  # pay for the txn on behalf of app
     txn_group = assign_group_id(
         [
             PaymentTxn(addr, sp, app_addr, seed_amount),
-            get_app_call(addr, sp, app_id, app_args=["boot"]),
+            get_app_call(addr, sp, app_id, app_args=app_args("boot")),
         ]
     )
     result = send("boot", [txn.sign(sk) for txn in txn_group])
@@ -48,27 +60,34 @@ def demo(app_id=None):
     # Get the pool token from the result
     pool_token = result["inner-txns"][0]["asset-index"]
     print("Created Pool Token: {}".format(pool_token))
-    print_balances(app_addr, addr, pool_token)
+
+    # Only the holdings printed below are looked up, concurrently, after each step
+    balances = Balances(
+        client,
+        {app_addr: [ALGO, pool_token], addr: [ALGO, pool_token]},
+        names={app_addr: "App", addr: "Participant"},
+        assets={pool_token: "Pool"},
+    )
+    print_balances(balances)
 
     # Opt addr into newly created Pool Token
-    sp = client.suggested_params()
+    sp = params.get()
     txn_group = assign_group_id([get_asset_xfer(addr, sp, pool_token, addr, 0)])
     send("optin", [txn.sign(sk) for txn in txn_group])
-    print_balances(app_addr, addr, pool_token)
+    print_balances(balances)
 
     # Join Governance Pool
-    sp = client.suggested_params()
-    sp.fee = sp.min_fee * 2  # pay for the txn
+    sp = params.get(covers=2)  # pay for the txn
     txn_group = assign_group_id(
         [
+            PaymentTxn(addr, sp, app_addr, 100000),
             get_app_call(
                 addr,
                 sp,
                 app_id,
-                app_args=["join"],
+                app_args=app_args("join", 0),
                 assets=[pool_token],
             ),
-            PaymentTxn(addr, sp, app_addr, 100000),
         ]
     )
 
@@ -77,37 +96,36 @@ def demo(app_id=None):
     #        f.write(base64.b64decode(encoding.msgpack_encode(txn)))
 
     send("join", [txn.sign(sk) for txn in txn_group])
-    print_balances(app_addr, addr, pool_token)
+    print_balances(balances)
 
-    # Vote in governance
-    sp = client.suggested_params()
-    sp.fee = sp.min_fee * 2  # pay for the txn
+    # Vote in governance, the pool expands the payload into the note
+    payload = encode_votes([(1, "a")])
+    sp = params.get(covers=2 + op_ups(payload))  # pay for the txn
     txn_group = assign_group_id(
-        # TODO: need to actually generate the vote payload and pass the governance address
+        # TODO: pass the governance address
         [
             get_app_call(
                 addr,
                 sp,
                 app_id,
-                app_args=["vote", json.dumps({"vote": "a"})],
+                app_args=app_args("vote_compact", 1, payload),
                 accounts=["57QZ4S7YHTWPRAM3DQ2MLNSVLAQB7DTK4D7SUNRIEFMRGOU7DMYFGF55BY"],
             )
         ]
     )
     send("vote", [txn.sign(sk) for txn in txn_group])
-    print_balances(app_addr, addr, pool_token)
+    print_balances(balances)
 
     # Exit governance
-    sp = client.suggested_params()
-    sp.fee = sp.min_fee * 2  # pay for the txn
+    sp = params.get(covers=2)  # pay for the txn
     txn_group = assign_group_id(
         [
-            get_app_call(addr, sp, app_id, ["exit"], [pool_token]),
             get_asset_xfer(addr, sp, pool_token, app_addr, 1000),
+            get_app_call(addr, sp, app_id, app_args("exit", 0), [pool_token]),
         ]
     )
     send("exit", [txn.sign(sk) for txn in txn_group])
-    print_balances(app_addr, addr, pool_token)
+    print_balances(balances)
 
 
 def get_asset_xfer(addr, sp, asset_id, app_addr, amt):
@@ -127,8 +145,8 @@ def get_app_call(addr, sp, app_id, app_args=[], assets=[], accounts=[]):
 
 
 def create_asset(addr, pk, unitname):
-    # Get suggested params from network
-    sp = client.suggested_params()
+    # Get suggested params for the current round
+    sp = params.get()
     # Create the transaction
     create_txn = AssetCreateTxn(
         addr, sp, 1000000, 0, False, asset_name="asset", unit_name=unitname
@@ -136,7 +154,7 @@ def create_asset(addr, pk, unitname):
     # Ship it
     txid = client.send_transaction(create_txn.sign(pk))
     # Wait for the result so we can return the app id
-    result = wait_for_confirmation(client, txid, 4)
+    result = confirmations.wait(txid, sp.first, 4)
     return result["asset-index"]
 
 
@@ -152,8 +170,8 @@ def create_app(addr, pk):
     gschema = StateSchema(32, 32)
     lschema = StateSchema(0, 0)
 
-    # Get suggested params from network
-    sp = client.suggested_params()
+    # Get suggested params for the current round
+    sp = params.get()
     # Create the transaction
     create_txn = ApplicationCreateTxn(
         addr, sp, 0, app_bytes, clear_bytes, gschema, lschema
@@ -166,7 +184,7 @@ def create_app(addr, pk):
     txid = client.send_transaction(signed_txn)
 
     # Wait for the result so we can return the app id
-    result = wait_for_confirmation(client, txid, 4)
+    result = confirmations.wait(txid, sp.first, 4)
 
     return result["application-index"]
 
@@ -180,8 +198,8 @@ def update_app(id, addr, sk):
     clear_result = client.compile(get_clear_src())
     clear_bytes = base64.b64decode(clear_result["result"])
 
-    # Get suggested params from network
-    sp = client.suggested_params()
+    # Get suggested params for the current round
+    sp = params.get()
     # Create the transaction
     update_txn = ApplicationUpdateTxn(addr, sp, id, app_bytes, clear_bytes)
     # Sign it
@@ -190,30 +208,22 @@ def update_app(id, addr, sk):
     txid = client.send_transaction(signed_txn)
 
     # Wait for the result so we can return the app id
-    return wait_for_confirmation(client, txid, 4)
+    return confirmations.wait(txid, sp.first, 4)
 
 
 def send(name, signed_group):
     print("Sending Transaction for {}".format(name))
     client.send_transactions(signed_group)
     # return the result for the last txid
-    return wait_for_confirmation(client, signed_group[-1].get_txid(), 4)
-
-
-def print_balances(app: str, addr: str, pool: int):
-    appbal = client.account_info(app)
-    print("App: ")
-    print("\tAlgo Balance {}".format(appbal["amount"]))
-    for asset in appbal["assets"]:
-        if asset["asset-id"] == pool:
-            print("\tPool Balance {}".format(asset["amount"]))
-
-    addrbal = client.account_info(addr)
-    print("Participant: ")
-    print("\tAlgo Balance {}".format(addrbal["amount"]))
-    for asset in addrbal["assets"]:
-        if asset["asset-id"] == pool:
-            print("\tPool Balance {}".format(asset["amount"]))
+    return confirmations.wait_group(signed_group, 4)[-1]
+
+
+def print_balances(balances: Balances):
+    snapshot, changes = balances.step()
+    print(balances.format(snapshot))
+    if changes:
+        print("Changes: ")
+        print(balances.format_diff(changes))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+from typing import Iterable, List, Tuple, Union
+
+# Compact vote payloads for `vote_compact`, which expands them on chain into the JSON
+# note the governance platform reads. A payload is a kind byte then varints:
+#
+#   commit: b"c" amount             -> af/gov1:j{"com":amount}
+#   votes:  b"v" (measure option)+  -> af/gov1:j[measure:"option",...]
+#
+# where each option is a single lowercase letter. Decoding here rejects exactly what
+# the contract does. `parse_note` reads the notes back.
+
+note_prefix = b"af/gov1:j"
+
+commit_kind = ord("c")
+votes_kind = ord("v")
+
+# At most 4 note bytes a payload byte, so the note stays within 1KB
+max_payload_len = 128
+max_uvarint_len = 9  # 63 bits of value
+
+# Upper bounds on what expanding a payload costs, the contract raises its budget to
+# cover them with inner app calls the caller pays for
+note_base_cost = 160
+note_cost_per_byte = 64
+app_budget = 700
+
+Votes = List[Tuple[int, str]]  # (measure, option)
+
+
+def encode_uvarint(val: int) -> bytes:
+    if val < 0x80:
+        return bytes([val])
+    if val >= 1 << (7 * max_uvarint_len):
+        raise ValueError("{} doesn't fit in {} bytes".format(val, max_uvarint_len))
+    buf = bytearray()
+    while val >= 0x80:
+        buf.append((val & 0x7F) | 0x80)
+        val >>= 7
+    buf.append(val)
+    return bytes(buf)
+
+
+def decode_uvarint(buf: bytes, offset: int) -> Tuple[int, int]:
+    """returns the decoded value and the offset just past it"""
+    val, shift = 0, 0
+    for end in range(offset, min(len(buf), offset + max_uvarint_len)):
+        b = buf[end]
+        val |= (b & 0x7F) << shift
+        if b < 0x80:
+            return val, end + 1
+        shift += 7
+    raise ValueError("Malformed varint at {}".format(offset))
+
+
+def encode_commit(amount: int) -> bytes:
+    return bytes([commit_kind]) + encode_uvarint(amount)
+
+
+def encode_votes(votes: Iterable[Tuple[int, str]]) -> bytes:
+    """`votes` as (measure, option) pairs, e.g. `{5: "a", 6: "c"}.items()`"""
+    buf = bytearray([votes_kind])
+    count = 0
+    for measure, option in votes:
+        if len(option) != 1 or not "a" <= option <= "z":
+            raise ValueError("Option {!r} isn't a lowercase letter".format(option))
+        buf += encode_uvarint(measure)
+        buf += option.encode()
+        count += 1
+    if count == 0:
+        raise ValueError("No votes")
+    if len(buf) > max_payload_len:
+        raise ValueError("Payloads are at most {} bytes".format(max_payload_len))
+    return bytes(buf)
+
+
+def decode(payload: bytes) -> Tuple[str, Union[int, Votes]]:
+    """("commit", amount) or ("votes", [(measure, option), ...])"""
+    if not 0 < len(payload) <= max_payload_len:
+        raise ValueError("Payloads are 1 to {} bytes".format(max_payload_len))
+
+    kind = payload[0]
+    if kind == commit_kind:
+        amount, offset = decode_uvarint(payload, 1)
+        if offset != len(payload):
+            raise ValueError("Trailing bytes after the commitment")
+        return "commit", amount
+
+    if kind != votes_kind:
+        raise ValueError("Unknown payload kind {!r}".format(chr(kind)))
+    votes, offset = [], 1
+    while offset < len(payload):
+        measure, offset = decode_uvarint(payload, offset)
+        if offset >= len(payload) or not 0x61 <= payload[offset] <= 0x7A:
+            raise ValueError("Missing option at {}".format(offset))
+        votes.append((measure, chr(payload[offset])))
+        offset += 1
+    if not votes:
+        raise ValueError("No votes")
+    return "votes", votes
+
+
+def op_ups(payload: bytes) -> int:
+    """at most the inner app calls `vote_compact` makes for the budget to expand
+    `payload`, the call's fee has to cover them as well as its payment"""
+    # OpUp tops the budget up to 10 over what's needed, what's left of the call's own
+    # budget by then more than pays for the loop making the calls
+    needed = note_base_cost + note_cost_per_byte * len(payload) + 10
+    return -(-needed // app_budget)
+
+
+def note(payload: bytes) -> bytes:
+    """the note `vote_compact` sends for `payload`"""
+    kind, value = decode(payload)
+    if kind == "commit":
+        return note_prefix + b'{"com":%d}' % value
+    votes = b",".join(b'%d:"%s"' % (m, o.encode()) for m, o in value)
+    return note_prefix + b"[" + votes + b"]"
+
+
+def parse_note(note: bytes) -> Tuple[str, Union[int, Votes]]:
+    """the inverse of `note`, for notes read back from the chain. Options may be any
+    quoted string here, as the platform's are"""
+    if not note.startswith(note_prefix):
+        raise ValueError("Not a governance note")
+    body = note[len(note_prefix) :]
+
+    if body.startswith(b'{"com":') and body.endswith(b"}"):
+        amount = body[len(b'{"com":') : -1]
+        if not amount.isdigit():
+            raise ValueError("Malformed commitment {!r}".format(amount))
+        return "commit", int(amount)
+
+    if not (body.startswith(b"[") and body.endswith(b"]")) or len(body) == 2:
+        raise ValueError("Malformed note body {!r}".format(body))
+    votes = []
+    for vote in body[1:-1].split(b","):
+        measure, _, option = vote.partition(b":")
+        quoted = len(option) > 2 and option[:1] == option[-1:] == b'"'
+        if not measure.isdigit() or not quoted:
+            raise ValueError("Malformed vote {!r}".format(vote))
+        votes.append((int(measure), option[1:-1].decode()))
+    return "votes", votes
+
+
+if __name__ == "__main__":
+    ballot = {5: "a", 6: "c", 7: "b", 8: "a"}
+    for name, compact in (
+        ("commit", encode_commit(12_345_678_901)),
+        ("votes", encode_votes(ballot.items())),
+    ):
+        expanded = note(compact)
+        print(
+            "{}: {} bytes to vote_compact, {} to vote: {}".format(
+                name, len(compact), len(expanded), expanded.decode()
+            )
+        )
@@ -1,25 +1,46 @@
+import inspect
 import os
+from typing import Tuple
 
+from algosdk import abi as sdk_abi
 from pyteal import *
 from pytealutils.storage import global_get_else
 from pytealutils.string import itoa
 
+from payload import (
+    commit_kind,
+    max_payload_len,
+    note_base_cost,
+    note_cost_per_byte,
+    note_prefix,
+    votes_kind,
+)
+from util import byte, decode_uvarint
+from util import itoa as decimal
+
 
 gov_key = Bytes("gov")
 pool_token_key = Bytes("p")
-
-action_update = Bytes("update")
-action_boot = Bytes("boot")
-
-action_join = Bytes("join")
-action_vote = Bytes("vote")
-action_exit = Bytes("exit")
+reward_per_token_key = Bytes("r")
+accounted_key = Bytes("b")
 
 total_supply = int(1e17)
 seed_amount = int(1e9)
 
-# Takes unix timestamp for locked windows
-def approval(lock_start: int = 0, lock_stop: int = 0):
+# Rewards per pool token are kept in 32.32 fixed point
+reward_scale = 2**32
+# Where the accumulator stops, so a token's value, reward_scale + reward_per_token,
+# still fits in a uint64
+max_reward_per_token = 2**64 - 1 - reward_scale
+
+teal_version = 6
+
+# Takes unix timestamp for locked windows. With `wide`, joins and exits multiply before
+# they divide, keeping the product in 128 bits, rather than truncating algos per token
+# first
+def build_program(
+    lock_start: int = 0, lock_stop: int = 0, wide: bool = False
+) -> Tuple[str, str, sdk_abi.Contract]:
     assert lock_start < lock_stop
 
     # Alias commonly used things
@@ -27,86 +48,301 @@ def approval(lock_start: int = 0, lock_stop: int = 0):
     pool_token = App.globalGet(pool_token_key)
     pool_balance = AssetHolding.balance(me, pool_token)
     governor = global_get_else(gov_key, Global.creator_address())
+    is_governor = Txn.sender() == governor
 
     # Checks for if we're in the window for this action
     before_lock_start = Global.latest_timestamp() < Int(lock_start)
     after_lock_stop = Global.latest_timestamp() > Int(lock_stop)
 
+    # A pool token is worth an algo plus the rewards per token so far, which the
+    # accumulator keeps in global state, so pricing a join or exit doesn't need the
+    # app's balance or the tokens minted
+    reward_per_token = App.globalGet(reward_per_token_key)
+    accounted = App.globalGet(accounted_key)  # app balance as of the last call
+    token_value = Int(reward_scale) + reward_per_token
+
     @Subroutine(TealType.uint64)
     def mint_tokens(algos_in):
-        # Mint in 1:1 with algos passed in
-        return algos_in
+        if wide:
+            return WideRatio([algos_in, Int(reward_scale)], [token_value])
+        # 1:1 with algos passed in, until rewards make a token worth 2 algos
+        return algos_in / (token_value / Int(reward_scale))
 
     @Subroutine(TealType.uint64)
-    def burn_tokens(
-        amt,
-        balance_algos,
-        tokens_minted,
-    ):
+    def burn_tokens(amt):
+        if wide:
+            return WideRatio([amt, token_value], [Int(reward_scale)])
         # Return the number of tokens * (algos per token)
-        return amt * ((balance_algos - Int(seed_amount)) / tokens_minted)
+        return amt * (token_value / Int(reward_scale))
 
+    # Return the number of tokens minted
     @Subroutine(TealType.uint64)
-    def join():
-        # Alias for specific txn indicies
-        app_call, payment = Gtxn[0], Gtxn[1]
+    def get_minted():
+        return Seq(pool_balance, Int(total_supply) - pool_balance.value())
+
+    # Rewards are plain payments to the app, so they're folded in by the first call
+    # after they land, or by `accrue`. `algos_in` and `tokens_in` are what the call's
+    # own transfers have already paid in. Rewards landing while no tokens are out stay
+    # in the pool with the seed. So do rewards past what takes the accumulator to
+    # `max_reward_per_token`, such as a large payment in while only dust is minted,
+    # rather than fail every call from then on
+    @Subroutine(TealType.none)
+    def accrue(algos_in, tokens_in):
+        rewards = ScratchVar(TealType.uint64)
+        minted = ScratchVar(TealType.uint64)
+        credit = ScratchVar(TealType.uint64)
+        per_token = ScratchVar(TealType.uint64)
+        return Seq(
+            rewards.store(Balance(me) - algos_in - accounted),
+            If(rewards.load() > Int(0)).Then(
+                minted.store(get_minted() + tokens_in),
+                If(minted.load() > Int(0)).Then(
+                    credit.store(Int(max_reward_per_token) - reward_per_token),
+                    # rewards * 2^32 / minted only fits in 64 bits while
+                    # rewards / 2^32 < minted, past that it's over the headroom anyway
+                    If(ShiftRight(rewards.load(), Int(32)) < minted.load()).Then(
+                        per_token.store(
+                            WideRatio(
+                                [rewards.load(), Int(reward_scale)], [minted.load()]
+                            )
+                        ),
+                        If(per_token.load() < credit.load()).Then(
+                            credit.store(per_token.load())
+                        ),
+                    ),
+                    App.globalPut(
+                        reward_per_token_key, reward_per_token + credit.load()
+                    ),
+                ),
+            ),
+        )
+
+    # Called last, once the call's own transfers have settled
+    record_balance = App.globalPut(accounted_key, Balance(me))
+
+    # Util function to transfer an asset
+    @Subroutine(TealType.none)
+    def axfer(reciever, aid, amt):
+        return Seq(
+            InnerTxnBuilder.Begin(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.AssetTransfer,
+                    TxnField.xfer_asset: aid,
+                    TxnField.asset_amount: amt,
+                    TxnField.asset_receiver: reciever,
+                    TxnField.fee: Int(0),  # force caller to pay
+                }
+            ),
+            InnerTxnBuilder.Submit(),
+        )
+
+    # Util function to make payment transaction
+    @Subroutine(TealType.none)
+    def pay(receiver, amt):
+        return Seq(
+            InnerTxnBuilder.Begin(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.Payment,
+                    TxnField.amount: amt,
+                    TxnField.receiver: receiver,
+                    TxnField.fee: Int(0),  # force caller to pay
+                }
+            ),
+            InnerTxnBuilder.Submit(),
+        )
+
+    router = Router(
+        "demo-governance",
+        BareCallActions(
+            no_op=OnCompleteAction.create_only(Approve()),
+            update_application=OnCompleteAction.always(Return(is_governor)),
+            delete_application=OnCompleteAction.always(Return(is_governor)),
+            close_out=OnCompleteAction.call_only(Approve()),
+            opt_in=OnCompleteAction.never(),
+            clear_state=OnCompleteAction.call_only(Approve()),
+        ),
+    )
+
+    # join and exit, which every participant calls, are matched ahead of the router's
+    # dispatch and run inline, without its argument decoding or a subroutine call per
+    # method. The router takes every other call, in the order methods are added
+    fast_methods = []
+
+    def fast_method(signature: str, desc: str):
+        def method(fn):
+            spec = sdk_abi.Method.from_signature(signature)
+            spec.desc = desc
+            for arg, name in zip(spec.args, inspect.signature(fn).parameters):
+                arg.name = name
+            fast_methods.append((spec, fn))
+            return fn
+
+        return method
+
+    @fast_method(
+        "join(pay,asset)void",
+        "join the pool, pool tokens are minted at their value in algos, 1:1 until rewards land",
+    )
+    def join(payment: TxnObject, pool_asset: Expr):
         well_formed_join = And(
-            Global.group_size() == Int(2),  # App call, Payment to join
-            app_call.type_enum() == TxnType.ApplicationCall,
-            app_call.assets[0] == pool_token,
+            Global.group_size() == Int(2),  # Payment to join, App call
+            pool_asset == pool_token,
             payment.type_enum() == TxnType.Payment,
             payment.receiver() == me,
             payment.amount() > Int(0),
-            payment.sender() == app_call.sender(),
+            payment.sender() == Txn.sender(),
         )
 
         return Seq(
-            # Init MaybeValues
-            pool_balance,
             # TODO: uncomment when done testing on dev
             # Assert(before_lock_start),
             Assert(well_formed_join),
-            axfer(app_call.sender(), pool_token, mint_tokens(payment.amount())),
-            Int(1),
+            accrue(payment.amount(), Int(0)),
+            axfer(Txn.sender(), pool_token, mint_tokens(payment.amount())),
+            record_balance,
         )
 
-    # Action to allow caller to exit the contract, burning pool tokens in exchange for algos
-    @Subroutine(TealType.uint64)
-    def exit():
-        # Alias for specific txn indicies
-        app_call, pool_xfer = Gtxn[0], Gtxn[1]
+    @fast_method(
+        "exit(axfer,asset)void",
+        "exit the pool, burning pool tokens in exchange for algos",
+    )
+    def exit(pool_xfer: TxnObject, pool_asset: Expr):
         well_formed_exit = And(
             Global.group_size() == Int(2),
-            app_call.type_enum() == TxnType.ApplicationCall,
-            app_call.assets[0] == pool_token,
+            pool_asset == pool_token,
             pool_xfer.type_enum() == TxnType.AssetTransfer,
             pool_xfer.asset_receiver() == me,
             pool_xfer.xfer_asset() == pool_token,
-            app_call.sender() == pool_xfer.sender(),
+            pool_xfer.sender() == Txn.sender(),
         )
 
         return Seq(
-            pool_balance,
             # TODO: uncomment when done testing on dev
             # Assert(after_lock_stop),
             Assert(well_formed_exit),
+            # The tokens sent back have landed ahead of the call, they still count as
+            # minted for any rewards that came before them
+            accrue(Int(0), pool_xfer.asset_amount()),
             # Looks good, pay 'em
-            pay(
-                pool_xfer.sender(),
-                burn_tokens(pool_xfer.asset_amount(), Balance(me), get_minted()),
+            pay(Txn.sender(), burn_tokens(pool_xfer.asset_amount())),
+            record_balance,
+        )
+
+    # Batches settle up to 4 participants in one call, as many as TEAL 6 lets a call
+    # list as foreign accounts. The call comes straight after its participants'
+    # transfers and lists their senders in the same order, so a group holds several
+    # batches back to back. Inner transactions are free, the caller covers them
+    batch_size = Txn.accounts.length()
+
+    def batched(i: Expr) -> TxnObject:
+        # The i'th of the transfers ahead of the call, counting from 1 like accounts
+        return Gtxn[Txn.group_index() + i - batch_size - Int(1)]
+
+    def each_batched(i: ScratchVar, *body: Expr) -> Expr:
+        return For(
+            i.store(Int(1)), i.load() <= batch_size, i.store(i.load() + Int(1))
+        ).Do(Seq(*body))
+
+    @router.method
+    def join_batch(pool_asset: abi.Asset):
+        """joins the pool for each of the foreign accounts, minting pool tokens for the algos each paid in the transactions ahead of the call"""
+        i = ScratchVar(TealType.uint64)
+        paid = ScratchVar(TealType.uint64)
+        payment = batched(i.load())
+        well_formed_payment = And(
+            payment.type_enum() == TxnType.Payment,
+            payment.receiver() == me,
+            payment.amount() > Int(0),
+            payment.sender() == Txn.accounts[i.load()],
+        )
+
+        return Seq(
+            Assert(pool_asset.asset_id() == pool_token),
+            Assert(batch_size > Int(0)),
+            paid.store(Int(0)),
+            each_batched(
+                i,
+                Assert(well_formed_payment),
+                paid.store(paid.load() + payment.amount()),
             ),
-            Int(1),
+            accrue(paid.load(), Int(0)),
+            InnerTxnBuilder.Begin(),
+            each_batched(
+                i,
+                If(i.load() > Int(1)).Then(InnerTxnBuilder.Next()),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.AssetTransfer,
+                        TxnField.xfer_asset: pool_token,
+                        TxnField.asset_amount: mint_tokens(payment.amount()),
+                        TxnField.asset_receiver: Txn.accounts[i.load()],
+                        TxnField.fee: Int(0),
+                    }
+                ),
+            ),
+            InnerTxnBuilder.Submit(),
+            record_balance,
         )
 
-    # Action to allow admin to commit algos or vote
-    @Subroutine(TealType.uint64)
-    def vote():
-        app_call = Gtxn[0]
+    @router.method
+    def exit_batch(pool_asset: abi.Asset):
+        """exits the pool for each of the foreign accounts, paying algos for the pool tokens each sent back in the transactions ahead of the call"""
+        i = ScratchVar(TealType.uint64)
+        returned = ScratchVar(TealType.uint64)
+        pool_xfer = batched(i.load())
+        well_formed_xfer = And(
+            pool_xfer.type_enum() == TxnType.AssetTransfer,
+            pool_xfer.asset_receiver() == me,
+            pool_xfer.xfer_asset() == pool_token,
+            pool_xfer.sender() == Txn.accounts[i.load()],
+        )
+
+        return Seq(
+            Assert(pool_asset.asset_id() == pool_token),
+            Assert(batch_size > Int(0)),
+            returned.store(Int(0)),
+            each_batched(
+                i,
+                Assert(well_formed_xfer),
+                returned.store(returned.load() + pool_xfer.asset_amount()),
+            ),
+            accrue(Int(0), returned.load()),
+            InnerTxnBuilder.Begin(),
+            each_batched(
+                i,
+                If(i.load() > Int(1)).Then(InnerTxnBuilder.Next()),
+                InnerTxnBuilder.SetFields(
+                    {
+                        TxnField.type_enum: TxnType.Payment,
+                        TxnField.amount: burn_tokens(pool_xfer.asset_amount()),
+                        TxnField.receiver: Txn.accounts[i.load()],
+                        TxnField.fee: Int(0),
+                    }
+                ),
+            ),
+            InnerTxnBuilder.Submit(),
+            record_balance,
+        )
+
+    @router.method
+    def accrue_rewards(pool_asset: abi.Asset):
+        """folds rewards paid in since the last call into the rewards per pool token, anyone may call it"""
+        return Seq(
+            Assert(pool_asset.asset_id() == pool_token),
+            accrue(Int(0), Int(0)),
+            record_balance,
+        )
+
+    @router.method
+    def vote(governance: abi.Account, payload: abi.DynamicBytes):
+        """commits algos or votes by sending `payload` to the governance address as a note, may only be called by the governor"""
         well_formed_vote = And(
             Global.group_size() == Int(1),
-            app_call.type_enum() == TxnType.ApplicationCall,
-            app_call.sender() == governor,
+            is_governor,
         )
+
         return Seq(
             # TODO: assert we're in the voting window
             Assert(well_formed_vote),
@@ -114,30 +350,102 @@ def approval(lock_start: int = 0, lock_stop: int = 0):
             InnerTxnBuilder.SetFields(
                 {
                     TxnField.type_enum: TxnType.Payment,
-                    TxnField.receiver: Txn.accounts[1],
+                    TxnField.receiver: governance.address(),
                     TxnField.amount: Int(0),  # not strictly necessary
-                    TxnField.note: Txn.application_args[
-                        1
-                    ],  # expecting a valid note as the 2nd element in app args array
+                    TxnField.note: payload.get(),
                     TxnField.fee: Int(0),
                 }
             ),
             InnerTxnBuilder.Submit(),
-            Int(1),
         )
 
-    # Action to Bootstrap this application, creates pool token
-    @Subroutine(TealType.uint64)
-    def bootstrap():
-        seed, app_call = Gtxn[0], Gtxn[1]
+    # Expands a compact payload (payload.py) into the note the governance platform
+    # reads, failing on anything that isn't well formed
+    @Subroutine(TealType.bytes)
+    def governance_note(payload):
+        pos = ScratchVar(TealType.uint64)
+        note = ScratchVar(TealType.bytes)
+        separator = ScratchVar(TealType.bytes)
+        option = ScratchVar(TealType.uint64)
+        kind = GetByte(payload, Int(0))
+        return Seq(
+            Assert(Len(payload) <= Int(max_payload_len)),
+            pos.store(Int(1)),
+            If(kind == Int(commit_kind))
+            .Then(
+                note.store(
+                    Concat(
+                        Bytes(note_prefix + b'{"com":'),
+                        decimal(decode_uvarint(payload, pos)),
+                        Bytes("}"),
+                    )
+                )
+            )
+            .ElseIf(kind == Int(votes_kind))
+            .Then(
+                Assert(Len(payload) > Int(1)),
+                note.store(Bytes(note_prefix + b"[")),
+                separator.store(Bytes("")),
+                While(pos.load() < Len(payload)).Do(
+                    note.store(
+                        Concat(
+                            note.load(),
+                            separator.load(),
+                            decimal(decode_uvarint(payload, pos)),
+                        )
+                    ),
+                    option.store(GetByte(payload, pos.load())),
+                    Assert(option.load() - Int(ord("a")) <= Int(ord("z") - ord("a"))),
+                    note.store(
+                        Concat(
+                            note.load(), Bytes(':"'), byte(option.load()), Bytes('"')
+                        )
+                    ),
+                    pos.store(pos.load() + Int(1)),
+                    separator.store(Bytes(",")),
+                ),
+                note.store(Concat(note.load(), Bytes("]"))),
+            )
+            .Else(Err()),
+            Assert(pos.load() == Len(payload)),
+            note.load(),
+        )
+
+    @router.method
+    def vote_compact(governance: abi.Account, payload: abi.DynamicBytes):
+        """sends the governance address the note a compact commitment or set of votes expands to, may only be called by the governor. The fee covers an inner app call for each 700 ops expanding it takes"""
+        well_formed_vote = And(
+            Global.group_size() == Int(1),
+            is_governor,
+        )
+
+        needed = Int(note_base_cost) + Len(payload.get()) * Int(note_cost_per_byte)
+
+        return Seq(
+            Assert(well_formed_vote),
+            OpUp(OpUpMode.OnCall).ensure_budget(needed, OpUpFeeSource.GroupCredit),
+            InnerTxnBuilder.Begin(),
+            InnerTxnBuilder.SetFields(
+                {
+                    TxnField.type_enum: TxnType.Payment,
+                    TxnField.receiver: governance.address(),
+                    TxnField.amount: Int(0),
+                    TxnField.note: governance_note(payload.get()),
+                    TxnField.fee: Int(0),
+                }
+            ),
+            InnerTxnBuilder.Submit(),
+        )
+
+    @router.method
+    def boot(seed: abi.PaymentTransaction, *, output: abi.Uint64):
+        """bootstraps the pool by creating the pool token, may only be called by the governor"""
         well_formed_bootstrap = And(
             Global.group_size() == Int(2),
             # Seed amount so it can send transactions
-            seed.type_enum() == TxnType.Payment,
-            seed.amount() == Int(seed_amount),
-            app_call.type_enum() == TxnType.ApplicationCall,
-            app_call.sender() == governor,
-            app_call.sender() == seed.sender(),
+            seed.get().amount() == Int(seed_amount),
+            seed.get().sender() == Txn.sender(),
+            is_governor,
         )
 
         pool_token_check = App.globalGetEx(Int(0), pool_token_key)
@@ -165,71 +473,48 @@ def approval(lock_start: int = 0, lock_stop: int = 0):
             InnerTxnBuilder.Submit(),
             # Write it to global state
             App.globalPut(pool_token_key, InnerTxn.created_asset_id()),
-            Int(1),
+            # The seed isn't rewards
+            record_balance,
+            output.set(InnerTxn.created_asset_id()),
         )
 
-    # Return the number of tokens minted
-    @Subroutine(TealType.uint64)
-    def get_minted():
-        return Seq(pool_balance, Int(total_supply) - pool_balance.value())
-
-    # Overwrite the current governor
-    @Subroutine(TealType.uint64)
-    def set_governor(new_gov):
-        return Seq(
-            Assert(Txn.sender() == governor), App.globalPut(gov_key, new_gov), Int(1)
-        )
-
-    # Util function to transfer an asset
-    @Subroutine(TealType.none)
-    def axfer(reciever, aid, amt):
-        return Seq(
-            InnerTxnBuilder.Begin(),
-            InnerTxnBuilder.SetFields(
-                {
-                    TxnField.type_enum: TxnType.AssetTransfer,
-                    TxnField.xfer_asset: aid,
-                    TxnField.asset_amount: amt,
-                    TxnField.asset_receiver: reciever,
-                    TxnField.fee: Int(0),  # force caller to pay
-                }
+    @router.method
+    def set_governor(new_governor: abi.Account):
+        """overwrites the current governor, may only be called by the current governor"""
+        return Seq(Assert(is_governor), App.globalPut(gov_key, new_governor.address()))
+
+    approval, clear_state, contract = router.build_program()
+
+    # Both take the transaction ahead of the call and a foreign asset, as ABI calls
+    fast = [
+        [
+            Txn.application_args[0] == MethodSignature(method.get_signature()),
+            Seq(
+                Assert(Txn.on_completion() == OnComplete.NoOp),
+                Assert(Txn.application_id()),
+                fn(
+                    Gtxn[Txn.group_index() - Int(1)],
+                    Txn.assets[GetByte(Txn.application_args[1], Int(0))],
+                ),
+                Approve(),
             ),
-            InnerTxnBuilder.Submit(),
-        )
-
-    # Util function to make payment transaction
-    @Subroutine(TealType.none)
-    def pay(receiver, amt):
-        return Seq(
-            InnerTxnBuilder.Begin(),
-            InnerTxnBuilder.SetFields(
-                {
-                    TxnField.type_enum: TxnType.Payment,
-                    TxnField.amount: amt,
-                    TxnField.receiver: receiver,
-                    TxnField.fee: Int(0),  # force caller to pay
-                }
-            ),
-            InnerTxnBuilder.Submit(),
-        )
+        ]
+        for method, fn in fast_methods
+    ]
+    program = Seq(
+        # Bare calls have no selector
+        If(Txn.application_args.length()).Then(Cond(*fast, [Int(1), Seq()])),
+        approval,
+    )
 
-    router = Cond(
-        # Users
-        [Txn.application_args[0] == action_join, join()],
-        [Txn.application_args[0] == action_exit, exit()],
-        # Admin
-        [Txn.application_args[0] == action_boot, bootstrap()],
-        [Txn.application_args[0] == action_update, set_governor(Txn.accounts[1])],
-        [Txn.application_args[0] == action_vote, vote()],
+    contract = sdk_abi.Contract(
+        contract.name, [m for m, _ in fast_methods] + contract.methods, contract.desc
     )
 
-    return Cond(
-        [Txn.application_id() == Int(0), Int(1)],
-        [Txn.on_completion() == OnComplete.DeleteApplication, Txn.sender() == governor],
-        [Txn.on_completion() == OnComplete.UpdateApplication, Txn.sender() == governor],
-        [Txn.on_completion() == OnComplete.CloseOut, Int(1)],
-        [Txn.on_completion() == OnComplete.OptIn, Int(0)],
-        [Txn.on_completion() == OnComplete.NoOp, router],
+    return (
+        compileTeal(program, mode=Mode.Application, version=teal_version),
+        compileTeal(clear_state, mode=Mode.Application, version=teal_version),
+        contract,
     )
 
 
@@ -238,18 +523,25 @@ def clear():
 
 
 def get_approval_src(**kwargs):
-    return compileTeal(approval(**kwargs), mode=Mode.Application, version=6)
+    return build_program(**kwargs)[0]
 
 
 def get_clear_src(**kwargs):
-    return compileTeal(clear(**kwargs), mode=Mode.Application, version=6)
+    return compileTeal(clear(**kwargs), mode=Mode.Application, version=teal_version)
 
 
 if __name__ == "__main__":
+    approval, clear_src, contract = build_program(lock_start=1, lock_stop=10)
+
     path = os.path.dirname(os.path.abspath(__file__))
 
+    with open(os.path.join(path, "contract.json"), "w") as f:
+        import json
+
+        f.write(json.dumps(contract.dictify(), indent=2))
+
     with open(os.path.join(path, "approval.teal"), "w") as f:
-        f.write(get_approval_src(lock_start=1, lock_stop=10))
+        f.write(approval)
 
     with open(os.path.join(path, "clear.teal"), "w") as f:
-        f.write(get_clear_src())
+        f.write(clear_src)
@@ -0,0 +1,218 @@
+import base64
+import os
+import sys
+from collections import Counter
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import encoding, logic
+
+import rewards
+from client import load_contract
+from common.follower import Applied, Follower
+from pool import total_supply
+
+# The governance pool's algos, minted tokens and deposits kept up to date from the
+# blocks a `Follower` hands it, decoded by the method selector in the first app
+# argument: `join` pays algos in and gets tokens minted, `exit` sends tokens back for
+# algos and `vote` sends a note from the pool. `join_batch` and `exit_batch` do the same
+# for each account they list. Rewards are folded into the reward per token the way the
+# contract does it, by the first call after they land.
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Calls that fold rewards in, with how many of the transfers ahead of them they claim,
+# None for one per account they list
+accruing = {
+    "join": 1,
+    "exit": 1,
+    "join_batch": None,
+    "exit_batch": None,
+    "accrue_rewards": 0,
+}
+
+
+class GovernanceState:
+    """The pool at `app_id` as of the last round applied"""
+
+    def __init__(self, app_id: int, pool_token: int = None, contract=None):
+        self.app_id = app_id
+        self.app_addr = logic.get_application_address(app_id)
+        self.pool_token = pool_token
+
+        contract = contract or load_contract()
+        self.methods = {m.get_selector(): m.name for m in contract.methods}
+
+        self.round = 0
+        self.balance = 0  # algos held by the app, seed included
+        self.minted = 0  # pool tokens held outside the app account
+        self.reward_per_token = 0
+        self.accounted = 0  # app balance as of the last call
+        # Net algos paid in by each account, since following started
+        self.deposits: Dict[str, int] = Counter()
+        self.votes: List[bytes] = []  # notes sent by `vote`
+        self.calls: Dict[str, int] = Counter()
+
+        self._addr = encoding.decode_address(self.app_addr)
+
+    def seed(self, client) -> int:
+        """reads the pool's balances once to start following from, returns their round.
+        Deposits can't be read back, they count from here"""
+        state = client.application_info(self.app_id)["params"].get("global-state", [])
+        for kv in state:
+            key = base64.b64decode(kv["key"])
+            if key == b"p":
+                self.pool_token = kv["value"]["uint"]
+            elif key == b"r":
+                self.reward_per_token = kv["value"]["uint"]
+            elif key == b"b":
+                self.accounted = kv["value"]["uint"]
+
+        info = client.account_info(self.app_addr)
+        self.balance = info["amount"]
+        for holding in info.get("assets", []):
+            if holding["asset-id"] == self.pool_token:
+                self.minted = total_supply - holding["amount"]
+        self.round = info["round"]
+        return self.round
+
+    def quote_exit(self, amt: int, wide: bool = False) -> int:
+        """algos `exit` pays for `amt` pool tokens, as the contract's burn_tokens,
+        with any rewards paid in since the last call folded in first"""
+        pending = self.balance - self.accounted
+        reward_per_token = rewards.accrue(self.reward_per_token, pending, self.minted)
+        return rewards.burn_tokens(amt, reward_per_token, wide)
+
+    def apply(self, round: int, group: List[Applied]):
+        actions = [self._action(t.txn) for t in group]
+        joining = {"join", "join_batch"} & set(actions)
+
+        # In order, each call sees the transfers ahead of it
+        for gi, t in enumerate(group):
+            txn, action = t.txn, actions[gi]
+            if action is not None:
+                self.calls[action] += 1
+                if action in accruing:
+                    self._accrue(group[gi - self._claimed(txn, action) : gi])
+                self._inner(t.inner)
+                if action in accruing or action == "boot":
+                    self.accounted = self.balance
+            elif txn["type"] == "pay" and txn.get("rcv") == self._addr:
+                self.balance += txn.get("amt", 0)
+                if joining:
+                    sender = encoding.encode_address(txn["snd"])
+                    self.deposits[sender] += txn.get("amt", 0)
+            elif txn["type"] == "axfer" and txn.get("arcv") == self._addr:
+                if txn["xaid"] == self.pool_token:
+                    self.minted -= txn.get("aamt", 0)
+        self.round = round
+
+    def _action(self, txn: dict):
+        if txn["type"] == "appl" and txn.get("apid") == self.app_id:
+            args = txn.get("apaa", [])
+            return self.methods.get(args[0] if args else b"", "other")
+        return None
+
+    def _claimed(self, txn: dict, action: str) -> int:
+        claimed = accruing[action]
+        return len(txn.get("apat", [])) if claimed is None else claimed
+
+    def _accrue(self, claimed: List[Applied]):
+        # As the contract, from before the call's own transfers landed
+        txns = [t.txn for t in claimed]
+        algos_in = sum(txn.get("amt", 0) for txn in txns if txn["type"] == "pay")
+        tokens_in = sum(txn.get("aamt", 0) for txn in txns if txn["type"] == "axfer")
+        self.reward_per_token = rewards.accrue(
+            self.reward_per_token,
+            self.balance - algos_in - self.accounted,
+            self.minted + tokens_in,
+        )
+
+    def _inner(self, inner: List[Applied]):
+        for t in inner:
+            txn = t.txn
+            if txn["type"] == "acfg" and t.created_asset:
+                self.pool_token = t.created_asset  # boot
+            elif txn["type"] == "axfer" and txn["xaid"] == self.pool_token:
+                self.minted += txn.get("aamt", 0)
+            elif txn["type"] == "pay":
+                self.balance -= txn.get("amt", 0)
+                if txn.get("note") and not txn.get("amt"):
+                    self.votes.append(txn["note"])
+                else:
+                    receiver = encoding.encode_address(txn["rcv"])
+                    self.deposits[receiver] -= txn.get("amt", 0)
+
+    ###
+    # Checkpoints
+    ###
+
+    def key(self) -> list:
+        return [self.app_id]
+
+    def dump(self) -> dict:
+        return {
+            "round": self.round,
+            "pool_token": self.pool_token,
+            "balance": self.balance,
+            "minted": self.minted,
+            "reward_per_token": self.reward_per_token,
+            "accounted": self.accounted,
+            "deposits": dict(self.deposits),
+            "votes": [base64.b64encode(v).decode() for v in self.votes],
+            "calls": dict(self.calls),
+        }
+
+    def load(self, state: dict):
+        self.round = state["round"]
+        self.pool_token = state["pool_token"]
+        self.balance = state["balance"]
+        self.minted = state["minted"]
+        self.reward_per_token = state["reward_per_token"]
+        self.accounted = state["accounted"]
+        self.deposits = Counter(state["deposits"])
+        self.votes = [base64.b64decode(v) for v in state["votes"]]
+        self.calls = Counter(state["calls"])
+
+
+def follow(client, app_id: int, checkpoint_path: str = None):
+    """a follower for one pool, resumed from its checkpoint or seeded from algod"""
+    state = GovernanceState(app_id)
+    checkpoint_path = checkpoint_path or os.path.join(
+        path, ".cache", "governance-{}.json".format(app_id)
+    )
+    follower = Follower(client, {"governance": state}, checkpoint_path)
+    if not follower.resume():
+        follower.round = state.seed(client)
+    return state, follower
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from algosdk.v2client import algod
+
+    parser = argparse.ArgumentParser(description="follow a governance pool")
+    parser.add_argument("app_id", type=int)
+    parser.add_argument("--url", default="http://localhost:4001")
+    parser.add_argument("--token", default="a" * 64)
+    args = parser.parse_args()
+
+    client = algod.AlgodClient(args.token, args.url)
+    state, follower = follow(client, args.app_id)
+    print("Following from round {}".format(follower.round))
+    try:
+        while True:
+            follower.step()
+            print(
+                "Round {}: {} algos, {} minted, {} votes, {}".format(
+                    state.round,
+                    state.balance,
+                    state.minted,
+                    len(state.votes),
+                    dict(state.calls),
+                )
+            )
+    except KeyboardInterrupt:
+        follower.checkpoint()
@@ -0,0 +1,101 @@
+import base64
+from typing import Iterable
+
+import numpy as np
+
+from pool import max_reward_per_token, reward_scale
+
+# Off-chain mirror of the reward accumulator in pool.py. A pool token is worth an algo
+# plus `reward_per_token / reward_scale` algos, so what a holder is owed is one
+# multiplication, and a whole snapshot of holders is one pass over an array.
+
+assert reward_scale == 2**32  # entitlements split products on 32 bit limbs
+
+_low = np.uint64(2**32 - 1)
+_shift = np.uint64(32)
+
+
+def read_reward_per_token(client, app_id: int) -> int:
+    """the accumulator as of the pool's last call, rewards paid in since aren't in it
+    until a call folds them in"""
+    state = client.application_info(app_id)["params"].get("global-state", [])
+    for kv in state:
+        if base64.b64decode(kv["key"]) == b"r":
+            return kv["value"]["uint"]
+    return 0
+
+
+def accrue(reward_per_token: int, rewards: int, minted: int) -> int:
+    """the accumulator once `rewards` land on `minted` pool tokens, up to
+    `max_reward_per_token`"""
+    if rewards <= 0 or minted == 0:
+        return reward_per_token
+    return min(reward_per_token + rewards * reward_scale // minted, max_reward_per_token)
+
+
+def mint_tokens(algos_in: int, reward_per_token: int, wide: bool = False) -> int:
+    if wide:
+        return algos_in * reward_scale // (reward_scale + reward_per_token)
+    return algos_in // ((reward_scale + reward_per_token) // reward_scale)
+
+
+def burn_tokens(amt: int, reward_per_token: int, wide: bool = False) -> int:
+    if wide:
+        return amt * (reward_scale + reward_per_token) // reward_scale
+    return amt * ((reward_scale + reward_per_token) // reward_scale)
+
+
+def _mul_scaled(a: np.ndarray, b: int) -> np.ndarray:
+    # a * b // 2**32 without the 128 bit product, from the cross terms of the halves
+    ah, al = a >> _shift, a & _low
+    bh, bl = np.uint64(b >> 32), np.uint64(b & (2**32 - 1))
+    return ((ah * bh) << _shift) + ah * bl + al * bh + ((al * bl) >> _shift)
+
+
+def entitlements(
+    tokens: Iterable[int], reward_per_token: int, wide: bool = False
+) -> np.ndarray:
+    """algos each of `tokens` pays out on exit, as `burn_tokens` for every holder
+    at once"""
+    tokens = np.asarray(tokens, dtype=np.uint64)
+    if wide:
+        return tokens + _mul_scaled(tokens, reward_per_token)
+    return tokens * np.uint64(burn_tokens(1, reward_per_token))
+
+
+def rewards_between(tokens: Iterable[int], then: int, now: int) -> np.ndarray:
+    """algos of rewards earned by each of `tokens`, held from when the accumulator was
+    at `then` to `now`"""
+    return _mul_scaled(np.asarray(tokens, dtype=np.uint64), now - then)
+
+
+if __name__ == "__main__":
+    import argparse
+    import random
+    import time
+
+    parser = argparse.ArgumentParser(description="benchmark entitlements")
+    parser.add_argument("--holders", type=int, default=10**6)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    tokens = [rng.randrange(10**3, 10**12) for _ in range(args.holders)]
+    minted = sum(tokens)
+    reward_per_token = accrue(0, minted // 100, minted)  # 1% rewards
+
+    start = time.perf_counter()
+    scalar = [burn_tokens(t, reward_per_token, wide=True) for t in tokens]
+    scalar_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vectorized = entitlements(tokens, reward_per_token, wide=True)
+    vectorized_elapsed = time.perf_counter() - start
+
+    assert vectorized.tolist() == scalar
+    timings = (("scalar", scalar_elapsed), ("vectorized", vectorized_elapsed))
+    for kind, elapsed in timings:
+        print(
+            "{}: {} holders in {:.3f}s, {:.0f} holders per second".format(
+                kind, len(tokens), elapsed, len(tokens) / elapsed
+            )
+        )
@@ -1,35 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from algosdk.kmd import KMDClient
 
+from common.keystore import Keystore
+
 KMD_ADDRESS = "http://localhost:4002"
 KMD_TOKEN = "aaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaaa"
 
 KMD_WALLET_NAME = "unencrypted-default-wallet"
 KMD_WALLET_PASSWORD = ""
 
+# Use the keystore as it is without checking it against the wallet, for load tests
+# with a generated keystore (`python -m common.keystore`)
+OFFLINE = os.environ.get("DEMO_POOL_OFFLINE", "") not in ("", "0")
+
+keystore = Keystore()
+
 
 def get_accounts():
     kmd = KMDClient(KMD_TOKEN, KMD_ADDRESS)
-    wallets = kmd.list_wallets()
-
-    walletID = None
-    for wallet in wallets:
-        if wallet["name"] == KMD_WALLET_NAME:
-            walletID = wallet["id"]
-            break
-
-    if walletID is None:
-        raise Exception("Wallet not found: {}".format(KMD_WALLET_NAME))
-
-    walletHandle = kmd.init_wallet_handle(walletID, KMD_WALLET_PASSWORD)
-
-    try:
-        addresses = kmd.list_keys(walletHandle)
-        privateKeys = [
-            kmd.export_key(walletHandle, KMD_WALLET_PASSWORD, addr)
-            for addr in addresses
-        ]
-        kmdAccounts = [(addresses[i], privateKeys[i]) for i in range(len(privateKeys))]
-    finally:
-        kmd.release_wallet_handle(walletHandle)
-
-    return kmdAccounts
+    return keystore.accounts(kmd, KMD_WALLET_NAME, KMD_WALLET_PASSWORD, OFFLINE)
@@ -0,0 +1,278 @@
+import argparse
+import base64
+import os
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import account, encoding
+from algosdk.future.transaction import *
+
+from batcher import Request, batch_txns, pack
+from client import app_args
+from payload import encode_votes, op_ups
+from common.avm import AVMError, Ledger, app_address, min_txn_fee
+from pool import get_approval_src, get_clear_src, seed_amount
+
+# Runs the same flow as demo.py against the offline interpreter in common/avm.py, no
+# sandbox required
+
+governance_addr = "57QZ4S7YHTWPRAM3DQ2MLNSVLAQB7DTK4D7SUNRIEFMRGOU7DMYFGF55BY"
+
+
+def get_params(ledger: Ledger, txns_covered: int = 1) -> SuggestedParams:
+    return SuggestedParams(
+        min_txn_fee * txns_covered,
+        ledger.round,
+        ledger.round + 1000,
+        base64.b64encode(bytes(32)).decode(),
+        "avm-sim",
+        flat_fee=True,
+    )
+
+
+class GovernancePool:
+    """A governance pool deployed on an offline ledger, with a funded participant"""
+
+    def __init__(self, ledger: Ledger = None, wide: bool = False):
+        self.ledger = ledger or Ledger()
+
+        self.sk, self.addr = account.generate_account()
+        self.ledger.fund(self.addr, int(1e13))
+
+        result = self.ledger.apply_group(
+            [
+                ApplicationCreateTxn(
+                    self.addr,
+                    get_params(self.ledger),
+                    OnComplete.NoOpOC,
+                    self.ledger.compile(
+                        get_approval_src(lock_start=100, lock_stop=110, wide=wide)
+                    ),
+                    self.ledger.compile(get_clear_src()),
+                    StateSchema(32, 32),
+                    StateSchema(0, 0),
+                )
+            ]
+        )
+        self.app_id = result[0].created_app
+        self.app_addr = encoding.encode_address(app_address(self.app_id))
+
+        sp = get_params(self.ledger, 2)
+        result = self.ledger.apply_group(
+            assign_group_id(
+                [
+                    PaymentTxn(self.addr, sp, self.app_addr, seed_amount),
+                    self.app_call(sp, app_args("boot")),
+                ]
+            )
+        )
+        self.pool_token = result[1].inner[0].created_asset
+
+        self.ledger.apply_group(
+            [
+                AssetTransferTxn(
+                    self.addr, get_params(self.ledger), self.addr, 0, self.pool_token
+                )
+            ]
+        )
+
+    def app_call(self, sp, app_args, assets=[], accounts=[]):
+        return ApplicationCallTxn(
+            self.addr,
+            sp,
+            self.app_id,
+            OnComplete.NoOpOC,
+            app_args=app_args,
+            foreign_assets=assets,
+            accounts=accounts,
+        )
+
+    def join_group(self, amt: int) -> list:
+        sp = get_params(self.ledger, 2)
+        return assign_group_id(
+            [
+                PaymentTxn(self.addr, sp, self.app_addr, amt),
+                self.app_call(sp, app_args("join", 0), [self.pool_token]),
+            ]
+        )
+
+    def exit_group(self, amt: int) -> list:
+        sp = get_params(self.ledger, 2)
+        return assign_group_id(
+            [
+                AssetTransferTxn(self.addr, sp, self.app_addr, amt, self.pool_token),
+                self.app_call(sp, app_args("exit", 0), [self.pool_token]),
+            ]
+        )
+
+    def join(self, amt: int):
+        return self.ledger.apply_group(self.join_group(amt))
+
+    def exit(self, amt: int):
+        return self.ledger.apply_group(self.exit_group(amt))
+
+    def participants(self, n: int, amt: int = int(1e10)) -> List[str]:
+        """`n` new accounts funded with `amt` and opted in to the pool token"""
+        addrs = []
+        for _ in range(n):
+            _, addr = account.generate_account()
+            self.ledger.fund(addr, amt)
+            sp = get_params(self.ledger)
+            optin = AssetTransferTxn(addr, sp, addr, 0, self.pool_token)
+            self.ledger.apply_group([optin])
+            addrs.append(addr)
+        return addrs
+
+    def batch_groups(self, requests: List[Request]) -> List[List[dict]]:
+        sp = get_params(self.ledger)
+        settle = lambda batch: batch_txns(
+            sp, self.app_id, self.pool_token, self.addr, batch
+        )
+        return [
+            [txn for batch in batches for txn in settle(batch)]
+            for batches in pack(requests)
+        ]
+
+    def batch(self, requests: List[Request]):
+        return [self.ledger.apply_group(g) for g in self.batch_groups(requests)]
+
+    def vote(self, payload: str):
+        sp = get_params(self.ledger, 2)
+        return self.ledger.apply_group(
+            [
+                self.app_call(
+                    sp,
+                    app_args("vote", 1, payload.encode()),
+                    accounts=[governance_addr],
+                )
+            ]
+        )
+
+    def vote_compact(self, payload: bytes):
+        sp = get_params(self.ledger, 2 + op_ups(payload))
+        return self.ledger.apply_group(
+            [
+                self.app_call(
+                    sp,
+                    app_args("vote_compact", 1, payload),
+                    accounts=[governance_addr],
+                )
+            ]
+        )
+
+    def balances(self) -> dict:
+        return {
+            who: {
+                "Algo": self.ledger.balance(addr),
+                "Pool": self.ledger.holding(addr, self.pool_token),
+            }
+            for who, addr in (("App", self.app_addr), ("Participant", self.addr))
+        }
+
+
+def demo(wide: bool = False):
+    pool = GovernancePool(wide=wide)
+    print("Created App with id: {}".format(pool.app_id))
+
+    for name, step in [
+        ("join", lambda: pool.join(100000)),
+        ("vote", lambda: pool.vote_compact(encode_votes([(1, "a")]))),
+        ("exit", lambda: pool.exit(1000)),
+    ]:
+        result = step()
+        print("{} cost {} ops: {}".format(name, result[-1].cost, pool.balances()))
+
+    # A full group of batches, 12 participants each way
+    addrs = pool.participants(12)
+    for method, amt in (("join_batch", 100000), ("exit_batch", 1000)):
+        (result,) = pool.batch([Request(method, addr, amt) for addr in addrs])
+        calls = [r for r in result if r.cost]
+        print(
+            "{} x{} cost {} ops over {} calls: {}".format(
+                method,
+                len(addrs),
+                sum(r.cost for r in calls),
+                len(calls),
+                pool.balances()["App"],
+            )
+        )
+
+    return pool
+
+
+def bench(pool: GovernancePool, rounds: int):
+    # Groups are evaluated from their msgpack form, the same shape a node receives
+    join = [txn.dictify() for txn in pool.join_group(1000)]
+    exit = [txn.dictify() for txn in pool.exit_group(1000)]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pool.ledger.apply_group(join)
+        pool.ledger.apply_group(exit)
+    elapsed = time.perf_counter() - start
+
+    print(
+        "{} join/exit pairs in {:.2f}s, {:.0f} calls per minute".format(
+            rounds, elapsed, rounds * 2 / elapsed * 60
+        )
+    )
+
+    # The same joins and exits for 12 participants at a time, in full groups
+    addrs = pool.participants(12)
+    (join,) = pool.batch_groups([Request("join_batch", a, 1000) for a in addrs])
+    (exit,) = pool.batch_groups([Request("exit_batch", a, 1000) for a in addrs])
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pool.ledger.apply_group(join)
+        pool.ledger.apply_group(exit)
+    elapsed = time.perf_counter() - start
+
+    print(
+        "{} batched join/exit groups of {} in {:.2f}s, {:.0f} calls per minute".format(
+            rounds, len(addrs), elapsed, rounds * 2 * len(addrs) / elapsed * 60
+        )
+    )
+
+
+def bench_sizes():
+    """cost of an exit and the algos it pays as deposits grow, with and without wide
+    math, after rewards of 1% land in the pool"""
+    for size in (10**6, 10**9, 10**12):
+        for wide in (False, True):
+            pool = GovernancePool(wide=wide)
+            pool.join(size)
+            pool.ledger.fund(pool.app_addr, size // 100)
+            before = pool.ledger.balance(pool.app_addr)
+            try:
+                cost = pool.exit(size // 2)[-1].cost
+                paid = before - pool.ledger.balance(pool.app_addr)
+                result = "exit {} ops, paid {}".format(cost, paid)
+            except AVMError:
+                result = "exit fails"
+            print("{:.0e} {}: {}".format(size, "wide" if wide else "narrow", result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--rounds", type=int, default=0, help="join/exit pairs to benchmark"
+    )
+    parser.add_argument(
+        "--wide", action="store_true", help="use 128 bit intermediates in the math"
+    )
+    parser.add_argument(
+        "--sizes", action="store_true", help="benchmark exits over deposit sizes"
+    )
+    args = parser.parse_args()
+
+    if args.sizes:
+        bench_sizes()
+        sys.exit()
+
+    pool = demo(args.wide)
+    if args.rounds:
+        bench(pool, args.rounds)
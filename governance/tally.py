@@ -0,0 +1,164 @@
+import os
+import sys
+from collections import Counter
+from typing import Dict, Iterable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from algosdk import encoding, logic
+
+from common.follower import Applied, BlockFiles, Follower, record_blocks
+from payload import parse_note
+
+# Running tallies of the commitments and votes governance pools send, read back from
+# the notes on their inner payments as a `Follower` streams blocks past. Each pool's
+# latest commitment and latest vote on each measure stand, as they do on the platform,
+# and a vote carries the pool's commitment behind it. Tallies are checkpointed with
+# the round they reached, so a period is only ever read through once, and the blocks
+# can be recorded to files to tally them again without the node.
+
+path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class VoteTally:
+    """What the pools at `app_ids` have committed and voted from round `first`, as of
+    the last round applied"""
+
+    def __init__(self, app_ids: Iterable[int], first: int = 1):
+        self.app_ids = sorted(app_ids)
+        self.first = first
+        self._senders = {
+            encoding.decode_address(logic.get_application_address(app_id)): app_id
+            for app_id in self.app_ids
+        }
+
+        self.round = 0
+        self.commitments: Dict[int, int] = {}  # app id -> algos
+        self.ballots: Dict[int, Dict[int, str]] = {}  # app id -> measure -> option
+        self.notes: Dict[str, int] = Counter()  # by kind, "other" if not a vote
+
+    def results(self) -> Dict[int, Dict[str, int]]:
+        """measure -> option -> algos committed by the pools whose vote stands on it"""
+        results: Dict[int, Dict[str, int]] = {}
+        for app_id, ballot in self.ballots.items():
+            weight = self.commitments.get(app_id, 0)
+            for measure, option in ballot.items():
+                options = results.setdefault(measure, Counter())
+                options[option] += weight
+        return results
+
+    def apply(self, round: int, group: List[Applied]):
+        for t in group:
+            if t.txn["type"] == "appl" and t.txn.get("apid") in self.app_ids:
+                self._inner(t.inner)
+        self.round = round
+
+    def _inner(self, inner: List[Applied]):
+        for t in inner:
+            txn = t.txn
+            if txn["type"] != "pay" or not txn.get("note"):
+                continue
+            app_id = self._senders.get(txn["snd"])
+            if app_id is None:
+                continue
+            try:
+                kind, value = parse_note(txn["note"])
+            except ValueError:
+                self.notes["other"] += 1
+                continue
+
+            self.notes[kind] += 1
+            if kind == "commit":
+                self.commitments[app_id] = value
+            else:
+                self.ballots.setdefault(app_id, {}).update(value)
+
+    ###
+    # Checkpoints
+    ###
+
+    def key(self) -> dict:
+        return {"app_ids": self.app_ids, "first": self.first}
+
+    def dump(self) -> dict:
+        return {
+            "round": self.round,
+            "commitments": self.commitments,
+            "ballots": self.ballots,
+            "notes": dict(self.notes),
+        }
+
+    def load(self, state: dict):
+        # JSON leaves every key a string
+        self.round = state["round"]
+        self.commitments = {int(a): amt for a, amt in state["commitments"].items()}
+        self.ballots = {
+            int(a): {int(m): o for m, o in ballot.items()}
+            for a, ballot in state["ballots"].items()
+        }
+        self.notes = Counter(state["notes"])
+
+
+def tally(
+    client,
+    app_ids: Iterable[int],
+    first: int,
+    last: int = None,
+    checkpoint_path: str = None,
+):
+    """a follower tallying from round `first`, resumed from its checkpoint unless
+    that's already past `last`. `client` is algod or `BlockFiles`"""
+    app_ids = sorted(app_ids)
+    checkpoint_path = checkpoint_path or os.path.join(
+        path, ".cache", "tally-{}.json".format("-".join(map(str, app_ids)))
+    )
+    state = VoteTally(app_ids, first)
+    follower = Follower(client, {"tally": state}, checkpoint_path)
+    if follower.resume() and (last is None or follower.round <= last):
+        return state, follower
+
+    state = VoteTally(app_ids, first)
+    follower = Follower(client, {"tally": state}, checkpoint_path)
+    follower.round = state.round = first - 1
+    return state, follower
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from algosdk.v2client import algod
+
+    parser = argparse.ArgumentParser(description="tally governance pool votes")
+    parser.add_argument("app_ids", type=int, nargs="+")
+    parser.add_argument("--first", type=int, default=1, help="first round of the period")
+    parser.add_argument("--last", type=int, help="last round, the latest by default")
+    parser.add_argument("--blocks", help="directory of recorded block files to read")
+    parser.add_argument(
+        "--record", action="store_true", help="record the range to --blocks first"
+    )
+    parser.add_argument("--url", default="http://localhost:4001")
+    parser.add_argument("--token", default="a" * 64)
+    args = parser.parse_args()
+
+    client = algod.AlgodClient(args.token, args.url)
+    last = args.last or client.status()["last-round"]
+    if args.blocks:
+        if args.record:
+            fetched = record_blocks(client, args.first, last, args.blocks)
+            print("Recorded {} blocks to {}".format(fetched, args.blocks))
+        client = BlockFiles(args.blocks)
+        last = min(last, client.last_round)
+
+    state, follower = tally(client, args.app_ids, args.first, last)
+    print("Tallying from round {} to {}".format(follower.round + 1, last))
+    follower.run(last)
+
+    print("Notes: {}".format(dict(state.notes)))
+    for app_id in state.app_ids:
+        print(
+            "App {}: committed {}, voted {}".format(
+                app_id, state.commitments.get(app_id, 0), state.ballots.get(app_id, {})
+            )
+        )
+    for measure, options in sorted(state.results().items()):
+        print("Measure {}: {}".format(measure, dict(options)))
@@ -0,0 +1,114 @@
+import importlib.util
+import os
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+import pytest
+
+pytest.importorskip("pytealutils")  # pyteal-utils, in requirements.txt
+
+import rewards
+from common.avm import min_txn_fee
+from pool import max_reward_per_token
+
+# Pins the accumulator in pool.py to its mirror in rewards.py, and checks a pool keeps
+# working however large the rewards that land on the tokens out
+
+
+def load(name: str):
+    """This directory's `name`.py, under a name the amm's modules don't shadow"""
+    spec = importlib.util.spec_from_file_location(
+        "governance_" + name, os.path.join(here, name + ".py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# simulate.py and batcher.py import `client`, which names the amm's when both suites run
+shadowed = sys.modules.get("client")
+sys.modules["client"] = load("client")
+try:
+    simulate = load("simulate")
+finally:
+    if shadowed is None:
+        del sys.modules["client"]
+    else:
+        sys.modules["client"] = shadowed
+
+
+class Pool(simulate.GovernancePool):
+    """A pool on an offline ledger that rewards can be paid into"""
+
+    def __init__(self, wide: bool):
+        super().__init__(wide=wide)
+        # Enough for the largest rewards the tests pay in
+        self.ledger.fund(self.addr, 10**16)
+
+    def reward(self, amt: int):
+        sp = simulate.get_params(self.ledger)
+        pay = simulate.PaymentTxn(self.addr, sp, self.app_addr, amt)
+        self.ledger.apply_group([pay])
+
+    def accrue(self):
+        args = simulate.app_args("accrue_rewards", 0)
+        sp = simulate.get_params(self.ledger)
+        return self.ledger.apply_group([self.app_call(sp, args, [self.pool_token])])
+
+    @property
+    def reward_per_token(self) -> int:
+        return self.ledger.global_state(self.app_id).get(b"r", 0)
+
+    @property
+    def tokens(self) -> int:
+        return self.ledger.holding(self.addr, self.pool_token)
+
+
+@pytest.mark.parametrize("wide", [False, True], ids=["narrow", "wide"])
+@pytest.mark.parametrize(
+    "deposit,paid_in",
+    [
+        (10**9, 10**7),  # 1% rewards
+        (10**6, 3 * 10**6),  # tokens worth 4 algos
+        (1, 2**32 - 2),  # the most a single token takes short of the cap
+        (1, 2**32 - 1),  # just past it
+        (1, 2**32),  # the quotient no longer fits in 64 bits
+        (1000, 10**15),
+    ],
+)
+def test_accrue_matches_mirror(wide, deposit, paid_in):
+    pool = Pool(wide)
+    pool.join(deposit)
+    pool.reward(paid_in)
+    pool.accrue()
+
+    expected = rewards.accrue(0, paid_in, pool.tokens)
+    assert pool.reward_per_token == expected
+    assert expected <= max_reward_per_token
+
+
+@pytest.mark.parametrize("wide", [False, True], ids=["narrow", "wide"])
+def test_large_rewards_on_dust_leave_pool_working(wide):
+    pool = Pool(wide)
+    pool.join(1)
+    pool.reward(10**13)  # 10 million algos on one token
+    pool.accrue()
+    assert pool.reward_per_token == max_reward_per_token
+
+    # Later rewards stay in the pool, and joins and exits still settle
+    pool.reward(10**6)
+    pool.accrue()
+    assert pool.reward_per_token == max_reward_per_token
+
+    before = pool.tokens
+    pool.join(10**13)
+    minted = pool.tokens - before
+    assert minted == rewards.mint_tokens(10**13, max_reward_per_token, wide)
+
+    algos = pool.ledger.balance(pool.addr)
+    pool.exit(pool.tokens)
+    # Both transactions carry the fee for two, one covers the payout
+    paid = pool.ledger.balance(pool.addr) - algos + 4 * min_txn_fee
+    assert paid == rewards.burn_tokens(before + minted, max_reward_per_token, wide)
@@ -1,20 +1,76 @@
 from pyteal import *
 
+from payload import max_uvarint_len
+
+# Byte encodings written with loops rather than recursion, so each costs a fixed number
+# of ops per byte and never re-enters `callsub`
+
+
+def byte(b: Expr) -> Expr:
+    """a single byte holding the low 8 bits of `b`"""
+    return Extract(Itob(b), Int(7), Int(1))
+
 
 @Subroutine(TealType.bytes)
-def encode_uvarint(val: TealType.uint64, b: TealType.bytes):
-    buff = ScratchVar()
+def encode_uvarint(val: Expr, b: Expr):
+    """`b` followed by `val` as a little-endian base 128 varint"""
+    buff = ScratchVar(TealType.bytes)
+    rest = ScratchVar(TealType.uint64)
     return Seq(
         buff.store(b),
-        Concat(
-            buff.load(),
-            If(
-                val >= Int(128),
-                encode_uvarint(
-                    val >> Int(7),
-                    Extract(Itob((val & Int(255)) | Int(128)), Int(7), Int(1)),
-                ),
-                Extract(Itob(val & Int(255)), Int(7), Int(1)),
-            ),
+        rest.store(val),
+        While(rest.load() >= Int(128)).Do(
+            buff.store(Concat(buff.load(), byte(rest.load() | Int(128)))),
+            rest.store(rest.load() >> Int(7)),
+        ),
+        Concat(buff.load(), byte(rest.load())),
+    )
+
+
+@Subroutine(TealType.uint64)
+def decode_uvarint(buf: Expr, pos: ScratchVar):
+    """the varint in `buf` at `pos`, moving `pos` past it. Fails if it runs off the end
+    of `buf` or past `max_uvarint_len` bytes"""
+    val = ScratchVar(TealType.uint64)
+    shift = ScratchVar(TealType.uint64)
+    b = ScratchVar(TealType.uint64)
+    return Seq(
+        b.store(GetByte(buf, pos.load())),
+        pos.store(pos.load() + Int(1)),
+        If(b.load() < Int(128)).Then(Return(b.load())),
+        val.store(b.load() & Int(127)),
+        shift.store(Int(7)),
+        While(Int(1)).Do(
+            b.store(GetByte(buf, pos.load())),
+            pos.store(pos.load() + Int(1)),
+            val.store(val.load() | ((b.load() & Int(127)) << shift.load())),
+            If(b.load() < Int(128)).Then(Break()),
+            shift.store(shift.load() + Int(7)),
+            Assert(shift.load() < Int(7 * max_uvarint_len)),
+        ),
+        val.load(),
+    )
+
+
+# "00" to "99", so `itoa` writes two digits per iteration
+digit_pairs = Bytes("".join("{:02d}".format(i) for i in range(100)))
+
+
+@Subroutine(TealType.bytes)
+def itoa(i: Expr):
+    """the decimal digits of `i`"""
+    digits = ScratchVar(TealType.bytes)
+    rest = ScratchVar(TealType.uint64)
+    pair = lambda n: Extract(digit_pairs, n % Int(100) * Int(2), Int(2))
+    return Seq(
+        If(i < Int(10)).Then(Return(byte(Int(ord("0")) + i))),
+        digits.store(Bytes("")),
+        rest.store(i),
+        While(rest.load() >= Int(100)).Do(
+            digits.store(Concat(pair(rest.load()), digits.load())),
+            rest.store(rest.load() / Int(100)),
         ),
+        If(rest.load() >= Int(10))
+        .Then(Concat(pair(rest.load()), digits.load()))
+        .Else(Concat(byte(Int(ord("0")) + rest.load()), digits.load())),
     )